@@ -229,6 +229,7 @@ class AID(object):
     def _send_heartbeat(self, aim_ctx):
         LOG.info("Sending Heartbeat for agent %s" % self.agent_id)
         self.agent = self.manager.update(aim_ctx, self.agent)
+        LOG.debug("DN cache statistics: %s", utils.get_dn_cache_stats())
 
     def _calculate_tenants(self, aim_ctx):
         with aim_ctx.store.begin(subtransactions=True):
@@ -416,6 +416,8 @@ class AciUniverse(base.HashTreeStoredUniverse):
     from the ACI REST API.
     """
 
+    tree_type = tree_manager.CONFIG_TREE
+
     def initialize(self, conf_mgr, multiverse):
         super(AciUniverse, self).initialize(conf_mgr, multiverse)
         self._aim_converter = converter.AciToAimModelConverter()
@@ -547,6 +549,11 @@ class AciUniverse(base.HashTreeStoredUniverse):
                     LOG.error(traceback.format_exc())
                     LOG.error('Failed to reset tenant %s' % root)
 
+    def align_hash_version(self, tenant, version):
+        global serving_tenants
+        if tenant in serving_tenants:
+            serving_tenants[tenant].set_hash_version(self.tree_type, version)
+
     def push_resources(self, context, resources):
         # Organize by tenant, and push into APIC
         global serving_tenants
@@ -573,14 +580,12 @@ class AciUniverse(base.HashTreeStoredUniverse):
             if list(data.keys())[0] == 'tagInst':
                 # Retrieve tag parent
                 dn = list(data.values())[0]['attributes']['dn']
-                decomposed = apic_client.DNManager().aci_decompose_dn_guess(
-                    dn, 'tagInst')
+                decomposed = utils.aci_decompose_dn_guess(dn, 'tagInst')
                 parent_type = decomposed[1][-2][0]
                 data = {
                     parent_type: {
                         'attributes': {
-                            'dn': apic_client.DNManager().build(
-                                decomposed[1][:-1])}}}
+                            'dn': utils.build_dn(decomposed[1][:-1])}}}
             data = self._aim_converter.convert([data])
             data = data[0] if data else None
         if isinstance(data, resource.AciResourceBase):
@@ -604,10 +609,9 @@ class AciUniverse(base.HashTreeStoredUniverse):
                 # to APIC
                 dn = list(aci_object.values())[0]['attributes']['dn']
                 res_type = list(aci_object.keys())[0]
-                dn_mgr = apic_client.DNManager()
-                mo, rns = dn_mgr.aci_decompose_dn_guess(dn, res_type)
+                mo, rns = utils.aci_decompose_dn_guess(dn, res_type)
                 if len(rns) > 1:
-                    parent_dn = dn_mgr.build(rns[:-1])
+                    parent_dn = utils.build_dn(rns[:-1])
                     parent_type, xxx = rns[-2]
                     parent_key = tree_manager.AimHashTreeMaker._dn_to_key(
                         parent_type, parent_dn)
@@ -678,6 +682,8 @@ class AciUniverse(base.HashTreeStoredUniverse):
 class AciOperationalUniverse(AciUniverse):
     """ACI Universe for operational state."""
 
+    tree_type = tree_manager.OPERATIONAL_TREE
+
     @property
     def name(self):
         return "ACI_Operational_Universe"
@@ -706,6 +712,8 @@ class AciOperationalUniverse(AciUniverse):
 class AciMonitoredUniverse(AciOperationalUniverse):
     """ACI Universe for monitored state."""
 
+    tree_type = tree_manager.MONITORED_TREE
+
     @property
     def name(self):
         return "ACI_Monitored_Universe"
@@ -225,8 +225,7 @@ def qos_rs_ingress_dpp_pol(object_dict, otype, helper,
             attrs = [object_dict.get('tenant_name'),
                      object_dict.get('name')]
             try:
-                dn = apic_client.ManagedObjectClass(
-                    'qosRsIngressDppPol').dn(*attrs)
+                dn = aim_utils.mo_dn('qosRsIngressDppPol', *attrs)
             except Exception as e:
                 LOG.error('Failed to make DN for %s with %s: %s',
                           helper['resource'], attrs, e)
@@ -262,8 +261,7 @@ def qos_rs_egress_dpp_pol(object_dict, otype, helper,
             attrs = [object_dict.get('tenant_name'),
                      object_dict.get('name')]
             try:
-                dn = apic_client.ManagedObjectClass(
-                    'qosRsEgressDppPol').dn(*attrs)
+                dn = aim_utils.mo_dn('qosRsEgressDppPol', *attrs)
             except Exception as e:
                 LOG.error('Failed to make DN for %s with %s: %s',
                           helper['resource'], attrs, e)
@@ -297,8 +295,7 @@ def qos_ep_dscp_marking(object_dict, otype, helper,
             attrs = [object_dict.get('tenant_name'),
                      object_dict.get('name')]
             try:
-                dn = apic_client.ManagedObjectClass(
-                    'qosEpDscpMarking').dn(*attrs)
+                dn = aim_utils.mo_dn('qosEpDscpMarking', *attrs)
             except Exception as e:
                 LOG.error('Failed to make DN for %s with %s: %s',
                           helper['resource'], attrs, e)
@@ -335,8 +332,7 @@ def qos_rs_req(object_dict, otype, helper,
                      object_dict.get('app_profile_name'),
                      object_dict.get('name')]
             try:
-                dn = apic_client.ManagedObjectClass(
-                    'fvRsQosRequirement').dn(*attrs)
+                dn = aim_utils.mo_dn('fvRsQosRequirement', *attrs)
             except Exception as e:
                 LOG.error('Failed to make DN for %s with %s: %s',
                           helper['resource'], attrs, e)
@@ -362,7 +358,7 @@ def fv_rs_master_epg_converter(object_dict, otype, helper,
         for index, attr in enumerate(destination_identity_attributes):
             res_dict[attr] = id[index]
         if object_dict.get('tDn'):
-            master_id = apic_client.DNManager().aci_decompose_with_type(
+            master_id = aim_utils.aci_decompose_with_type(
                 object_dict['tDn'], 'fvAEPg')
             res_dict['epg_contract_masters'] = [
                 {'app_profile_name': master_id[1][1], 'name': master_id[2][1]}]
@@ -373,7 +369,7 @@ def fv_rs_master_epg_converter(object_dict, otype, helper,
                 try:
                     attr = [object_dict.get('tenant_name'),
                             p.get('app_profile_name'), p.get('name')]
-                    path = apic_client.ManagedObjectClass('fvAEPg').dn(*attr)
+                    path = aim_utils.mo_dn('fvAEPg', *attr)
                 except Exception as e:
                     LOG.error('Failed to make DN for %s with %s: %s',
                               helper['resource'], attr, e)
@@ -1166,6 +1162,10 @@ for item in reverse_resource_map[resource.L3OutInterfaceBgpPeerP]:
     if item['resource'] == 'bgpAsP':
         item['resource'] = 'bgpAsP__Peer'
 
+# The maps don't change from now on, resolve what can be resolved once
+utils.compile_conversion_plans(resource_map, to_aim=True)
+utils.compile_conversion_plans(reverse_resource_map, to_aim=False)
+
 
 class BaseConverter(object):
 
@@ -1200,19 +1200,21 @@ class AciToAimModelConverter(BaseConverter):
         result = []
         for object in aci_objects:
             try:
-                if list(object.keys())[0] not in resource_map:
+                aci_type = next(iter(object))
+                helpers = resource_map.get(aci_type)
+                if helpers is None:
                     # Ignore unmanaged object
                     continue
-                resource = object[list(object.keys())[0]]['attributes']
+                resource = object[aci_type]['attributes']
                 # Change nameAlias to allow automatic conversion
                 if 'nameAlias' in resource:
                     resource['displayName'] = resource['nameAlias']
                     del resource['nameAlias']
-                for helper in resource_map[list(object.keys())[0]]:
+                for helper in helpers:
                     # Use the custom converter, fallback to the default one
                     converted = (
                         helper.get('converter') or self._default_converter)(
-                        resource, list(object.keys())[0], helper,
+                        resource, aci_type, helper,
                         ['dn'], helper['resource'].identity_attributes,
                         to_aim=True)
                     if resource.get('status') == DELETED_STATUS:
@@ -1231,7 +1233,7 @@ class AciToAimModelConverter(BaseConverter):
                 LOG.debug(traceback.format_exc())
         squashed = self._squash(result)
         if aci_objects:
-            LOG.debug("Converted: %s into: %s" % (aci_objects, squashed))
+            LOG.debug("Converted: %s into: %s", aci_objects, squashed)
         return squashed
 
     def _squash(self, converted_list):
@@ -1246,10 +1248,12 @@ class AciToAimModelConverter(BaseConverter):
         for res in converted_list:
             # Base for squashing is the Resource with all its defaults
             klass = type(res)
-            current = res_map.setdefault(
-                (res._aci_mo_name,) + tuple(res.identity),
-                klass(**dict([(y, res.identity[x]) for x, y in
-                              enumerate(klass.identity_attributes)])))
+            identity = res.identity
+            key = (res._aci_mo_name,) + tuple(identity)
+            current = res_map.get(key)
+            if current is None:
+                current = res_map[key] = klass(
+                    **dict(zip(klass.identity_attributes, identity)))
             for k, v in res.__dict__.items():
                 if isinstance(v, list):
                     for item in v:
@@ -1319,7 +1323,7 @@ class AimToAciModelConverter(BaseConverter):
 
         squashed = self._squash(result)
         if aim_objects:
-            LOG.debug("Converted: %s into: %s" % (aim_objects, squashed))
+            LOG.debug("Converted: %s into: %s", aim_objects, squashed)
         return squashed
 
     def _squash(self, converted_list):
@@ -1331,6 +1335,6 @@ class AimToAciModelConverter(BaseConverter):
         res_map = collections.OrderedDict()
         for res in converted_list:
             current = res_map.setdefault(
-                res[list(res.keys())[0]]['attributes']['dn'], res)
+                res[next(iter(res))]['attributes']['dn'], res)
             current.update(res)
         return list(res_map.values())
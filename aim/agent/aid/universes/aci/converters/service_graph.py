@@ -15,15 +15,14 @@
 
 import copy
 
-from apicapi import apic_client
 
 from aim.agent.aid.universes.aci.converters import utils
 from aim.api import service_graph
+from aim.common import utils as aim_utils
 
 
 def _dn(mo_type_name, *dn_attrs):
-    mo = apic_client.ManagedObjectClass(mo_type_name)
-    return mo.dn(*dn_attrs)
+    return aim_utils.mo_dn(mo_type_name, *dn_attrs)
 
 
 def _aci_obj(mo_type_name, *dn_attrs, **attrs):
@@ -19,8 +19,17 @@ from oslo_log import log as logging
 
 from apicapi import apic_client
 
+from aim.common import utils as aim_utils
+
 LOG = logging.getLogger(__name__)
 IGNORE = object()
+DEFAULT_SKIP = ['preExisting', 'monitored', 'Error', 'Pending',
+                'InjectedAimId', 'sync', 'epoch']
+
+# Attribute names converted so far, by name and direction
+_CONVERTED_ATTRIBUTES = {}
+# Conversion plans of the resource map helpers, by helper id and direction
+_CONVERSION_PLANS = {}
 
 
 def boolean(resource, attribute, to_aim=True):
@@ -51,6 +60,11 @@ def convert_attribute(aim_attribute, to_aim=True):
     :param aim_attribute:
     :return:
     """
+    # The same few attribute names are converted over and over
+    try:
+        return _CONVERTED_ATTRIBUTES[(aim_attribute, to_aim)]
+    except KeyError:
+        pass
     if to_aim:
         # Camel to _ (APIC to AIM)
         result = []
@@ -58,14 +72,15 @@ def convert_attribute(aim_attribute, to_aim=True):
             if x.isupper():
                 result.append('_')
             result.append(x.lower())
-        return ''.join(result)
+        result = ''.join(result)
     else:
         # _ to Camel (AIM to APIC)
         parts = aim_attribute.split('_')
         result = parts[0]
         for part in parts[1:]:
             result += part[0].upper() + part[1:]
-        return result
+    _CONVERTED_ATTRIBUTES[(aim_attribute, to_aim)] = result
+    return result
 
 
 def mapped_attribute(value_map):
@@ -87,17 +102,16 @@ def default_attribute_converter(object_dict, attribute,
 
 def default_to_resource(converted, helper, to_aim=True):
     klass = helper['resource']
-    default_skip = ['preExisting', 'monitored', 'Error', 'Pending',
-                    'InjectedAimId', 'sync', 'epoch']
-    skip = helper.get('skip', [])
+    plan = get_conversion_plan(helper, to_aim=to_aim)
     if to_aim:
         # APIC to AIM
+        attributes = plan.attributes
         return klass(
             _set_default=False,
             **dict([(k, v) for k, v in converted.items() if k in
-                    klass.attributes() and k not in skip]))
+                    attributes]))
     else:
-        for s in default_skip + skip:
+        for s in plan.skip:
             converted.pop(s, None)
         result = {klass: {'attributes': converted}}
         return result
@@ -150,18 +164,17 @@ def default_identity_converter(object_dict, otype, helper,
     to the resource class 'identity_attributes'
     """
     if to_aim:
-        dn_mgr = apic_client.DNManager()
         aci_type = aci_mo_type or otype
-        mos_and_rns = dn_mgr.aci_decompose_with_type(object_dict['dn'],
-                                                     aci_type)
-        return dn_mgr.filter_rns(mos_and_rns)
+        mos_and_rns = aim_utils.aci_decompose_with_type(object_dict['dn'],
+                                                        aci_type)
+        return apic_client.DNManager().filter_rns(mos_and_rns)
     else:
         attr = [object_dict[x] for x in otype.identity_attributes]
         if extra_attributes:
             attr.extend(extra_attributes)
         mo_type = aci_mo_type or helper['resource']
         try:
-            return [apic_client.ManagedObjectClass(mo_type).dn(*attr)]
+            return [aim_utils.mo_dn(mo_type, *attr)]
         except Exception as e:
             LOG.error('Failed to make DN for %s with %s: %s',
                       mo_type, attr, e)
@@ -205,28 +218,90 @@ def default_converter(object_dict, otype, helper,
                        ACI/AIM (True) or AIM/ACI (False)
         :return: list containing the resulting objects
         """
+        plan = get_conversion_plan(helper, to_aim=to_aim)
         # translate identity
         res_dict = {}
-        identity = (helper.get('identity_converter') or
-                    default_identity_converter)(object_dict, otype, helper,
-                                                to_aim=to_aim)
+        identity = plan.identity_converter(object_dict, otype, helper,
+                                           to_aim=to_aim)
         for index, part in enumerate(destination_identity_attributes):
             res_dict[part] = identity[index]
-        for attribute in object_dict:
+        exceptions = plan.exceptions
+        for attribute, value in object_dict.items():
             if attribute in source_identity_attributes:
                 continue
-            others = do_attribute_conversion(object_dict, attribute,
-                                             helper.get('exceptions', {}),
-                                             to_aim=to_aim)
-            for other_k, other_v in others.items():
-                # Identity was already converted
-                if other_k not in destination_identity_attributes:
-                    res_dict[other_k] = other_v
-        result = (helper.get('to_resource') or default_to_resource)(
-            res_dict, helper, to_aim=to_aim)
+            # Same as do_attribute_conversion, with the exceptions compiled
+            if attribute in exceptions:
+                other, conv = exceptions[attribute]
+                value = conv(object_dict, attribute, to_aim=to_aim)
+            else:
+                other = convert_attribute(attribute, to_aim=to_aim)
+            if isinstance(value, dict):
+                for other_k, other_v in value.items():
+                    # Identity was already converted
+                    if other_k not in destination_identity_attributes:
+                        res_dict[other_k] = other_v
+            elif other not in destination_identity_attributes:
+                res_dict[other] = value
+        result = plan.to_resource(res_dict, helper, to_aim=to_aim)
         return [result] if result else []
 
 
+def compile_attribute_mapping(mapping_info, to_aim=True):
+    """Resolve the attribute exceptions of a helper
+
+    :param mapping_info: attribute exceptions, as in do_attribute_conversion
+    :param to_aim: Boolean indicating whether we are converting
+                   ACI/AIM (True) or AIM/ACI (False)
+    :return: dictionary of (converted name, value converter) tuples, by
+             attribute name
+    """
+    return dict(
+        (attr, (info.get('other', convert_attribute(attr, to_aim=to_aim)),
+                info.get('converter') or default_attribute_converter))
+        for attr, info in mapping_info.items())
+
+
+class ConversionPlan(object):
+    """Everything default_converter needs from a helper, resolved once"""
+
+    def __init__(self, helper, to_aim=True):
+        self.identity_converter = (helper.get('identity_converter') or
+                                   default_identity_converter)
+        self.to_resource = helper.get('to_resource') or default_to_resource
+        self.exceptions = compile_attribute_mapping(
+            helper.get('exceptions', {}), to_aim=to_aim)
+        skip = helper.get('skip', [])
+        if to_aim:
+            klass = helper['resource']
+            self.attributes = frozenset(
+                k for k in klass.attributes() if k not in skip)
+        else:
+            self.skip = DEFAULT_SKIP + skip
+
+
+def compile_conversion_plans(resource_map, to_aim=True):
+    """Compile the conversion plans of all the helpers of a resource map
+
+    :param resource_map: the resource_map or reverse_resource_map
+    :param to_aim: Boolean indicating whether the map converts
+                   ACI/AIM (True) or AIM/ACI (False)
+    """
+    for helpers in resource_map.values():
+        for helper in helpers:
+            # The helper is kept alive along with its plan, so that its id
+            # can't be reused
+            _CONVERSION_PLANS[(id(helper), to_aim)] = (
+                helper, ConversionPlan(helper, to_aim=to_aim))
+
+
+def get_conversion_plan(helper, to_aim=True):
+    cached = _CONVERSION_PLANS.get((id(helper), to_aim))
+    if cached:
+        return cached[1]
+    # Not part of a resource map
+    return ConversionPlan(helper, to_aim=to_aim)
+
+
 def child_list(aim_attr, aci_attr, aci_mo=None):
     def func(object_dict, otype, helper, source_identity_attributes,
              destination_identity_attributes, to_aim=True):
@@ -346,9 +421,8 @@ def dn_decomposer(aim_attr_list, aci_mo):
         if to_aim:
             dn = object_dict.get(attribute)
             if dn:
-                dnm = apic_client.DNManager()
-                mos_and_rns = dnm.aci_decompose_with_type(dn, aci_mo)
-                rns = dnm.filter_rns(mos_and_rns)
+                mos_and_rns = aim_utils.aci_decompose_with_type(dn, aci_mo)
+                rns = apic_client.DNManager().filter_rns(mos_and_rns)
                 return dict(zip(aim_attr_list, rns))
             else:
                 return {}
@@ -356,7 +430,7 @@ def dn_decomposer(aim_attr_list, aci_mo):
             dn_attrs = [object_dict[a] for a in aim_attr_list
                         if object_dict.get(a)]
             if len(dn_attrs) == len(aim_attr_list):
-                dn = apic_client.ManagedObjectClass(aci_mo).dn(*dn_attrs)
+                dn = aim_utils.mo_dn(aci_mo, *dn_attrs)
             else:
                 dn = ''
             return dn
@@ -380,9 +454,8 @@ def tdn_rs_converter(aim_attr_list, aci_mo):
                 res_dict[attr] = id[index]
             tdn = object_dict.get('tDn')
             if tdn:
-                dnm = apic_client.DNManager()
-                mos_and_rns = dnm.aci_decompose_with_type(tdn, aci_mo)
-                rns = dnm.filter_rns(mos_and_rns)
+                mos_and_rns = aim_utils.aci_decompose_with_type(tdn, aci_mo)
+                rns = apic_client.DNManager().filter_rns(mos_and_rns)
                 res_dict.update(dict(zip(aim_attr_list, rns)))
             to_res = helper.get('to_resource', default_to_resource)
             result.append(to_res(res_dict, helper, to_aim=True))
@@ -392,7 +465,7 @@ def tdn_rs_converter(aim_attr_list, aci_mo):
             dn_attrs = [object_dict[a] for a in aim_attr_list
                         if object_dict.get(a)]
             if len(dn_attrs) == len(aim_attr_list):
-                tdn = apic_client.ManagedObjectClass(aci_mo).dn(*dn_attrs)
+                tdn = aim_utils.mo_dn(aci_mo, *dn_attrs)
                 result.append(
                     {helper['resource']: {'attributes': {'dn': dn,
                                                          'tDn': tdn}}})
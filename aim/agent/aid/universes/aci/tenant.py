@@ -13,6 +13,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
 import copy
 from six.moves import queue as Queue
 import time
@@ -217,10 +218,10 @@ class OwnershipManager(object):
                 if list(obj.keys())[0].startswith(TAG_KEY):
                     dn = list(obj.values())[0]['attributes']['dn']
                     if dn.endswith('/tag-%s' % self.tag_key):
-                        dec = apic_client.DNManager().aci_decompose_dn_guess(
+                        dec = utils.aci_decompose_dn_guess(
                             dn, list(obj.keys())[0])
                         parent_dec = dec[1][:-1]
-                        parent_dn = apic_client.DNManager().build(parent_dec)
+                        parent_dn = utils.build_dn(parent_dec)
                         parent_type = parent_dec[-1][0]
                         to_update.append(
                             {parent_type: {'attributes': {'dn': parent_dn,
@@ -275,16 +276,13 @@ class OwnershipManager(object):
                     type) and check_parent:
                 # Check for parent ownership
                 try:
-                    decomposed = (
-                        apic_client.DNManager().aci_decompose_dn_guess(
-                            dn, type))
+                    decomposed = utils.aci_decompose_dn_guess(dn, type)
                 except apic_client.DNManager.InvalidNameFormat:
                     LOG.debug("Type %s with DN %s is not supported." %
                               (type, dn))
                     return False
                 # Check for parent ownership
-                return self.is_owned_dn(apic_client.DNManager().build(
-                    decomposed[1][:-1]))
+                return self.is_owned_dn(utils.build_dn(decomposed[1][:-1]))
             else:
                 return owned
 
@@ -315,9 +313,13 @@ class AciTenantManager(utils.AIMThread):
         self.tenant = Root(self.tenant_name, filtered_children=children_mos,
                            rn=self.tenant_name,
                            ws_subscription_to=ws_subscription_to)
-        self._state = structured_tree.StructuredHashTree()
-        self._operational_state = structured_tree.StructuredHashTree()
-        self._monitored_state = structured_tree.StructuredHashTree()
+        # Hash version of each tree type, the configured one by default. The
+        # trees follow the version of the AIM DB trees they are compared to.
+        self.hash_versions = {}
+        self._state = self._new_tree(tree_manager.CONFIG_TREE)
+        self._operational_state = self._new_tree(
+            tree_manager.OPERATIONAL_TREE)
+        self._monitored_state = self._new_tree(tree_manager.MONITORED_TREE)
         self.polling_yield = self.apic_config.get_option(
             'aci_tenant_polling_yield', 'aim')
         self.to_aim_converter = converter.AciToAimModelConverter()
@@ -341,6 +343,9 @@ class AciTenantManager(utils.AIMThread):
         self.num_loop_runs = float('inf')
         self.ownership_mgr = OwnershipManager(apic_session, apic_config,
                                               aim_system_id)
+        # Websocket events received vs. left after squashing
+        self.events_received = 0
+        self.events_processed = 0
         # Initialize tenant tree
 
     def _reset_object_backlog(self):
@@ -363,19 +368,40 @@ class AciTenantManager(utils.AIMThread):
         return self._warm
 
     def get_state_copy(self):
-        return structured_tree.StructuredHashTree.from_string(
-            str(self._state), root_key=self._state.root_key,
-            has_populated=self._state.has_populated)
+        # Snapshots share the nodes with the state, which are only copied
+        # when the event loop modifies them
+        return self._state.snapshot()
 
     def get_operational_state_copy(self):
-        return structured_tree.StructuredHashTree.from_string(
-            str(self._operational_state),
-            root_key=self._operational_state.root_key)
+        return self._get_snapshot(self._operational_state)
 
     def get_monitored_state_copy(self):
-        return structured_tree.StructuredHashTree.from_string(
-            str(self._monitored_state),
-            root_key=self._monitored_state.root_key)
+        return self._get_snapshot(self._monitored_state)
+
+    def _new_tree(self, tree_type):
+        return structured_tree.StructuredHashTree(
+            hash_version=self.hash_versions.get(tree_type))
+
+    def set_hash_version(self, tree_type, version):
+        """Hash the given tree type with a different version
+
+        The trees are rebuilt from scratch on the next full resync, which is
+        scheduled right away when the version changes.
+        :param tree_type: one of tree_manager CONFIG_TREE, OPERATIONAL_TREE
+        and MONITORED_TREE
+        :param version: hash version
+        """
+        if self._new_tree(tree_type).hash_version == version:
+            return
+        LOG.info("Switching %s of root %s to hash version %s",
+                 tree_type.__name__, self.tenant_name, version)
+        self.hash_versions[tree_type] = version
+        self.scheduled_reset = 0
+
+    def _get_snapshot(self, tree):
+        snapshot = tree.snapshot()
+        snapshot.has_populated = False
+        return snapshot
 
     def run(self):
         LOG.debug("Starting main loop for tenant %s" % self.tenant_name)
@@ -464,11 +490,12 @@ class AciTenantManager(utils.AIMThread):
                             events.append({'vmmProvP': {
                                 'attributes': {'dn': self.tenant.dn}}})
                         # This is a full resync, trees need to be reset
-                        self._state = structured_tree.StructuredHashTree()
-                        self._operational_state = (
-                            structured_tree.StructuredHashTree())
-                        self._monitored_state = (
-                            structured_tree.StructuredHashTree())
+                        self._state = self._new_tree(
+                            tree_manager.CONFIG_TREE)
+                        self._operational_state = self._new_tree(
+                            tree_manager.OPERATIONAL_TREE)
+                        self._monitored_state = self._new_tree(
+                            tree_manager.MONITORED_TREE)
                         self.tag_set = set()
                         break
                 # REVISIT(ivar): there's already a debug log in acitoolkit
@@ -478,6 +505,14 @@ class AciTenantManager(utils.AIMThread):
                 #           (self.tenant_name, events))
                 # Make events list flat
                 self.flat_events(events)
+                # Keep only the latest state of each object
+                received = len(events)
+                events = self.squash_events(events)
+                self.events_received += received
+                self.events_processed += len(events)
+                if received != len(events):
+                    LOG.debug("Squashed %s events into %s for root %s",
+                              received, len(events), self.tenant_name)
                 # Pull incomplete objects
                 events = self._fill_events(events)
                 # Manage Tags
@@ -538,7 +573,7 @@ class AciTenantManager(utils.AIMThread):
         if not to_push:
             return
         dn_mgr = apic_client.DNManager()
-        decompose = dn_mgr.aci_decompose_dn_guess
+        decompose = utils.aci_decompose_dn_guess
         with self.aci_session.transaction(
                 top_send=True) as trs:
             for obj in to_push:
@@ -553,7 +588,7 @@ class AciTenantManager(utils.AIMThread):
 
     def _push_aim_resources(self):
         dn_mgr = apic_client.DNManager()
-        decompose = dn_mgr.aci_decompose_dn_guess
+        decompose = utils.aci_decompose_dn_guess
         with utils.get_rlock(lcon.ACI_BACKLOG_LOCK_NAME_PREFIX +
                              self.tenant_name):
             while not self.object_backlog.empty():
@@ -759,11 +794,9 @@ class AciTenantManager(utils.AIMThread):
             if self.is_child_object(res_type) and res_type != FAULT_KEY:
                 # We need to make sure to retrieve the parent object as well
                 try:
-                    decomposed = (
-                        apic_client.DNManager().aci_decompose_dn_guess(
-                            raw_dn, res_type))
-                    parent_dn = apic_client.DNManager().build(
-                        decomposed[1][:-1])
+                    decomposed = utils.aci_decompose_dn_guess(raw_dn,
+                                                              res_type)
+                    parent_dn = utils.build_dn(decomposed[1][:-1])
                     if parent_dn not in result:
                         events.append(
                             {decomposed[1][-2][0]:
@@ -777,8 +810,7 @@ class AciTenantManager(utils.AIMThread):
             if res_type == FAULT_KEY:
                 # Make sure we support the parent object
                 try:
-                    apic_client.DNManager().aci_decompose_dn_guess(raw_dn,
-                                                                   res_type)
+                    utils.aci_decompose_dn_guess(raw_dn, res_type)
                     utils.retrieve_fault_parent(raw_dn, converter.resource_map)
                 except (apic_client.DNManager.InvalidNameFormat, KeyError):
                     LOG.debug("Fault with DN %s is not supported." % raw_dn)
@@ -853,13 +885,56 @@ class AciTenantManager(utils.AIMThread):
                     valid_children.append(child)
                 events.extend(valid_children)
 
+    @staticmethod
+    def squash_events(events):
+        """Squash the events of a flat list by DN
+
+        Only the latest state of each object is kept:
+        - A "modified" event is merged into the previous event for that DN,
+          keeping its status unless the object was deleted in between;
+        - A "deleted" event following a "created" one drops the object
+          altogether, unless the object existed before the batch;
+        - Any other event replaces the previous one.
+        :param events: flat list of ACI events
+        :return: list of squashed events, in order of first appearance
+        """
+        result = collections.OrderedDict()
+        # DNs whose first event in the batch wasn't a creation
+        existing = set()
+        for event in events:
+            attrs = list(event.values())[0]['attributes']
+            dn = attrs.get('dn')
+            if dn is None:
+                result[id(event)] = event
+                continue
+            status = (attrs.get(STATUS_FIELD) or '').lower()
+            prev = result.get(dn)
+            if prev is None:
+                if status != converter.CREATED_STATUS:
+                    existing.add(dn)
+                result[dn] = event
+                continue
+            prev_attrs = list(prev.values())[0]['attributes']
+            prev_status = (prev_attrs.get(STATUS_FIELD) or '').lower()
+            if (status == converter.MODIFIED_STATUS and
+                    prev_status != converter.DELETED_STATUS):
+                new_attrs = dict(attrs)
+                new_attrs.pop(STATUS_FIELD)
+                prev_attrs.update(new_attrs)
+            elif (status == converter.DELETED_STATUS and
+                    prev_status == converter.CREATED_STATUS and
+                    dn not in existing):
+                # The object never existed outside of this batch
+                del result[dn]
+            else:
+                result[dn] = event
+        return list(result.values())
+
     def _check_parent_type(self, aci_object, parent_types):
         dn = list(aci_object.values())[0]['attributes']['dn']
         type = list(aci_object.keys())[0]
         try:
-            decomposed = (
-                apic_client.DNManager().aci_decompose_dn_guess(
-                    dn, type))
+            decomposed = utils.aci_decompose_dn_guess(dn, type)
         except apic_client.DNManager.InvalidNameFormat:
             LOG.debug("Type %s with DN %s is not supported." %
                       (type, dn))
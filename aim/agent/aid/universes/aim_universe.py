@@ -23,6 +23,7 @@ from aim.agent.aid.universes import base_universe as base
 from aim.api import resource as aim_resource
 from aim.api import status as aim_status
 from aim.common import utils
+from aim.db import api
 from aim.db import hashtree_db_listener
 from aim import exceptions as aim_exc
 from aim import tree_manager
@@ -44,6 +45,8 @@ class AimDbUniverse(base.HashTreeStoredUniverse):
         self._converter = converter.AciToAimModelConverter()
         self._converter_aim_to_aci = converter.AimToAciModelConverter()
         self._served_tenants = set()
+        # Trees of the served tenants, kept up to date incrementally
+        self._tree_cache = {}
         self._monitored_state_update_failures = 0
         self._max_monitored_state_update_failures = 5
         self._recovery_interval = conf_mgr.get_option(
@@ -81,6 +84,8 @@ class AimDbUniverse(base.HashTreeStoredUniverse):
         for tenant in self._served_tenants:
             new_state.setdefault(tenant, self._state.get(tenant))
         self._state = new_state
+        for tenant in set(self._tree_cache) - self._served_tenants:
+            del self._tree_cache[tenant]
 
     def observe(self, context):
         # TODO(ivar): move this to a separate thread and add scheduled reset
@@ -96,7 +101,10 @@ class AimDbUniverse(base.HashTreeStoredUniverse):
                 self.manager.recover_root_errors(context, root)
             htdbl.cleanup_zombie_status_objects(context, served_tenants)
             self.schedule_next_recovery()
-        htdbl.catch_up_with_action_log(context.store, served_tenants)
+        htdbl.catch_up_with_action_log(
+            context.store, served_tenants,
+            concurrency=self.reconcile_concurrency,
+            store_factory=api.get_store)
         # REVISIT(ivar): what if a root is marked as needs_reset? we could
         # avoid syncing it altogether
         self._state.update(self.get_optimized_state(context, self.state))
@@ -121,9 +129,14 @@ class AimDbUniverse(base.HashTreeStoredUniverse):
             self.tree_manager.delete_by_root_rn(context, key, if_empty=True)
 
     def _get_state(self, context, tree=tree_manager.CONFIG_TREE):
-        return self.tree_manager.find_changed(
-            context, dict([(x, None) for x in self._served_tenants]),
-            tree=tree)
+        cache = self._tree_cache
+        # Only the trees that changed since the last call are retrieved
+        self.tree_manager.find_changed(
+            context, dict([(x, cache[x].root_full_hash if x in cache else None)
+                           for x in self._served_tenants]),
+            tree=tree, cache=cache)
+        return dict([(x, cache[x].tree) for x in self._served_tenants
+                     if x in cache])
 
     @property
     def state(self):
@@ -16,10 +16,10 @@
 
 import abc
 import six
+import threading
 import time
 import traceback
 
-from apicapi import apic_client
 from oslo_log import log as logging
 
 from aim.agent.aid.universes.aci import converter
@@ -27,6 +27,8 @@ from aim.agent.aid.universes import errors
 from aim import aim_manager
 from aim.common.hashtree import structured_tree
 from aim.common import utils
+from aim import context as aim_ctx
+from aim.db import api
 from aim import exceptions
 from aim import tree_manager
 
@@ -292,6 +294,8 @@ class HashTreeStoredUniverse(AimUniverse):
             errors.SYSTEM_CRITICAL: self._fail_agent,
         }
         self._sync_log = {}
+        self.reconcile_concurrency = self.conf_manager.get_option(
+            'reconcile_concurrency', 'aim')
         return self
 
     def _dissect_key(self, key):
@@ -313,7 +317,7 @@ class HashTreeStoredUniverse(AimUniverse):
             if mo_type == 'faultInst':
                 fault_code = key_parts[-1][1]
                 key_parts = key_parts[:-1]
-            dn = apic_client.DNManager().build(key_parts)
+            dn = utils.build_dn(key_parts)
             if fault_code:
                 dn += '/fault-%s' % fault_code
                 aci_object[mo_type]['attributes']['code'] = fault_code
@@ -347,92 +351,154 @@ class HashTreeStoredUniverse(AimUniverse):
 
     def _reconcile(self, context, other_universe):
         # "self" is always the current state, "other" the desired
-        my_state = self.state
-        other_state = other_universe.state
+        tenants = sorted(set(self.state.keys()) &
+                         set(other_universe.state.keys()))
+        if self.reconcile_concurrency > 1 and len(tenants) > 1:
+            # DB sessions can't be shared among threads, each worker gets
+            # its own
+            local = threading.local()
+
+            def reconcile_tenant(tenant):
+                try:
+                    if getattr(local, 'context', None) is None:
+                        local.context = aim_ctx.AimContext(
+                            store=api.get_store())
+                except Exception as e:
+                    LOG.error("An unexpected error has occurred while "
+                              "reconciling tenant %s: %s" % (tenant, str(e)))
+                    LOG.error(traceback.format_exc())
+                    return True, False
+                return self._reconcile_tenant(local.context, other_universe,
+                                              tenant)
+
+            results = utils.run_in_parallel(
+                reconcile_tenant, tenants, self.reconcile_concurrency)
+        else:
+            results = [self._reconcile_tenant(context, other_universe, x)
+                       for x in tenants]
         diff = False
-        for tenant in set(my_state.keys()) & set(other_state.keys()):
-            # TODO(ivar): parallelize the procedure on Tenant's basis
-            try:
-                differences = {CREATE: [], DELETE: []}
-                other_tenant_state = other_state[tenant]
-                my_tenant_state = my_state.get(
-                    tenant, structured_tree.StructuredHashTree())
-                # Retrieve difference to transform self into other
-                difference = other_tenant_state.diff(my_tenant_state)
-                differences[CREATE].extend(difference['add'])
-                differences[DELETE].extend(difference['remove'])
-
-                if differences.get(CREATE) or differences.get(DELETE):
-                    LOG.info("Universe differences between %s and %s: %s",
-                             self.name, other_universe.name, differences)
-                    diff = True
-                result = {
-                    CREATE: other_universe.get_resources(differences[CREATE]),
-                    DELETE: self.get_resources_for_delete(differences[DELETE])
-                }
-
-                reset, fail, skip = self._track_universe_actions(result,
-                                                                 tenant)
-                if (self._sync_log.get(tenant, {}).get('create') or
-                        self._sync_log.get(tenant, {}).get('delete')):
-                    LOG.debug('Sync log cache for %s (%s): %s' %
-                              (self.name, tenant, self._sync_log))
-
-                if reset:
+        # Aggregate in the same order regardless of which tenant finished
+        # first
+        for tenant, (tenant_diff, reset) in zip(tenants, results):
+            diff = diff or tenant_diff
+            if reset:
+                try:
                     self.reset(context, [tenant])
                     other_universe.reset(context, [tenant])
-                    # Don't synchronize resetting roots
-                    continue
+                except Exception as e:
+                    LOG.error("An unexpected error has occurred while "
+                              "resetting tenant %s: %s" % (tenant, str(e)))
+                    LOG.error(traceback.format_exc())
+                    diff = True
+        return diff
 
-                for action, res in fail:
-                    if action == CREATE:
-                        self.creation_failed(
-                            context, res,
-                            reason='Divergence detected on this object.',
-                            error=errors.OPERATION_CRITICAL)
-                    if action == DELETE:
-                        self.deletion_failed(
-                            context, res,
-                            reason='Divergence detected on this object.',
-                            error=errors.OPERATION_CRITICAL)
-                    skip.append((action, res))
+    def _reconcile_tenant(self, context, other_universe, tenant):
+        """Reconcile a single tenant.
 
-                skipset = set()
-                if skip:
-                    differences[CREATE] = set(differences[CREATE])
-                    differences[DELETE] = set(differences[DELETE])
-
-                    for action, res in skip:
-                        for key in (tree_manager.AimHashTreeMaker.
-                                    aim_res_to_nodes(res)):
-                            differences[action].discard(key)
-                            skipset.add(key)
-                    differences[CREATE] = list(differences[CREATE])
-                    differences[DELETE] = list(differences[DELETE])
-                    # Need to rebuild results
-                    result = {
-                        CREATE: other_universe.get_resources(
-                            differences[CREATE]),
-                        DELETE: self.get_resources_for_delete(
-                            differences[DELETE])
-                    }
-                self.update_status_objects(context, my_tenant_state,
-                                           differences, skipset)
-                other_universe.update_status_objects(
-                    context, other_tenant_state, differences, skipset)
-                # Reconciliation method for pushing changes
-                self.push_resources(context, result)
-            except Exception as e:
-                LOG.error("An unexpected error has occurred while "
-                          "reconciling tenant %s: %s" % (tenant, str(e)))
-                LOG.error(traceback.format_exc())
-                # Guess we can't consider the multiverse synced if this happens
+        :return: tuple (diff, reset), whether differences were found and
+        whether the tenant needs to be reset
+        """
+        diff = False
+        try:
+            differences = {CREATE: [], DELETE: []}
+            other_tenant_state = other_universe.state[tenant]
+            my_tenant_state = self.state.get(
+                tenant, structured_tree.StructuredHashTree())
+            if (other_tenant_state.root and my_tenant_state.root and
+                    other_tenant_state.hash_version !=
+                    my_tenant_state.hash_version):
+                # Hashes can't be compared, wait for the universe that
+                # builds its trees from live data to follow the other one
+                LOG.info("Hash version of root %s differs between %s (%s) "
+                         "and %s (%s)", tenant, self.name,
+                         my_tenant_state.hash_version, other_universe.name,
+                         other_tenant_state.hash_version)
+                self.align_hash_version(tenant,
+                                        other_tenant_state.hash_version)
+                other_universe.align_hash_version(
+                    tenant, my_tenant_state.hash_version)
+                return True, False
+            # Retrieve difference to transform self into other
+            difference = other_tenant_state.diff(my_tenant_state)
+            differences[CREATE].extend(difference['add'])
+            differences[DELETE].extend(difference['remove'])
+
+            if differences.get(CREATE) or differences.get(DELETE):
+                LOG.info("Universe differences between %s and %s: %s",
+                         self.name, other_universe.name, differences)
                 diff = True
-        return diff
+            result = {
+                CREATE: other_universe.get_resources(differences[CREATE]),
+                DELETE: self.get_resources_for_delete(differences[DELETE])
+            }
+
+            reset, fail, skip = self._track_universe_actions(result, tenant)
+            sync_log = self._sync_log.get(tenant, {})
+            if sync_log.get('create') or sync_log.get('delete'):
+                LOG.debug('Sync log cache for %s (%s): %s' %
+                          (self.name, tenant, sync_log))
+
+            if reset:
+                # Don't synchronize resetting roots
+                return diff, True
+
+            for action, res in fail:
+                if action == CREATE:
+                    self.creation_failed(
+                        context, res,
+                        reason='Divergence detected on this object.',
+                        error=errors.OPERATION_CRITICAL)
+                if action == DELETE:
+                    self.deletion_failed(
+                        context, res,
+                        reason='Divergence detected on this object.',
+                        error=errors.OPERATION_CRITICAL)
+                skip.append((action, res))
+
+            skipset = set()
+            if skip:
+                differences[CREATE] = set(differences[CREATE])
+                differences[DELETE] = set(differences[DELETE])
+
+                for action, res in skip:
+                    for key in (tree_manager.AimHashTreeMaker.
+                                aim_res_to_nodes(res)):
+                        differences[action].discard(key)
+                        skipset.add(key)
+                differences[CREATE] = list(differences[CREATE])
+                differences[DELETE] = list(differences[DELETE])
+                # Need to rebuild results
+                result = {
+                    CREATE: other_universe.get_resources(
+                        differences[CREATE]),
+                    DELETE: self.get_resources_for_delete(
+                        differences[DELETE])
+                }
+            self.update_status_objects(context, my_tenant_state,
+                                       differences, skipset)
+            other_universe.update_status_objects(
+                context, other_tenant_state, differences, skipset)
+            # Reconciliation method for pushing changes
+            self.push_resources(context, result)
+        except Exception as e:
+            LOG.error("An unexpected error has occurred while "
+                      "reconciling tenant %s: %s" % (tenant, str(e)))
+            LOG.error(traceback.format_exc())
+            # Guess we can't consider the multiverse synced if this happens
+            diff = True
+        return diff, False
 
     def reset(self, context, tenants):
         pass
 
+    def align_hash_version(self, tenant, version):
+        """Hash the trees of a tenant with the given version
+
+        Only universes that can rebuild their trees from scratch do so, the
+        others keep the version their trees were persisted with.
+        """
+        pass
+
     def get_resource_for_delete(self, resource_key):
         return self.get_resources_for_delete([resource_key])
 
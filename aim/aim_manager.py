@@ -27,6 +27,9 @@ from aim import exceptions as exc
 
 
 LOG = logging.getLogger(__name__)
+# Resources retrieved per query by the bulk methods, keeps the number of
+# bound parameters under the backends' limits
+DB_QUERY_CHUNK_SIZE = 200
 
 
 class AimManager(object):
@@ -320,13 +323,15 @@ class AimManager(object):
 
         Parameter 'resource_class' indicates the type of resource to
         look for. Matching criteria are specified as keyword-arguments.
-        Only equality matches are supported.
+        Besides equality matches, 'in_', 'notin_' and 'gt_' accept
+        dictionaries of attribute to values, 'order_by' and 'limit' can be
+        used to page through the results.
         Returns a list of resources that match.
         """
         self._validate_resource_class(resource_class)
         attr_val = {k: v for k, v in kwargs.items()
                     if k in resource_class.attributes() +
-                    ['in_', 'notin_', 'order_by']}
+                    ['in_', 'notin_', 'order_by', 'gt_', 'limit']}
         result = []
         for obj in self._query_db(context.store, resource_class,
                                   for_update=for_update, **attr_val):
@@ -335,6 +340,29 @@ class AimManager(object):
                                             include_aim_id=include_aim_id))
         return result
 
+    def get_by_ids(self, context, resource_class, aim_ids):
+        """Get many AIM resources of the same type from their aim IDs.
+
+        Returns a dictionary of the resources found keyed by aim ID.
+        """
+        self._validate_resource_class(resource_class)
+        aim_ids = list(set(aim_ids))
+        result = {}
+        if not context.store.supports_sql:
+            # IDs can only be looked up one at a time
+            for aim_id in aim_ids:
+                res = self.get_by_id(context, resource_class, aim_id)
+                if res:
+                    result[aim_id] = res
+            return result
+        for i in range(0, len(aim_ids), DB_QUERY_CHUNK_SIZE):
+            for obj in self._query_db(
+                    context.store, resource_class,
+                    in_={'aim_id': aim_ids[i:i + DB_QUERY_CHUNK_SIZE]}):
+                result[obj.aim_id] = context.store.make_resource(
+                    resource_class, obj)
+        return result
+
     def count(self, context, resource_class, **kwargs):
         self._validate_resource_class(resource_class)
         attr_val = {k: v for k, v in kwargs.items()
@@ -342,6 +370,38 @@ class AimManager(object):
                     ['in_', 'notin_', 'order_by']}
         return self._count_db(context.store, resource_class, **attr_val)
 
+    def count_by(self, context, resource_class, group_by, **kwargs):
+        """Count AIM resources that match criteria, grouped by attributes.
+
+        Parameter 'group_by' is the list of attributes to group by.
+        Returns a dictionary keyed by the tuples of grouped attribute
+        values, with the number of matching resources as values.
+        """
+        self._validate_resource_class(resource_class)
+        attr_val = {k: v for k, v in kwargs.items()
+                    if k in resource_class.attributes() +
+                    ['in_', 'notin_']}
+        db_cls = context.store.resource_to_db_type(resource_class)
+        return (context.store.count_by(db_cls, resource_class, group_by,
+                                       **attr_val) if db_cls else None)
+
+    def create_all(self, context, resources):
+        """Persist many new AIM resources to the database at once.
+
+        Unlike create, existing objects are never overwritten and their
+        sync status is left untouched, which makes it only suitable for
+        append-only resources such as action logs.
+        """
+        by_class = {}
+        for resource in resources:
+            self._validate_resource_class(resource)
+            by_class.setdefault(type(resource), []).append(resource)
+        with context.store.begin(subtransactions=True):
+            for resource_class, objs in by_class.items():
+                db_cls = context.store.resource_to_db_type(resource_class)
+                if db_cls:
+                    context.store.add_all(db_cls, resource_class, objs)
+
     def get_status(self, context, resource, for_update=False,
                    create_if_absent=True):
         """Get status of an AIM resource, if any.
@@ -380,6 +440,79 @@ class AimManager(object):
         with context.store.begin(subtransactions=True):
             return context.store.query_statuses(resources)
 
+    def get_statuses_with_faults(self, context, resources):
+        """Get the status of many AIM resources, faults included.
+
+        Same as calling get_status (without creating missing statuses) for
+        each resource, but aim IDs, statuses and faults are each retrieved
+        with set based queries.
+        Returns a dictionary keyed by (resource class, identity tuple) of
+        the resources that have a status.
+        """
+        status_keys = {}
+        to_resolve = {}
+        for resource in resources:
+            if not isinstance(resource, api_res.AciResourceBase):
+                continue
+            key = (type(resource), tuple(resource.identity))
+            inj_id = getattr(resource, '_injected_aim_id',
+                             getattr(resource, '_aim_id', None))
+            if inj_id:
+                status_keys[(type(resource).__name__, inj_id)] = (
+                    key, resource.root)
+            else:
+                to_resolve.setdefault(type(resource), {})[key] = resource
+        result = {}
+        with context.store.begin(subtransactions=True):
+            # Resolve the missing aim IDs, one query per type
+            for klass, by_key in to_resolve.items():
+                objs = list(by_key.values())
+                for i in range(0, len(objs), DB_QUERY_CHUNK_SIZE):
+                    chunk = objs[i:i + DB_QUERY_CHUNK_SIZE]
+                    in_ = dict(
+                        (attr, list(set(getattr(x, attr) for x in chunk)))
+                        for attr in klass.identity_attributes)
+                    for db_res in self.find(context, klass,
+                                            include_aim_id=True, in_=in_):
+                        key = (klass, tuple(db_res.identity))
+                        aim_id = getattr(db_res, '_aim_id', None)
+                        if key in by_key and aim_id is not None:
+                            status_keys[(klass.__name__, aim_id)] = (
+                                key, db_res.root)
+            # Roots with many resources are cheaper to query as a whole
+            ids_by_root = {}
+            for (_, res_id), (_, root) in status_keys.items():
+                ids_by_root.setdefault(root, set()).add(res_id)
+            queries = []
+            ids = set()
+            for root, root_ids in ids_by_root.items():
+                if len(root_ids) > DB_QUERY_CHUNK_SIZE:
+                    queries.append({'resource_root': root})
+                else:
+                    ids |= root_ids
+            ids = list(ids)
+            for i in range(0, len(ids), DB_QUERY_CHUNK_SIZE):
+                queries.append(
+                    {'in_': {'resource_id': ids[i:i + DB_QUERY_CHUNK_SIZE]}})
+            for filters in queries:
+                for status in self.find(context, api_status.AciStatus,
+                                        **filters):
+                    key, root = status_keys.get(
+                        (status.resource_type, status.resource_id),
+                        (None, None))
+                    if key and root == status.resource_root:
+                        status.faults = []
+                        result[key] = status
+            by_status_id = dict((x.id, x) for x in result.values())
+            status_ids = list(by_status_id)
+            for i in range(0, len(status_ids), DB_QUERY_CHUNK_SIZE):
+                for fault in self.find(
+                        context, api_status.AciFault,
+                        in_={'status_id':
+                             status_ids[i:i + DB_QUERY_CHUNK_SIZE]}):
+                    by_status_id[fault.status_id].faults.append(fault)
+        return result
+
     @utils.log
     def update_status(self, context, resource, status):
         """Update the status of an AIM resource.
@@ -429,26 +562,30 @@ class AimManager(object):
         with context.store.begin(subtransactions=True):
             # If resource is already in pending or synced state stop
             # propagation
-            if self._set_resource_sync(
+            if not self._set_resource_sync(
                     context, resource, api_status.AciStatus.SYNC_PENDING,
                     exclude=[api_status.AciStatus.SYNCED,
                              api_status.AciStatus.SYNC_PENDING,
                              api_status.AciStatus.SYNC_NA]
                     if not top else [api_status.AciStatus.SYNC_PENDING]):
-                # Change parent first
-                parent_klass = resource._tree_parent
-                if parent_klass:
-                    identity = {v: resource.identity[i]
-                                for i, v in enumerate(
-                        parent_klass.identity_attributes)}
-                    self.set_resource_sync_pending(context,
-                                                   parent_klass(**identity),
-                                                   top=False)
-                if cascade:
-                    for child_res in self.get_subtree(context, resource):
-                        self.set_resource_sync_pending(context, child_res,
-                                                       top=False,
-                                                       cascade=False)
+                return
+            # Change parents in error first, each of them takes its
+            # subtree along, which contains the resource's.
+            highest = resource
+            parent = self._get_tree_parent(resource)
+            while parent and self._set_resource_sync(
+                    context, parent, api_status.AciStatus.SYNC_PENDING,
+                    exclude=[api_status.AciStatus.SYNCED,
+                             api_status.AciStatus.SYNC_PENDING,
+                             api_status.AciStatus.SYNC_NA]):
+                highest = parent
+                parent = self._get_tree_parent(parent)
+            if cascade or highest is not resource:
+                self._set_subtree_sync(
+                    context, highest, api_status.AciStatus.SYNC_PENDING,
+                    exclude=[api_status.AciStatus.SYNCED,
+                             api_status.AciStatus.SYNC_PENDING,
+                             api_status.AciStatus.SYNC_NA])
 
     def set_resource_sync_error(self, context, resource, message='', top=True):
         with context.store.begin(subtransactions=True):
@@ -458,11 +595,64 @@ class AimManager(object):
                     message=message,
                     exclude=[api_status.AciStatus.SYNC_FAILED]) and top:
                 # Set sync_error for the whole subtree
-                for child_res in self.get_subtree(context, resource):
-                    self.set_resource_sync_error(
-                        context, child_res,
-                        message="Parent resource %s is "
-                                "in error state" % str(resource), top=False)
+                self._set_subtree_sync(
+                    context, resource, api_status.AciStatus.SYNC_FAILED,
+                    message="Parent resource %s is "
+                            "in error state" % str(resource),
+                    exclude=[api_status.AciStatus.SYNC_FAILED],
+                    create_if_absent=True)
+
+    def _get_tree_parent(self, resource):
+        parent_klass = resource._tree_parent
+        if parent_klass:
+            identity = {v: resource.identity[i]
+                        for i, v in enumerate(
+                parent_klass.identity_attributes)}
+            return parent_klass(**identity)
+
+    def _set_subtree_sync(self, context, resource, sync_status, message='',
+                          exclude=None, create_if_absent=False):
+        # Same as calling _set_resource_sync on each resource of the
+        # subtree, but statuses are read and updated in bulk.
+        exclude = exclude or []
+        by_id = {}
+        for child_res in self._get_subtree(context, type(resource),
+                                           *resource.identity,
+                                           include_aim_id=True):
+            aim_id = child_res.__dict__.pop('_aim_id', None)
+            if aim_id is not None:
+                by_id[(type(child_res).__name__, aim_id)] = child_res
+        ids = list(set(x[1] for x in by_id))
+        to_update = []
+        for i in range(0, len(ids), DB_QUERY_CHUNK_SIZE):
+            for status in self.find(
+                    context, api_status.AciStatus,
+                    resource_root=resource.root,
+                    in_={'resource_id': ids[i:i + DB_QUERY_CHUNK_SIZE]}):
+                child_res = by_id.pop(
+                    (status.resource_type, status.resource_id), None)
+                if child_res and status.sync_status not in exclude:
+                    to_update.append(status)
+        if context.store.supports_sql:
+            status_ids = [x.id for x in to_update]
+            for i in range(0, len(status_ids), DB_QUERY_CHUNK_SIZE):
+                context.store.update_all(
+                    api_status.AciStatus,
+                    filters={'in_': {
+                        'id': status_ids[i:i + DB_QUERY_CHUNK_SIZE]}},
+                    sync_status=sync_status, sync_message=message)
+        else:
+            for status in to_update:
+                self.update(context, status, sync_status=sync_status,
+                            sync_message=message, force_update=True)
+        if create_if_absent:
+            # Whatever is left has no status yet
+            for (res_type, res_id), child_res in by_id.items():
+                self.update_status(context, child_res, api_status.AciStatus(
+                    resource_type=res_type, resource_id=res_id,
+                    resource_root=child_res.root,
+                    resource_dn=child_res.dn, sync_status=sync_status,
+                    sync_message=message))
 
     @utils.log
     def set_fault(self, context, resource, fault):
@@ -527,6 +717,7 @@ class AimManager(object):
         return self._get_subtree(context, type(resource), *resource.identity)
 
     def _get_subtree(self, context, klass, *identity, **kwargs):
+        include_aim_id = kwargs.pop('include_aim_id', False)
         subtree_resources = []
 
         def get_subtree_klasses(klass):
@@ -535,7 +726,9 @@ class AimManager(object):
                       for i, v in enumerate(identity)}
                 # Extra search attributes
                 id.update(kwargs)
-                subtree_resources.extend(self.find(context, child_klass, **id))
+                subtree_resources.extend(
+                    self.find(context, child_klass,
+                              include_aim_id=include_aim_id, **id))
                 get_subtree_klasses(child_klass)
         get_subtree_klasses(klass)
         return subtree_resources
@@ -19,6 +19,7 @@ from oslo_log import log as logging
 import six
 from sqlalchemy import and_
 from sqlalchemy import event as sa_event
+from sqlalchemy import inspect as sa_inspect
 from sqlalchemy import or_
 from sqlalchemy.sql.expression import func
 
@@ -55,6 +56,9 @@ class AimStore(object):
     _features = []
     _update_listeners = {}
     _postcommit_listeners = {}
+    # Resource classes each listener is interested in, None for all of them
+    _update_listener_classes = {}
+    _postcommit_listener_classes = {}
 
     def __init__(self):
         pass
@@ -92,6 +96,11 @@ class AimStore(object):
         # Save (create/update) object to backend
         pass
 
+    def add_all(self, db_obj_type, resource_klass, resources):
+        # Save many new objects of the same type to backend
+        for resource in resources:
+            self.add(self.make_db_obj(resource))
+
     def update_all(self, resource_klass, filters=None, **kwargs):
         pass
 
@@ -100,8 +109,11 @@ class AimStore(object):
         pass
 
     def query(self, db_obj_type, resource_klass, in_=None, notin_=None,
-              order_by=None, lock_update=False, **filters):
-        # Return list of objects that match specified criteria
+              order_by=None, lock_update=False, gt_=None, limit=None,
+              **filters):
+        # Return list of objects that match specified criteria. Attributes
+        # in gt_ must be strictly greater than the given values, and at
+        # most limit objects are returned
         pass
 
     def count(self, db_obj_type, resource_klass, in_=None, notin_=None,
@@ -109,6 +121,18 @@ class AimStore(object):
         # Return count of objects that match specified criteria
         pass
 
+    def count_by(self, db_obj_type, resource_klass, group_by, in_=None,
+                 notin_=None, **filters):
+        # Return count of objects that match specified criteria, keyed by
+        # the tuple of values of the group_by attributes
+        counts = {}
+        for db_obj in self.query(db_obj_type, resource_klass, in_=in_,
+                                 notin_=notin_, **filters) or []:
+            attr_val = self.to_attr(resource_klass, db_obj)
+            key = tuple(attr_val.get(x) for x in group_by)
+            counts[key] = counts.get(key, 0) + 1
+        return counts
+
     def delete_all(self, db_obj_type, resource_klass, in_=None, notin_=None,
                    **filters):
         # Delete all objects that match specified criteria
@@ -126,8 +150,9 @@ class AimStore(object):
         pass
 
     def make_resource(self, cls, db_obj, include_aim_id=False):
+        attributes = set(cls.attributes())
         attr_val = {k: v for k, v in self.to_attr(cls, db_obj).items()
-                    if k in cls.attributes()}
+                    if k in attributes}
         res = cls(**attr_val)
         if include_aim_id and hasattr(db_obj, 'aim_id'):
             res._aim_id = db_obj.aim_id
@@ -136,7 +161,8 @@ class AimStore(object):
     def query_statuses(self, resources):
         raise NotImplementedError('query_statuses not implemented')
 
-    def register_before_session_flush_callback(self, name, func):
+    def register_before_session_flush_callback(self, name, func,
+                                               resource_classes=None):
         """Register callback for update to AIM objects.
 
         Parameter 'func' should be a function that accepts 4 parameters.
@@ -145,6 +171,9 @@ class AimStore(object):
         that were added, updated and deleted respectively.
         If the store supports transaction, the callback will be invoked
         before the transaction that updated the AIM object commits.
+        Parameter 'resource_classes' is an optional tuple of the resource
+        classes the callback is interested in, resources of other classes
+        may be left out of the lists.
 
         Example:
 
@@ -158,18 +187,35 @@ class AimStore(object):
         """
         if name not in self._update_listeners:
             self._update_listeners[name] = func
+            self._update_listener_classes[name] = resource_classes
 
     def unregister_before_session_flush_callback(self, name):
         """Remove callback for update to AIM objects."""
         self._update_listeners.pop(name, None)
+        self._update_listener_classes.pop(name, None)
 
-    def register_after_transaction_ends_callback(self, name, func):
+    def register_after_transaction_ends_callback(self, name, func,
+                                                 resource_classes=None):
         if name not in self._postcommit_listeners:
             self._postcommit_listeners[name] = func
+            self._postcommit_listener_classes[name] = resource_classes
 
     def unregister_after_transaction_ends_callback(self, name):
         """Remove callback for update to AIM objects."""
         self._postcommit_listeners.pop(name, None)
+        self._postcommit_listener_classes.pop(name, None)
+
+    def _get_listened_classes(self):
+        # Resource classes any of the listeners is interested in, None
+        # when one of them wants them all
+        classes = set()
+        for listener_classes in (
+                list(self._update_listener_classes.values()) +
+                list(self._postcommit_listener_classes.values())):
+            if listener_classes is None:
+                return None
+            classes.update(listener_classes)
+        return tuple(classes)
 
     def extract_attributes(self, resource, attr_type=None):
         val = {}
@@ -309,12 +355,20 @@ class SqlAlchemyStore(AimStore):
             self._initialize_hooks()
 
     def _initialize_hooks(self):
-        self.register_before_session_flush_callback(
-            'hashtree_db_listener_on_commit',
-            ht_db_l.HashTreeDbListener(aim_manager.AimManager()).on_commit)
-        self.register_after_transaction_ends_callback(
-            'tree_creation_postcommit',
-            rpc.AIDEventRpcApi().tree_creation_postcommit)
+        # A store is created on every flush, the listeners are shared so
+        # only build them once
+        if 'hashtree_db_listener_on_commit' not in self._update_listeners:
+            self.register_before_session_flush_callback(
+                'hashtree_db_listener_on_commit',
+                ht_db_l.HashTreeDbListener(
+                    aim_manager.AimManager()).on_commit,
+                resource_classes=(api_res.AciResourceBase,
+                                  api_status.AciStatus, api_status.AciFault))
+        if 'tree_creation_postcommit' not in self._postcommit_listeners:
+            self.register_after_transaction_ends_callback(
+                'tree_creation_postcommit',
+                rpc.AIDEventRpcApi().tree_creation_postcommit,
+                resource_classes=(api_tree.TypeTreeBase, api_tree.ActionLog))
 
     @property
     def name(self):
@@ -340,6 +394,26 @@ class SqlAlchemyStore(AimStore):
     def delete(self, db_obj):
         self.db_session.delete(db_obj)
 
+    def add_all(self, db_obj_type, resource_klass, resources):
+        # Bulk insert, one statement per set of non NULL columns. Rows are
+        # inserted right away even if called within a flush.
+        mapper = sa_inspect(db_obj_type)
+        rows_by_keys = {}
+        for resource in resources:
+            db_obj = self.make_db_obj(resource)
+            row = {}
+            for prop in mapper.column_attrs:
+                value = getattr(db_obj, prop.key)
+                # Leave server defaults to the DB
+                if value is not None:
+                    row[prop.columns[0].key] = value
+            rows_by_keys.setdefault(frozenset(row), []).append(row)
+        for rows in rows_by_keys.values():
+            self.db_session.execute(db_obj_type.__table__.insert(), rows)
+        # No flush event is fired for these objects, post-commit listeners
+        # still need to know about them
+        SqlAlchemyStore._stash_changes(self.db_session, added=resources)
+
     def update_all(self, resource_klass, filters=None, **kwargs):
         filters = filters or None
         db_klass = self.db_model_map[resource_klass]
@@ -351,13 +425,16 @@ class SqlAlchemyStore(AimStore):
             self.add(obj)
 
     def _query(self, db_obj_type, resource_klass, in_=None, notin_=None,
-               order_by=None, lock_update=False, **filters):
+               order_by=None, lock_update=False, gt_=None, limit=None,
+               **filters):
         query = self.db_session.query(db_obj_type)
         for k, v in (in_ or {}).items():
             query = query.filter(getattr(db_obj_type, k).in_(v))
         for k, v in (notin_ or {}).items() or {}:
             query = query.filter(getattr(db_obj_type, k).notin_(
                 [(x or '') for x in v]))
+        for k, v in (gt_ or {}).items():
+            query = query.filter(getattr(db_obj_type, k) > v)
         if filters:
             query = query.filter_by(**filters)
         if order_by:
@@ -368,6 +445,8 @@ class SqlAlchemyStore(AimStore):
             query = query.order_by(*args)
         if lock_update:
             query = query.with_lockmode('update')
+        if limit:
+            query = query.limit(limit)
         return query
 
     def query_statuses(self, resources):
@@ -393,11 +472,12 @@ class SqlAlchemyStore(AimStore):
                 for x in db_statuses]
 
     def query(self, db_obj_type, resource_klass, in_=None, notin_=None,
-              order_by=None, lock_update=False, **filters):
+              order_by=None, lock_update=False, gt_=None, limit=None,
+              **filters):
 
         return self._query(db_obj_type, resource_klass, in_=in_, notin_=notin_,
                            order_by=order_by, lock_update=lock_update,
-                           **filters).all()
+                           gt_=gt_, limit=limit, **filters).all()
 
     def count(self, db_obj_type, resource_klass, in_=None, notin_=None,
               **filters):
@@ -405,6 +485,15 @@ class SqlAlchemyStore(AimStore):
         return self._query(db_obj_type, resource_klass, in_=in_, notin_=notin_,
                            **filters).count()
 
+    def count_by(self, db_obj_type, resource_klass, group_by, in_=None,
+                 notin_=None, **filters):
+        columns = [getattr(db_obj_type, x) for x in group_by]
+        query = self._query(db_obj_type, resource_klass, in_=in_,
+                            notin_=notin_, **filters)
+        query = query.with_entities(
+            func.count(), *columns).group_by(*columns)
+        return {tuple(row[1:]): row[0] for row in query.all()}
+
     def delete_all(self, db_obj_type, resource_klass, in_=None, notin_=None,
                    **filters):
         return self._query(db_obj_type, resource_klass, in_=in_, notin_=notin_,
@@ -456,9 +545,19 @@ class SqlAlchemyStore(AimStore):
         obj.bump_epoch()
         setattr(obj, '_epoch_bumped', True)
 
+    @staticmethod
+    def _make_flushed_resource(store, db_obj, classes):
+        res_cls = store.resource_map.get(type(db_obj))
+        if res_cls and (classes is None or issubclass(res_cls, classes)):
+            return store.make_resource(res_cls, db_obj)
+
     @staticmethod
     def _before_session_commit(session, flush_context, instances):
         store = SqlAlchemyStore(session)
+        # Only the resources some listener cares about are built, and
+        # they are kept for the after flush stash
+        classes = store._get_listened_classes()
+        session._aim_flushed = flushed = {}
         added = []
         updated = []
         deleted = []
@@ -485,9 +584,10 @@ class SqlAlchemyStore(AimStore):
                         # che version, a StaleDataError would be raised.
                         # http://docs.sqlalchemy.org/en/latest/orm/versioning.html
                         SqlAlchemyStore._bump_epoch(db_obj)
-                res_cls = store.resource_map.get(type(db_obj))
-                if res_cls:
-                    res = store.make_resource(res_cls, db_obj)
+                res = SqlAlchemyStore._make_flushed_resource(
+                    store, db_obj, classes)
+                flushed[id(db_obj)] = (db_obj, res)
+                if res is not None:
                     res_list.append(res)
 
         for f in copy.copy(SqlAlchemyStore._update_listeners).values():
@@ -499,33 +599,45 @@ class SqlAlchemyStore(AimStore):
     @staticmethod
     def _after_session_flush(session, _):
         # Stash log changes
+        # This is not creating a session
+        store = SqlAlchemyStore(None)
+        classes = store._get_listened_classes()
+        flushed = getattr(session, '_aim_flushed', {})
+
         def to_resource(objs):
             res_set = set()
-            # This is not creating a session
-            store = SqlAlchemyStore(None)
             for db_obj in objs:
-                res_cls = store.resource_map.get(type(db_obj))
-                if res_cls:
-                    res = store.make_resource(res_cls, db_obj)
+                try:
+                    # Already built before the flush
+                    res = flushed[id(db_obj)][1]
+                except KeyError:
+                    res = SqlAlchemyStore._make_flushed_resource(
+                        store, db_obj, classes)
+                if res is not None:
                     res_set.add(res)
             return res_set
 
-        added = to_resource(session.new)
-        updated = to_resource(session.dirty)
-        deleted = to_resource(session.deleted)
+        SqlAlchemyStore._stash_changes(
+            session, added=to_resource(session.new),
+            updated=to_resource(session.dirty),
+            deleted=to_resource(session.deleted))
+        session._aim_flushed = {}
 
+    @staticmethod
+    def _stash_changes(session, added=(), updated=(), deleted=()):
         try:
             session._aim_stash
         except AttributeError:
             session._aim_stash = {'added': set(), 'updated': set(),
                                   'deleted': set()}
-        session._aim_stash['added'] |= added
-        session._aim_stash['updated'] |= updated
-        session._aim_stash['deleted'] |= deleted
+        session._aim_stash['added'] |= set(added)
+        session._aim_stash['updated'] |= set(updated)
+        session._aim_stash['deleted'] |= set(deleted)
 
     @staticmethod
     def _after_session_rollback(session):
         # Unstash changes if any
+        session._aim_flushed = {}
         try:
             del session._aim_stash
         except AttributeError:
@@ -662,7 +774,8 @@ class K8sStore(AimStore):
         self._post_delete(deleted)
 
     def query(self, db_obj_type, resource_klass, in_=None, notin_=None,
-              order_by=None, lock_update=False, **filters):
+              order_by=None, lock_update=False, gt_=None, limit=None,
+              **filters):
         def_ns = (self.namespace
                   if db_obj_type == api_v1.AciContainersObject else None)
 
@@ -721,7 +834,7 @@ class K8sStore(AimStore):
                         raise e
             item_attr = db_obj.to_attr(resource_klass,
                                        defaults=self.attribute_defaults)
-            if filters or in_ or notin_:
+            if filters or in_ or notin_ or gt_:
                 for k, v in filters.items():
                     if item_attr.get(k) != v:
                         break
@@ -734,7 +847,11 @@ class K8sStore(AimStore):
                             if item_attr.get(k) in v:
                                 break
                         else:
-                            result.append(db_obj)
+                            for k, v in (gt_ or {}).items():
+                                if not item_attr.get(k) > v:
+                                    break
+                            else:
+                                result.append(db_obj)
             else:
                 result.append(db_obj)
         if order_by:
@@ -742,6 +859,8 @@ class K8sStore(AimStore):
                 order_by = [order_by]
             result = sorted(result,
                             key=lambda x: tuple([x[k] for k in order_by]))
+        if limit:
+            result = result[:limit]
         return result
 
     def count(self, db_obj_type, resource_klass, in_=None, notin_=None,
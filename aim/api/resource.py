@@ -31,6 +31,9 @@ from apicapi import apic_client
 
 
 LOG = logging.getLogger(__name__)
+# Identity and user attribute names per resource class, used by the hot
+# __hash__ and user_equal paths.
+_CLASS_ATTRIBUTE_NAMES = {}
 
 
 class ResourceBase(object):
@@ -80,6 +83,16 @@ class ResourceBase(object):
                 list(cls.db_attributes.keys()) +
                 list(cls.common_db_attributes.keys()))
 
+    @classmethod
+    def _get_attribute_names(cls):
+        try:
+            return _CLASS_ATTRIBUTE_NAMES[cls]
+        except KeyError:
+            names = (tuple(cls.identity_attributes.keys()),
+                     tuple(cls.user_attributes()))
+            _CLASS_ATTRIBUTE_NAMES[cls] = names
+            return names
+
     @classmethod
     def user_attributes(cls):
         return list(cls.identity_attributes.keys()) + list(
@@ -130,12 +143,25 @@ class ResourceBase(object):
 
         missing = object()
 
-        if type(self) != type(other):
+        if type(self) is not type(other):
             return False
 
-        for attr in self.user_attributes():
-            if (sort_if_list(attr, getattr(self, attr, missing)) !=
-                    sort_if_list(attr, getattr(other, attr, missing))):
+        # Compare scalars first and only sort the lists that differ as-is,
+        # most mismatches are found without sorting anything.
+        lists = []
+        for attr in self._get_attribute_names()[1]:
+            mine = getattr(self, attr, missing)
+            theirs = getattr(other, attr, missing)
+            if mine == theirs:
+                continue
+            if (isinstance(mine, list) and isinstance(theirs, list) and
+                    len(mine) == len(theirs) and
+                    attr not in self.sorted_attributes):
+                lists.append((attr, mine, theirs))
+                continue
+            return False
+        for attr, mine, theirs in lists:
+            if sort_if_list(attr, mine) != sort_if_list(attr, theirs):
                 return False
         return True
 
@@ -143,7 +169,8 @@ class ResourceBase(object):
         return '%s(%s)' % (type(self).__name__, ','.join(self.identity))
 
     def __eq__(self, other):
-        return self.__dict__ == other.__dict__
+        return (type(self) is type(other) and
+                self.__dict__ == other.__dict__)
 
     def __ne__(self, other):
         return not self.__eq__(other)
@@ -160,8 +187,18 @@ class ResourceBase(object):
     # address of the object in memory) goes away.
     # So for each class defining __eq__() we must also
     # define __hash__() even though parent class has __hash__().
+    #
+    # Resources are hashed on type and identity only: objects that compare
+    # equal always share both, and this is much cheaper than the content
+    # digest returned by the 'hash' property.
     def __hash__(self):
-        return self.hash
+        values = self.__dict__
+        identity = tuple(values.get(x)
+                         for x in self._get_attribute_names()[0])
+        try:
+            return hash((type(self), identity))
+        except TypeError:
+            return hash((type(self), tuple(str(x) for x in identity)))
 
 
 class AciResourceBase(ResourceBase):
@@ -181,14 +218,16 @@ class AciResourceBase(ResourceBase):
                 raise exc.AciResourceDefinitionError(attr=ra, klass=cls)
         super(AciResourceBase, self).__init__(defaults, **kwargs)
 
+    # DN, RN and root only depend on the type and identity of the resource,
+    # they are cached by those so that changing the identity of an object
+    # changes them as well.
     @property
     def dn(self):
-        return apic_client.ManagedObjectClass(self._aci_mo_name).dn(
-            *self.identity)
+        return utils.mo_dn(self._aci_mo_name, *self.identity)
 
     @property
     def rn(self):
-        mo = apic_client.ManagedObjectClass(self._aci_mo_name)
+        mo = utils.get_mo_class(self._aci_mo_name)
         if mo.rn_param_count > 0:
             return mo.rn(*self.identity[-mo.rn_param_count:])
         else:
@@ -196,10 +235,9 @@ class AciResourceBase(ResourceBase):
 
     @classmethod
     def from_dn(cls, dn):
-        dn_mgr = apic_client.DNManager()
         try:
-            mos_and_rns = dn_mgr.aci_decompose_with_type(dn, cls._aci_mo_name)
-            rns = dn_mgr.filter_rns(mos_and_rns)
+            mos_and_rns = utils.aci_decompose_with_type(dn, cls._aci_mo_name)
+            rns = apic_client.DNManager().filter_rns(mos_and_rns)
             if len(rns) < len(cls.identity_attributes):
                 raise exc.InvalidDNForAciResource(dn=dn, cls=cls)
             attr = {p[0]: p[1] for p in zip(cls.identity_attributes, rns)}
@@ -210,7 +248,7 @@ class AciResourceBase(ResourceBase):
     @property
     def root(self):
         mos_and_types = utils.decompose_dn(self._aci_mo_name, self.dn)
-        mo = apic_client.ManagedObjectClass(mos_and_types[0][0])
+        mo = utils.get_mo_class(mos_and_types[0][0])
         if mo.rn_param_count > 0:
             return mo.rn(mos_and_types[0][1])
         else:
@@ -13,7 +13,6 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-from apicapi import apic_client
 from oslo_utils import importutils
 
 from aim.api import resource
@@ -155,7 +154,8 @@ class AciFault(resource.ResourceBase, OperationalResource):
     # So for each class defining __eq__() we must also
     # define __hash__() even though parent class has __hash__().
     def __hash__(self):
-        return super(AciFault, self).__hash__()
+        # Faults compare by identity regardless of their type
+        return hash(tuple(self.identity))
 
     def __init__(self, **kwargs):
         super(AciFault, self).__init__(
@@ -174,6 +174,6 @@ class AciFault(resource.ResourceBase, OperationalResource):
         mos_and_types = utils.decompose_dn(self._aci_mo_name, self.dn)
         if mos_and_types:
             # Faults associated with unrecognized MOs will not decompose
-            mo = apic_client.ManagedObjectClass(mos_and_types[0][0])
+            mo = utils.get_mo_class(mos_and_types[0][0])
             return (mo.rn(mos_and_types[0][1])
                     if mo.rn_param_count else mo.rn())
@@ -37,7 +37,8 @@ class TypeTreeBase(object):
     )
     other_attributes = t.other(
         ('root_full_hash', t.string(256)),
-        ('tree', t.string())
+        ('tree', t.string()),
+        ('snapshot_id', t.string(36))
     )
     db_attributes = t.db()
 
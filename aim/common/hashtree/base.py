@@ -137,6 +137,14 @@ class OrderedList(object):
             bisect.insort(self._stash, item)
         return item
 
+    def append_sorted(self, item):
+        """Append an item known to sort after all the present ones.
+
+        Skips the bisection, useful when loading already ordered data.
+        """
+        self._stash.append(item)
+        return item
+
     def remove(self, key):
         i = self.index(key)
         if i is not None:
@@ -0,0 +1,308 @@
+# Copyright (c) 2017 Cisco Systems
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Compact binary encoding of StructuredHashTrees.
+
+Layout (version 1):
+
+    MAGIC | version (1 byte) | flags (1 byte) | [hash version] | body
+
+flags bit 0 set means the body is zlib compressed, bit 1 that the hash
+version of the tree (1 byte) follows, legacy trees don't have it. The body
+is composed by a table of interned key parts, a JSON list with the metadata
+of all the nodes and the root node (if any). Each node is written in
+pre-order as:
+
+    node flags | shared key prefix | key part indexes | partial hash |
+    full hash | [metadata index] | number of children | children
+
+All the integers are unsigned LEB128 varints. Hashes that are hexadecimal
+strings are stored as raw digests and converted back to hex when decoded.
+"""
+
+import binascii
+import zlib
+
+import six
+
+from aim.common.hashtree import exceptions as exc
+from aim.common.hashtree import structured_tree
+from aim.common import utils
+
+# The leading non-ASCII byte guarantees that an encoded tree can never be
+# mistaken for a legacy JSON serialized one.
+MAGIC = b'\x89AHT'
+VERSION = 1
+FLAG_ZLIB = 0x01
+FLAG_HASH_VERSION = 0x02
+
+COMPRESSION_NONE = 'none'
+COMPRESSION_ZLIB = 'zlib'
+
+_HASH_NONE = 0
+_HASH_DIGEST = 1
+_HASH_TEXT = 2
+
+_PART_STRING = 0
+_PART_JSON = 1
+
+_NODE_DUMMY = 0x01
+_NODE_ERROR = 0x02
+_NODE_METADATA = 0x04
+
+
+def _to_bytes(value):
+    if isinstance(value, six.text_type):
+        return value.encode('utf-8')
+    return value
+
+
+def _to_native(value):
+    # Keep the same string type the legacy JSON deserialization returns
+    if six.PY3:
+        return value.decode('utf-8')
+    return value
+
+
+def _write_varint(out, value):
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _write_chunk(out, value):
+    _write_varint(out, len(value))
+    out.extend(value)
+
+
+def is_encoded(data):
+    """Whether data was produced by this codec (as opposed to legacy JSON)"""
+    return bool(data) and bytes(data[:len(MAGIC)]) == MAGIC
+
+
+class _Encoder(object):
+
+    def __init__(self):
+        self.parts = {}
+        self.table = bytearray()
+        self.metadata = []
+        self.nodes = bytearray()
+
+    def encode(self, tree):
+        if tree.root:
+            self.nodes.append(1)
+            self._write_node(tree.root, ())
+        else:
+            self.nodes.append(0)
+        body = bytearray()
+        _write_varint(body, len(self.parts))
+        body.extend(self.table)
+        # Metadata is decoded in one go, much faster than node by node
+        _write_chunk(body, utils.json_dumps(self.metadata))
+        body.extend(self.nodes)
+        return body
+
+    def _part_index(self, part):
+        if isinstance(part, six.string_types):
+            interned = (_PART_STRING, _to_bytes(part))
+        else:
+            interned = (_PART_JSON, utils.json_dumps(part))
+        try:
+            return self.parts[interned]
+        except KeyError:
+            index = self.parts[interned] = len(self.parts)
+            self.table.append(interned[0])
+            _write_chunk(self.table, interned[1])
+            return index
+
+    def _write_hash(self, value):
+        out = self.nodes
+        if value is None:
+            out.append(_HASH_NONE)
+            return
+        encoded = _to_bytes(value)
+        try:
+            digest = binascii.unhexlify(encoded)
+            if binascii.hexlify(digest) != encoded:
+                # Upper case hex would not survive the round trip
+                raise ValueError(value)
+        except (TypeError, ValueError):
+            out.append(_HASH_TEXT)
+            _write_chunk(out, encoded)
+        else:
+            out.append(_HASH_DIGEST)
+            _write_chunk(out, digest)
+
+    def _write_node(self, node, parent_key):
+        out = self.nodes
+        key = node.key
+        metadata = node.metadata.to_dict()
+        flags = 0
+        if node.dummy:
+            flags |= _NODE_DUMMY
+        if node.error:
+            flags |= _NODE_ERROR
+        if metadata:
+            flags |= _NODE_METADATA
+        out.append(flags)
+        # Children keys extend their parent's, only store the difference
+        shared = len(parent_key)
+        if tuple(key[:shared]) != parent_key:
+            shared = 0
+            for mine, parent in zip(key, parent_key):
+                if mine != parent:
+                    break
+                shared += 1
+        _write_varint(out, shared)
+        _write_varint(out, len(key) - shared)
+        for part in key[shared:]:
+            _write_varint(out, self._part_index(part))
+        self._write_hash(node.partial_hash)
+        self._write_hash(node.full_hash)
+        if metadata:
+            _write_varint(out, len(self.metadata))
+            self.metadata.append(metadata)
+        children = node.get_children()
+        _write_varint(out, len(children))
+        key = tuple(key)
+        for child in children:
+            self._write_node(child, key)
+
+
+class _Decoder(object):
+
+    def __init__(self, body):
+        self.buf = bytearray(body)
+        self.pos = 0
+        self.parts = []
+        self.metadata = []
+
+    def decode(self):
+        for _ in range(self._read_varint()):
+            part_type = self._read_byte()
+            value = self._read_chunk()
+            if part_type == _PART_STRING:
+                self.parts.append(_to_native(value))
+            else:
+                self.parts.append(utils.json_loads(value))
+        self.metadata = utils.json_loads(self._read_chunk())
+        if self._read_byte():
+            return self._read_node(())
+
+    def _read_byte(self):
+        value = self.buf[self.pos]
+        self.pos += 1
+        return value
+
+    def _read_varint(self):
+        buf = self.buf
+        result = shift = 0
+        while True:
+            value = buf[self.pos]
+            self.pos += 1
+            result |= (value & 0x7f) << shift
+            if not value & 0x80:
+                return result
+            shift += 7
+
+    def _read_chunk(self):
+        length = self._read_varint()
+        start = self.pos
+        self.pos += length
+        return bytes(self.buf[start:self.pos])
+
+    def _read_hash(self):
+        hash_type = self._read_byte()
+        if hash_type == _HASH_NONE:
+            return None
+        value = self._read_chunk()
+        if hash_type == _HASH_DIGEST:
+            value = binascii.hexlify(value)
+        return _to_native(value)
+
+    def _read_node(self, parent_key):
+        flags = self._read_byte()
+        shared = self._read_varint()
+        key = parent_key[:shared] + tuple(
+            self.parts[self._read_varint()]
+            for _ in range(self._read_varint()))
+        partial_hash = self._read_hash()
+        full_hash = self._read_hash()
+        node = structured_tree.StructuredTreeNode(
+            key, partial_hash, full_hash, dummy=bool(flags & _NODE_DUMMY),
+            error=bool(flags & _NODE_ERROR))
+        if flags & _NODE_METADATA:
+            metadata = self.metadata[self._read_varint()]
+            for k in sorted(metadata):
+                node.metadata.append_sorted(
+                    structured_tree.KeyValue(k, metadata[k]))
+        # Children are encoded in order, no need to bisect
+        for _ in range(self._read_varint()):
+            node._children.append_sorted(self._read_node(key))
+        return node
+
+
+def dumps(tree, compression=COMPRESSION_NONE):
+    """Encode a StructuredHashTree
+
+    :param tree: StructuredHashTree instance
+    :param compression: one of COMPRESSION_NONE, COMPRESSION_ZLIB
+    :return: bytes
+    """
+    body = _Encoder().encode(tree.materialize_hashes())
+    flags = 0
+    header = b''
+    if compression == COMPRESSION_ZLIB:
+        body = zlib.compress(bytes(body))
+        flags |= FLAG_ZLIB
+    if tree.hash_version != structured_tree.LEGACY_HASH_VERSION:
+        flags |= FLAG_HASH_VERSION
+        header = six.int2byte(tree.hash_version)
+    return (MAGIC + six.int2byte(VERSION) + six.int2byte(flags) + header +
+            bytes(body))
+
+
+def loads(data, root_key=None, has_populated=False,
+          tree_klass=structured_tree.StructuredHashTree):
+    """Decode a StructuredHashTree encoded by dumps
+
+    :param data: encoded tree
+    :param root_key: root key to set when the encoded tree is empty
+    :param has_populated: whether the decoded tree is marked as populated,
+    as in StructuredHashTree.__init__
+    :param tree_klass: StructuredHashTree class to instantiate
+    :return: tree_klass instance
+    :raises: UnsupportedTreeEncoding
+    """
+    if not is_encoded(data):
+        raise exc.UnsupportedTreeEncoding(version='unknown')
+    header = bytearray(data[len(MAGIC):len(MAGIC) + 3])
+    version, flags = header[0], header[1]
+    if version != VERSION:
+        raise exc.UnsupportedTreeEncoding(version=version)
+    start = len(MAGIC) + 2
+    hash_version = structured_tree.LEGACY_HASH_VERSION
+    if flags & FLAG_HASH_VERSION:
+        hash_version = header[2]
+        start += 1
+    body = data[start:]
+    if flags & FLAG_ZLIB:
+        body = zlib.decompress(bytes(body))
+    root = _Decoder(body).decode()
+    if root:
+        return tree_klass(root, has_populated=has_populated,
+                          hash_version=hash_version)
+    return tree_klass(root_key=root_key, has_populated=has_populated)
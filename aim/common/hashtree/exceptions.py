@@ -45,3 +45,11 @@ class HashTreeNotFound(StructuredHashTreeException):
 
 class HashTreeNotEmpty(StructuredHashTreeException):
     message = "Hash Tree is not empty for roots %(root_rn)s"
+
+
+class UnsupportedTreeEncoding(StructuredHashTreeException):
+    message = "Unsupported hash tree encoding version %(version)s"
+
+
+class UnsupportedHashVersion(StructuredHashTreeException):
+    message = "Unsupported hash tree hash version %(version)s"
@@ -13,10 +13,13 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import bisect
 import collections
 import hashlib
 import json
+import operator
 
+from oslo_config import cfg
 from oslo_log import log
 
 from aim.common.hashtree import base
@@ -26,6 +29,104 @@ from aim.common import utils
 LOG = log.getLogger(__name__)
 
 
+_UNHASHABLE = object()
+
+
+def _hashable(key):
+    # Keys might contain lists
+    return tuple(tuple(x) if isinstance(x, list) else x for x in key)
+
+
+def _dict_key(key):
+    try:
+        hash(key)
+        return key
+    except TypeError:
+        return _hashable(key)
+
+
+def _index_value(value):
+    # Metadata values that can't be indexed all end up in the same bucket
+    try:
+        hash(value)
+        return value
+    except TypeError:
+        return _UNHASHABLE
+
+
+class NodeHasher(object):
+    """Calculates the hashes of the nodes of a tree.
+
+    Hashes calculated by different hashers are not comparable, each one
+    is identified by a version which is persisted along with the tree.
+    """
+
+    version = None
+
+    def hash_attributes(self, attributes):
+        raise NotImplementedError()
+
+    def hash_string(self, string):
+        raise NotImplementedError()
+
+    def hash_node(self, partial_hash, children_hashes):
+        return self.hash_string(''.join([partial_hash or ''] +
+                                        children_hashes))
+
+
+class Sha256JsonHasher(NodeHasher):
+    """SHA-256 of the JSON dump of the sorted attributes."""
+
+    version = 1
+
+    def hash_attributes(self, attributes):
+        return self.hash_string(json.dumps(collections.OrderedDict(
+            sorted(attributes.items(), key=lambda t: t[0]))))
+
+    def hash_string(self, string):
+        # To avoid error in Py3:
+        # Unicode-objects must be encoded before hashing
+        # We encode the string to bytes
+        return hashlib.sha256(string.encode('utf-8')).hexdigest()
+
+
+class Blake2bHasher(NodeHasher):
+    """BLAKE2b of a compact, canonical JSON encoding of the attributes.
+
+    The encoder is built once, and sorts the keys by itself.
+    """
+
+    version = 2
+    _encoder = json.JSONEncoder(sort_keys=True, separators=(',', ':'))
+
+    def hash_attributes(self, attributes):
+        return self.hash_string(self._encoder.encode(attributes))
+
+    def hash_string(self, string):
+        return hashlib.blake2b(string.encode('utf-8'),
+                               digest_size=32).hexdigest()
+
+
+LEGACY_HASH_VERSION = Sha256JsonHasher.version
+HASHERS = dict((x.version, x()) for x in [Sha256JsonHasher, Blake2bHasher])
+
+
+def get_hasher(version):
+    hasher = HASHERS.get(version)
+    if (not hasher or
+            (version == Blake2bHasher.version and
+             not hasattr(hashlib, 'blake2b'))):
+        raise exc.UnsupportedHashVersion(version=version)
+    return hasher
+
+
+def _default_hash_version():
+    try:
+        return cfg.CONF.aim.hashtree_hash_version
+    except (cfg.NoSuchOptError, cfg.NoSuchGroupError):
+        return LEGACY_HASH_VERSION
+
+
 class StructuredTreeNode(object):
     # Use lightweight class
     __slots__ = [
@@ -38,6 +139,7 @@ class StructuredTreeNode(object):
         '_children',  # underlying nodes
         'metadata',  # Additional "user" data dict, not used for
                      # tree comparison
+        '_owner',  # token of the tree allowed to modify the node in place
     ]
 
     def __init__(self, key, partial_hash=None, full_hash=None, dummy=True,
@@ -46,13 +148,14 @@ class StructuredTreeNode(object):
         self.partial_hash = partial_hash
         # Same as partial hash by default
         self.full_hash = full_hash or self.partial_hash
-        self._children = ChildrenList()
+        self._children = ChildrenMap()
         self.dummy = dummy
         self.metadata = metadata or KeyValueStore()
         if isinstance(self.metadata, dict):
             self.metadata = KeyValueStore().include(
                 [KeyValue(k, v) for k, v in self.metadata.items()])
         self.error = error
+        self._owner = None
 
     def __cmp__(self, other):
         return utils.cmp(self.key, getattr(other, 'key', other))
@@ -81,6 +184,16 @@ class StructuredTreeNode(object):
     def get_child(self, key, default=None):
         return self._children.get(key, default)
 
+    def copy(self, owner=None):
+        """Shallow copy of the node, children are shared."""
+        node = StructuredTreeNode(self.key, self.partial_hash,
+                                  dummy=self.dummy, error=self.error,
+                                  metadata=self.metadata.copy())
+        node.full_hash = self.full_hash
+        node._children = self._children.copy()
+        node._owner = owner
+        return node
+
     def __str__(self):
         return json.dumps(self.to_dict())
 
@@ -107,6 +220,115 @@ class ChildrenList(base.OrderedList):
         return value
 
 
+class ChildrenMap(object):
+    """Children of a tree node.
+
+    Nodes are stored by key, which makes lookups constant time even for very
+    wide nodes. Iteration follows the key order, so that hashing and diff are
+    deterministic: the sorted list of keys is kept up to date by bisection,
+    which only compares plain keys, or rebuilt on the next iteration when
+    nodes are added in bulk.
+    """
+
+    __slots__ = ['_nodes', '_keys', '_sorted']
+
+    def __init__(self):
+        self._nodes = {}
+        # Both None when the order needs to be recalculated
+        self._keys = []
+        self._sorted = []
+
+    def __iter__(self):
+        return iter(self._get_sorted())
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def __getitem__(self, key):
+        node = self.get(key)
+        if node is None:
+            raise KeyError(key)
+        return node
+
+    def __eq__(self, other):
+        return self._get_sorted() == list(other)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __str__(self):
+        return "[" + ",".join("%s" % x for x in self) + "]"
+
+    def add(self, node):
+        key = node.key
+        current = self.get(key)
+        self._nodes[_dict_key(key)] = node
+        keys = self._keys
+        if keys is None:
+            return node
+        if current is not None:
+            self._sorted[bisect.bisect_left(keys, current.key)] = node
+        elif not keys or keys[-1] < key:
+            keys.append(key)
+            self._sorted.append(node)
+        else:
+            i = bisect.bisect_left(keys, key)
+            keys.insert(i, key)
+            self._sorted.insert(i, node)
+        return node
+
+    def append_sorted(self, node):
+        """Append a node known to sort after all the present ones."""
+        self._nodes[_dict_key(node.key)] = node
+        if self._keys is not None:
+            self._keys.append(node.key)
+            self._sorted.append(node)
+        return node
+
+    def include(self, nodes):
+        """Add multiple nodes, sorting them only once when needed."""
+        self._keys = self._sorted = None
+        for node in nodes:
+            self._nodes[_dict_key(node.key)] = node
+        return self
+
+    def remove(self, key):
+        node = self._nodes.pop(_dict_key(key), None)
+        if node is not None and self._keys is not None:
+            i = bisect.bisect_left(self._keys, node.key)
+            del self._keys[i]
+            del self._sorted[i]
+
+    def get(self, key, default=None):
+        try:
+            return self._nodes.get(key, default)
+        except TypeError:
+            return self._nodes.get(_hashable(key), default)
+
+    def setdefault(self, key, default=None):
+        current = self.get(key)
+        if current is None:
+            current = self.add(default or StructuredTreeNode(key))
+        return current
+
+    def copy(self):
+        result = ChildrenMap()
+        result._nodes = dict(self._nodes)
+        if self._keys is None:
+            result._keys = result._sorted = None
+        else:
+            result._keys = list(self._keys)
+            result._sorted = list(self._sorted)
+        return result
+
+    def _get_sorted(self):
+        if self._sorted is None:
+            self._sorted = sorted(self._nodes.values(),
+                                  key=operator.attrgetter('key'))
+            self._keys = [x.key for x in self._sorted]
+        return self._sorted
+
+
 class KeyValue(object):
 
     __slots__ = ['key', 'value']
@@ -144,6 +366,12 @@ class KeyValueStore(base.OrderedList):
     def to_dict(self):
         return {x.key: x.value for x in self}
 
+    def copy(self):
+        # Items are replaced, never modified, they can be shared
+        result = KeyValueStore()
+        result._stash = list(self._stash)
+        return result
+
     def __cmp__(self, other):
         if isinstance(other, KeyValueStore):
             return super(KeyValueStore, self).__cmp__(other)
@@ -205,25 +433,50 @@ class StructuredHashTree(base.ComparableCollection):
 
     Pop a subtree if present
     tree.pop(('tn-tenant', 'bd-bridge3'))
+
+    Nodes are hashed by the NodeHasher of the tree's hash_version, which
+    defaults to the configured one. Trees of different versions can still
+    be compared, but every node is considered different.
     """
 
-    __slots__ = ['root', 'root_key', 'has_populated']
+    __slots__ = ['root', 'root_key', 'has_populated', '_journal',
+                 '_metadata_index', '_indexed_nodes', '_missing_index',
+                 '_dirty',
+                 'hash_version', '_hasher', '_owner']
 
-    def __init__(self, root=None, root_key=None, has_populated=False):
+    def __init__(self, root=None, root_key=None, has_populated=False,
+                 hash_version=None):
         """Initialize a Structured Hash Tree.
 
         Initial data can be passed to initialize the tree
         :param root
+        :param hash_version: version of the NodeHasher used by the tree,
+        the configured one if None
         """
+        self.hash_version = hash_version or _default_hash_version()
+        self._hasher = get_hasher(self.hash_version)
         self.root = root
         self.root_key = root_key
         if self.root:
             # Ignore the value passed in the constructor
             self.root_key = self.root.key
         self.has_populated = has_populated
+        # Keys of the nodes modified since start_journal was called
+        self._journal = None
+        # Non dummy nodes by metadata key and value, built on first lookup
+        self._metadata_index = None
+        self._indexed_nodes = None
+        # Non dummy nodes lacking a metadata key, for the keys looked up with
+        # find_no_metadata
+        self._missing_index = None
+        # Keys of the nodes whose full hash is outdated, only when deferred
+        self._dirty = None
+        # Nodes with a different owner are shared with a snapshot
+        self._owner = None
 
     @property
     def root_full_hash(self):
+        self.materialize_hashes()
         if self.root:
             return self.root.full_hash
         elif self.root_key:
@@ -234,10 +487,13 @@ class StructuredHashTree(base.ComparableCollection):
     @staticmethod
     def from_string(string, root_key=None, has_populated=False):
         to_dict = utils.json_loads(string)
-        return (StructuredHashTree(StructuredHashTree._build_tree(to_dict),
-                                   has_populated=has_populated) if
-                to_dict else StructuredHashTree(root_key=root_key,
-                                                has_populated=has_populated))
+        # Trees serialized before versioning was introduced are legacy ones
+        return (StructuredHashTree(
+            StructuredHashTree._build_tree(to_dict),
+            has_populated=has_populated,
+            hash_version=to_dict.get('hash_version', LEGACY_HASH_VERSION))
+            if to_dict else StructuredHashTree(root_key=root_key,
+                                               has_populated=has_populated))
 
     @staticmethod
     def _build_tree(root_dict):
@@ -247,44 +503,30 @@ class StructuredHashTree(base.ComparableCollection):
                                   dummy=root_dict['dummy'],
                                   error=root_dict['error'],
                                   metadata=root_dict.get('metadata'))
-        for child in root_dict['_children']:
-            root._children.add(StructuredHashTree._build_tree(child))
+        root._children.include(StructuredHashTree._build_tree(child)
+                               for child in root_dict['_children'])
         return root
 
     def add(self, key, **kwargs):
         if not key:
             # nothing to do
             return self
+        stack = self._add(key, **kwargs)
+        # Recalculate full hashes navigating the stack backwards
+        self._recalculate_parents_stack(stack)
+        return self
+
+    def _add(self, key, **kwargs):
+        # Place the node without calculating the full hashes, return the
+        # stack of nodes whose full hash changed
         has_metadata = '_metadata' in kwargs
         metadata_dict = kwargs.pop('_metadata', {})
         metadata = KeyValueStore().include(
             KeyValue(k, v) for k, v in (metadata_dict or {}).items())
         error = kwargs.pop('_error', False)
-        # When self.root is node, it gets initialized with a bogus node
-        if not self.root:
-            self.root = StructuredTreeNode(
-                (key[0],), self._hash_attributes(key=(key[0],), _dummy=True))
-            self.root_key = self.root.key
-            self.has_populated = True
-        else:
-            # With the first element of the key, verify that this is not an
-            # attempt of creating a hydra (tree with multiple roots)
-            if (key[0],) != self.root.key:
-                raise exc.MultipleRootTreeError(key=key,
-                                                root_key=self.root.key)
-
-        node = self.root
-        stack = [node]
-        partial_key = (key[0],)
-        # Traverse the tree and place the node, discard first part of the key
-        for part in key[1:]:
-            partial_key += (part,)
-            # Get child or set it with a placeholder if it doesn't exist
-            node = node.set_child(
-                partial_key, StructuredTreeNode(
-                    partial_key, self._hash_attributes(key=partial_key,
-                                                       _dummy=True)))
-            stack.append(node)
+        stack = self._place_node(key)
+        node = stack[-1]
+        self._unindex_node(node)
         # When a node is explicitly added, it is not dummy
         node.dummy = False
         # Node is the last added element at this point
@@ -296,13 +538,16 @@ class StructuredHashTree(base.ComparableCollection):
                 node.metadata.update(metadata)
             else:
                 node.metadata = metadata
-        # Recalculate full hashes navigating the stack backwards
-        self._recalculate_parents_stack(stack)
-        return self
+        self._index_node(node)
+        self._log_changes(x.key for x in stack)
+        return stack
 
     def include(self, iterable):
         """Add multiple nodes to the Tree.
 
+        Full hashes are calculated once all the nodes are in place, so that
+        each of the affected nodes is hashed only once.
+
         :param iterable: A list of dictionaries representing each node of the
         newly initialized tree. Each dictionary must contain at least the 'key'
         key.
@@ -313,8 +558,10 @@ class StructuredHashTree(base.ComparableCollection):
             for node in iterable:
                 # 'key' is not considered in the Hash calculation
                 key = node.pop('key')
-                cache.append(key)
-                self.add(key, **node)
+                if key:
+                    cache.append(key)
+                    self._add(key, **node)
+            self._recalculate_keys(cache)
             return self
         except Exception as e:
             LOG.error("An exception has occurred while adding nodes, "
@@ -326,15 +573,29 @@ class StructuredHashTree(base.ComparableCollection):
 
     def pop(self, key, default=None):
         result = default
-        current, stack = self._get_node_and_parent_stack(key)
+        current, stack = self._get_node_and_parent_stack(key, owned=True)
         if current:
+            if self._journal is not None or self._metadata_index is not None:
+                visit = [current]
+                for node in visit:
+                    visit.extend(node.get_children())
+                    self._unindex_node(node)
+                self._log_changes(x.key for x in stack + visit)
+            # Subtree is returned as StructuredTree
+            result = StructuredHashTree(current,
+                                        hash_version=self.hash_version)
+            # Detached nodes can only be reached from the subtree now
+            result._owner = self._owner
+            if self._dirty:
+                # Outdated hashes go along with the subtree
+                result._dirty = dict(
+                    (k, v) for k, v in self._dirty.items()
+                    if tuple(v[:len(current.key)]) == tuple(current.key))
             if not stack:
                 # Current is root
                 self.root = None
-                return StructuredHashTree(current)
+                return result
             # We can remove the node and recalculate the tree
-            # Subtree is returned as StructuredTree
-            result = StructuredHashTree(current)
             stack[-1].remove_child(current.key)
             # Remove empty nodes in from the stack
             self._clear_stack_from_dummies(stack)
@@ -348,14 +609,16 @@ class StructuredHashTree(base.ComparableCollection):
 
     def clear(self, key):
         # Set the specific node as Dummy
-        node, parents = self._get_node_and_parent_stack(key)
+        node, parents = self._get_node_and_parent_stack(key, owned=True)
         if not node:
             return
+        self._unindex_node(node)
         # Make node dummy
         node.dummy = True
         node.partial_hash = self._hash_attributes(key=key, _dummy=node.dummy)
         node.full_hash = None
         parents.append(node)
+        self._log_changes(x.key for x in parents)
         # Cleanup parent list if node is a leaf
         self._clear_stack_from_dummies(parents)
         if parents:
@@ -373,31 +636,280 @@ class StructuredHashTree(base.ComparableCollection):
         return self._find_by_metadata(key, None, False)
 
     def _find_by_metadata(self, key, value, present=True):
-        # TODO(ivar): this is a linear search on the whole tree, make it more
-        # efficient by storing nodes indexed by their metadata
-        if not self.root:
-            return []
+        index = self._get_metadata_index()
+        by_value = index.get(key, {})
+        if not present:
+            missing = self._missing_index.get(key)
+            if missing is None:
+                # Kept up to date from now on
+                missing = dict(
+                    (k, v[0]) for k, v in self._indexed_nodes.items()
+                    if all(x[0] != key for x in v[1]))
+                self._missing_index[key] = missing
+            result = list(missing.values())
+        elif _index_value(value) is _UNHASHABLE:
+            result = [x for x in by_value.get(_UNHASHABLE, {}).values()
+                      if self.find(x).metadata[key] == value]
+        else:
+            result = list(by_value.get(value, {}).values())
+        # Same order as a breadth first visit of the tree
+        return sorted(result, key=lambda x: (len(x), x))
+
+    def _get_metadata_index(self):
+        if self._metadata_index is None:
+            self._metadata_index = {}
+            self._indexed_nodes = {}
+            self._missing_index = {}
+            visit = [self.root] if self.root else []
+            for node in visit:
+                visit.extend(node.get_children())
+                self._index_node(node)
+        return self._metadata_index
+
+    def _index_node(self, node):
+        if self._metadata_index is None or node.dummy:
+            return
+        key = _hashable(node.key)
+        # Remember where the node was indexed, in case its metadata is
+        # modified in place
+        entries = [(x.key, _index_value(x.value)) for x in node.metadata]
+        self._indexed_nodes[key] = (node.key, entries)
+        for meta_key, value in entries:
+            self._metadata_index.setdefault(meta_key, {}).setdefault(
+                value, {})[key] = node.key
+        for meta_key, missing in self._missing_index.items():
+            if all(x[0] != meta_key for x in entries):
+                missing[key] = node.key
+
+    def _unindex_node(self, node):
+        if self._metadata_index is None:
+            return
+        key = _hashable(node.key)
+        for missing in self._missing_index.values():
+            missing.pop(key, None)
+        for meta_key, value in self._indexed_nodes.pop(key, (None, []))[1]:
+            by_value = self._metadata_index[meta_key]
+            by_value[value].pop(key, None)
+            if not by_value[value]:
+                del by_value[value]
+                if not by_value:
+                    del self._metadata_index[meta_key]
+
+    def start_journal(self):
+        """Start tracking the changes made to the tree.
+
+        Any previously tracked change is forgotten.
+        """
+        self._journal = {}
+
+    @property
+    def journaled(self):
+        return self._journal is not None
+
+    def snapshot(self):
+        """Copy the tree in constant time.
+
+        Nodes are shared by the two trees until either one modifies them,
+        only the modified nodes and their ancestors are copied then.
+        """
+        self.materialize_hashes()
+        result = StructuredHashTree(self.root, root_key=self.root_key,
+                                    has_populated=self.has_populated,
+                                    hash_version=self.hash_version)
+        # Current nodes belong to neither of the trees from now on
+        self._owner = object()
+        result._owner = object()
+        return result
+
+    def defer_hashing(self):
+        """Stop recalculating full hashes on every change.
+
+        Changed nodes and their ancestors are only marked as outdated, their
+        full hashes are calculated all together on the first read of
+        root_full_hash, diff, comparison or serialization of the tree, so
+        that a batch of changes costs one single pass.
+        """
+        if self._dirty is None:
+            self._dirty = {}
+        return self
+
+    def materialize_hashes(self):
+        """Calculate the full hashes left outdated by defer_hashing."""
+        if self._dirty:
+            keys = list(self._dirty.values())
+            self._dirty = {}
+            self._hash_keys(keys)
+        return self
+
+    def get_delta(self):
+        """Changes tracked since start_journal was called.
+
+        :return: list of node states, one for every node that was modified.
+        Removed nodes only have the 'key' item. Apply on a copy of the tree
+        as it was when journaling started using apply_delta.
+        """
         result = []
-        visit = [self.root]
-        for curr in visit:
-            visit.extend(curr._children)
-            try:
-                if curr.metadata[key] == value and not curr.dummy and present:
-                    result.append(curr.key)
-            except KeyError:
-                if not present and not curr.dummy:
-                    result.append(curr.key)
+        for key in sorted((self._journal or {}).values(), key=len):
+            node = self.find(key)
+            if node:
+                result.append({'key': node.key,
+                               'partial_hash': node.partial_hash,
+                               'dummy': node.dummy, 'error': node.error,
+                               'metadata': node.metadata.to_dict()})
+            else:
+                result.append({'key': key})
         return result
 
+    def apply_delta(self, delta):
+        """Apply a list of node states obtained with get_delta.
+
+        :param delta: list of node states
+        :return: self
+        """
+        removed = [tuple(x['key']) for x in delta if 'partial_hash' not in x]
+        updated = [x for x in delta if 'partial_hash' in x]
+        touched = []
+        # Children go first, so that nothing is left orphan
+        for key in sorted(removed, key=len, reverse=True):
+            node, stack = self._get_node_and_parent_stack(key, owned=True)
+            if not node:
+                continue
+            visit = [node]
+            for child in visit:
+                visit.extend(child.get_children())
+                self._unindex_node(child)
+            if stack:
+                stack[-1].remove_child(node.key)
+                touched.append(stack[-1].key)
+            else:
+                self.root = None
+        # Parents go first, so that placeholders don't override them
+        for state in sorted(updated, key=lambda x: len(x['key'])):
+            key = tuple(state['key'])
+            node = self._place_node(key)[-1]
+            self._unindex_node(node)
+            node.partial_hash = state['partial_hash']
+            node.dummy = state['dummy']
+            node.error = state['error']
+            node.metadata = KeyValueStore().include(
+                KeyValue(k, v) for k, v in (state['metadata'] or {}).items())
+            self._index_node(node)
+            touched.append(key)
+        self._recalculate_keys(touched)
+        self._log_changes(removed + touched)
+        return self
+
+    def _place_node(self, key):
+        # Find a node, creating it and its missing parents as placeholders.
+        # Return the stack of nodes from the root to it, all of them can be
+        # modified.
+        # When self.root is node, it gets initialized with a bogus node
+        if not self.root:
+            self.root = self._new_placeholder((key[0],))
+            self.root_key = self.root.key
+            self.has_populated = True
+        elif (key[0],) != self.root.key:
+            # With the first element of the key, verify that this is not an
+            # attempt of creating a hydra (tree with multiple roots)
+            raise exc.MultipleRootTreeError(key=key, root_key=self.root.key)
+        node = self._own(self.root, None)
+        stack = [node]
+        partial_key = (key[0],)
+        # Traverse the tree and place the node, discard first part of the key
+        for part in key[1:]:
+            partial_key += (part,)
+            child = node.get_child(partial_key)
+            if child is None:
+                child = node.set_child(partial_key,
+                                       self._new_placeholder(partial_key))
+            else:
+                child = self._own(child, node)
+            node = child
+            stack.append(node)
+        return stack
+
+    def _new_placeholder(self, key):
+        node = StructuredTreeNode(
+            key, self._hash_attributes(key=key, _dummy=True))
+        node._owner = self._owner
+        return node
+
+    def _own(self, node, parent):
+        # Copy on write: nodes shared with a snapshot are copied, and the
+        # copy replaces them in the parent, before being modified
+        if node._owner is not self._owner:
+            node = node.copy(self._owner)
+            if parent is None:
+                self.root = node
+            else:
+                parent.replace_child(node)
+        return node
+
+    def _recalculate_keys(self, keys):
+        if self._dirty is not None:
+            for key in keys:
+                for i in range(len(key), 0, -1):
+                    partial_key = _hashable(key[:i])
+                    if partial_key in self._dirty:
+                        break
+                    self._dirty[partial_key] = key[:i]
+        else:
+            self._hash_keys(keys)
+
+    def _hash_keys(self, keys):
+        # Recalculate full hashes of the nodes with the given keys and all
+        # their ancestors, each one exactly once and children first
+        to_hash = {}
+        for key in keys:
+            for i in range(len(key), 0, -1):
+                partial_key = _hashable(key[:i])
+                if partial_key in to_hash:
+                    # So are all of its ancestors
+                    break
+                to_hash[partial_key] = key[:i]
+        for key in sorted(to_hash.values(), key=len, reverse=True):
+            node = self._find_descendant(key, owned=True)
+            if node:
+                self._hash_node(node)
+
+    def _find_descendant(self, key, owned=False):
+        # Unlike find, also works on subtrees whose root is not a top level
+        # node, as the ones returned by pop
+        node = self.root
+        if not node or tuple(key[:len(node.key)]) != tuple(node.key):
+            return None
+        if owned:
+            node = self._own(node, None)
+        for i in range(len(node.key) + 1, len(key) + 1):
+            child = node.get_child(tuple(key[:i]))
+            if not child:
+                return None
+            node = self._own(child, node) if owned else child
+        return node
+
+    def _log_changes(self, keys):
+        if self._journal is not None:
+            for key in keys:
+                self._journal[_hashable(key)] = key
+
     def diff(self, other):
         # Calculates the set of operations needed to transform other into self
+        self.materialize_hashes()
+        other.materialize_hashes()
         if not self.root:
             return {"add": [], "remove": self._get_subtree_keys(other.root)}
         if not other.root:
             return {"add": self._get_subtree_keys(self.root), "remove": []}
-        childrenl = ChildrenList()
+        if self.hash_version != other.hash_version:
+            # Hashes can't be compared, all the nodes need to be pushed
+            add = self._get_subtree_keys(self.root)
+            keys = set(_hashable(x) for x in add)
+            return {"add": add,
+                    "remove": [x for x in self._get_subtree_keys(other.root)
+                               if _hashable(x) not in keys]}
+        childrenl = ChildrenMap()
         childrenl.add(self.root)
-        childrenr = ChildrenList()
+        childrenr = ChildrenMap()
         childrenr.add(other.root)
         result = {"add": [], "remove": []}
         self._diff_children(childrenl, childrenr, result)
@@ -408,12 +920,12 @@ class StructuredHashTree(base.ComparableCollection):
 
     def _diff_children(self, selfchildren, otherchildren, result):
         for othernode in otherchildren:
-            if selfchildren.index(othernode.key) is None:
+            selfnode = selfchildren.get(othernode.key)
+            if selfnode is None:
                 # This subtree needs to be removed
                 result['remove'] += self._get_subtree_keys(othernode)
             else:
                 # Common child
-                selfnode = selfchildren[othernode.key]
                 if selfnode.partial_hash != othernode.partial_hash:
                     # Only evaluate differences for non error nodes
                     if not (othernode.error or selfnode.error):
@@ -428,7 +940,7 @@ class StructuredHashTree(base.ComparableCollection):
                     self._diff_children(selfnode._children,
                                         othernode._children, result)
         for node in selfchildren:
-            if otherchildren.index(node.key) is None:
+            if otherchildren.get(node.key) is None:
                 # Whole subtree needs to be added
                 result['add'] += self._get_subtree_keys(node)
             # Common nodes have already been evaluated in the previous loop
@@ -444,23 +956,30 @@ class StructuredHashTree(base.ComparableCollection):
         return result
 
     def _recalculate_parents_stack(self, parent_stack):
+        if self._dirty is not None:
+            # The stack always starts from the root
+            self._recalculate_keys([parent_stack[-1].key])
+            return
         # Recalculate full hashes navigating the stack backwards
         for node in parent_stack[::-1]:
-            node.full_hash = self._hash(
-                ''.join([node.partial_hash or ''] +
-                        [x.full_hash for x in node.get_children()]))
+            self._hash_node(node)
+
+    def _hash_node(self, node):
+        node.full_hash = self._hasher.hash_node(
+            node.partial_hash, [x.full_hash for x in node.get_children()])
 
     def _hash_attributes(self, **kwargs):
-        return self._hash(json.dumps(collections.OrderedDict(
-            sorted(kwargs.items(), key=lambda t: t[0]))))
+        return self._hasher.hash_attributes(kwargs)
 
     def _hash(self, string):
-        # To avoid error in Py3:
-        # Unicode-objects must be encoded before hashing
-        # We encode the string to bytes
-        return hashlib.sha256(string.encode('utf-8')).hexdigest()
+        return self._hasher.hash_string(string)
 
     def __str__(self):
+        self.materialize_hashes()
+        if self.root and self.hash_version != LEGACY_HASH_VERSION:
+            root = self.root.to_dict()
+            root['hash_version'] = self.hash_version
+            return json.dumps(root)
         return str(self.root or '{}')
 
     def __repr__(self):
@@ -470,6 +989,8 @@ class StructuredHashTree(base.ComparableCollection):
     def __eq__(self, other):
         if not other or not isinstance(other, StructuredHashTree):
             return False
+        self.materialize_hashes()
+        other.materialize_hashes()
         # Verify nodes are all equal
         return self._compare_subtrees(self.root, other.root)
 
@@ -487,24 +1008,28 @@ class StructuredHashTree(base.ComparableCollection):
         # A removable node has no children, and dummy
         return node.dummy and not node.get_children()
 
-    def _get_node_and_parent_stack(self, key):
+    def _get_node_and_parent_stack(self, key, owned=False):
+        # When owned, the returned nodes can be modified
         not_found = None, []
         if not self.root:
             return not_found
         if self.root.key == key:
-            return self.root, []
+            return (self._own(self.root, None) if owned else self.root), []
         elif self.root.key == (key[0],):
-            parent = self.root
+            parent = self._own(self.root, None) if owned else self.root
             stack = [parent]
             partial_key = (key[0],)
             for part in key[1:-1]:
                 partial_key += (part,)
-                parent = parent.get_child(partial_key)
-                if not parent:
+                child = parent.get_child(partial_key)
+                if not child:
                     # Not Found
                     return not_found
+                parent = self._own(child, parent) if owned else child
                 stack.append(parent)
             current = parent.get_child(key)
+            if current and owned:
+                current = self._own(current, parent)
             return current, stack
         return not_found
 
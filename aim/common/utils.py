@@ -24,6 +24,7 @@ import oslo_serialization
 import random
 import re
 import six
+from six.moves import queue
 import threading
 import time
 import traceback
@@ -226,9 +227,149 @@ class FakeContext(object):
             self.store = store
 
 
+class LRUCache(object):
+    """Bounded cache that evicts the least recently used entries first
+
+    Hits and misses are counted to tell how effective the cache is.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            # Reinsert as most recently used
+            self._data[key] = value
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        return {'size': len(self._data), 'hits': self.hits,
+                'misses': self.misses}
+
+
+# The same DNs are decomposed, and the same keys built, over and over by
+# the converters, the tree makers and the universes.
+DN_CACHE_SIZE = 50000
+_DN_DECOMPOSITIONS = LRUCache(DN_CACHE_SIZE)
+_DN_KEYS = LRUCache(DN_CACHE_SIZE)
+_KEY_DNS = LRUCache(DN_CACHE_SIZE)
+_MO_DNS = LRUCache(DN_CACHE_SIZE)
+# ManagedObjectClass keeps a single instance per type, but initializes it
+# again, along with all of its containers, every time it is called.
+_MO_CLASSES = {}
+
+
+def get_mo_class(mo_type):
+    """Shared ManagedObjectClass instance of an ACI type"""
+    try:
+        return _MO_CLASSES[mo_type]
+    except KeyError:
+        mo = _MO_CLASSES[mo_type] = apic_client.ManagedObjectClass(mo_type)
+        return mo
+
+
+def mo_dn(mo_type, *params):
+    """Cached ManagedObjectClass.dn"""
+    key = (mo_type,) + params
+    try:
+        dn = _MO_DNS.get(key)
+    except TypeError:
+        # Unhashable parameters
+        return get_mo_class(mo_type).dn(*params)
+    if dn is None:
+        dn = get_mo_class(mo_type).dn(*params)
+        _MO_DNS.set(key, dn)
+    return dn
+
+
+def aci_decompose_with_type(dn, mo_type):
+    """Cached DNManager.aci_decompose_with_type
+
+    :return: list of (ManagedObject type, RN value) pairs
+    """
+    key = (dn, mo_type, False)
+    result = _DN_DECOMPOSITIONS.get(key)
+    if result is None:
+        result = tuple(
+            apic_client.DNManager().aci_decompose_with_type(dn, mo_type))
+        _DN_DECOMPOSITIONS.set(key, result)
+    return list(result)
+
+
+def aci_decompose_dn_guess(dn, mo_type):
+    """Cached DNManager.aci_decompose_dn_guess
+
+    :return: tuple with the ManagedObject type that matches the DN and the
+    list of its (ManagedObject type, RN value) pairs
+    """
+    key = (dn, mo_type, True)
+    result = _DN_DECOMPOSITIONS.get(key)
+    if result is None:
+        mo, mos_and_rns = apic_client.DNManager().aci_decompose_dn_guess(
+            dn, mo_type)
+        result = (mo, tuple(mos_and_rns))
+        _DN_DECOMPOSITIONS.set(key, result)
+    return result[0], list(result[1])
+
+
+def build_dn(mos_and_rns):
+    """Cached DNManager.build
+
+    :param mos_and_rns: list of (ManagedObject type, RN value) pairs, as in
+    hash tree keys split by '|'
+    """
+    key = tuple(tuple(x) for x in mos_and_rns)
+    dn = _KEY_DNS.get(key)
+    if dn is None:
+        dn = apic_client.DNManager().build(mos_and_rns)
+        _KEY_DNS.set(key, dn)
+    return dn
+
+
+def dn_to_key(mo_type, dn):
+    """Hash tree key of a DN, None if it can't be decomposed"""
+    key = _DN_KEYS.get((dn, mo_type))
+    if key is None:
+        type_and_dn = decompose_dn(mo_type, dn)
+        if not type_and_dn:
+            # Not cached, so that it keeps being logged
+            return None
+        key = tuple([str('|'.join(x)) for x in type_and_dn])
+        _DN_KEYS.set((dn, mo_type), key)
+    return key
+
+
+def get_dn_cache_stats():
+    return {'decompositions': _DN_DECOMPOSITIONS.stats(),
+            'keys': _DN_KEYS.stats(), 'dns': _KEY_DNS.stats(),
+            'mo_dns': _MO_DNS.stats()}
+
+
 def decompose_dn(mo_type, dn):
     try:
-        return apic_client.DNManager().aci_decompose_dn_guess(dn, mo_type)[1]
+        return aci_decompose_dn_guess(dn, mo_type)[1]
     except (apic_client.DNManager.InvalidNameFormat, KeyError,
             apic_client.cexc.ApicManagedObjectNotSupported, IndexError):
         log_ = LOG.warning
@@ -240,9 +381,8 @@ def decompose_dn(mo_type, dn):
 
 def retrieve_fault_parent(fault_dn, resource_map):
     # external is the DN of the ACI resource
-    dn_mgr = apic_client.DNManager()
-    mos_rns = dn_mgr.aci_decompose_with_type(fault_dn, ACI_FAULT)[:-1]
-    rns = dn_mgr.filter_rns(mos_rns)
+    mos_rns = aci_decompose_with_type(fault_dn, ACI_FAULT)[:-1]
+    rns = apic_client.DNManager().filter_rns(mos_rns)
     conv_info = None
     step = -1
     while conv_info is None or len(conv_info) > 1:
@@ -303,6 +443,41 @@ def spawn_thread(target, *args, **kwargs):
     return thd
 
 
+def run_in_parallel(funct, items, max_workers):
+    """Call funct on each item, using at most max_workers threads.
+
+    :return: list with the results, in the same order as items
+    :raises: the first exception raised by funct, once all the items have
+    been processed
+    """
+    items = list(items)
+    results = [None] * len(items)
+    errors = [None] * len(items)
+    work = queue.Queue()
+    for i, item in enumerate(items):
+        work.put((i, item))
+
+    def worker():
+        while True:
+            try:
+                i, item = work.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                results[i] = funct(item)
+            except Exception as e:
+                errors[i] = e
+
+    threads = [spawn_thread(worker)
+               for _ in range(min(max_workers, len(items)))]
+    for thd in threads:
+        thd.join()
+    for error in errors:
+        if error is not None:
+            raise error
+    return results
+
+
 # Key/Values will be garbage collected once al references are lost
 all_locks = weakref.WeakValueDictionary()
 _master_lock = threading.Lock()
@@ -22,6 +22,7 @@ from apicapi import config as apic_config  # noqa
 from oslo_config import cfg
 from oslo_log import log as logging
 
+from aim.common.hashtree import structured_tree
 from aim.common import utils
 from aim.db import config_model
 from aim import exceptions as exc
@@ -121,6 +122,37 @@ agent_opts = [
     cfg.BoolOpt('remove_remote_group_sg_rule_if_block_all', default=True,
                 help=("(Temporary) Set to False if you still want such rules "
                       "to be added to the AIM tree.")),
+    cfg.StrOpt('hashtree_db_format', default='json',
+               choices=['json', 'binary'],
+               help=("Format used to persist hash trees in the SQL store. "
+                     "The binary format is more compact and faster to "
+                     "parse, trees stored in either format can always be "
+                     "read back regardless of this option.")),
+    cfg.StrOpt('hashtree_db_compression', default='none',
+               choices=['none', 'zlib'],
+               help=("Compression applied to hash trees persisted in the "
+                     "binary format.")),
+    cfg.IntOpt('hashtree_max_deltas', default=0,
+               help=("Maximum number of incremental changes stored for a "
+                     "hash tree before they are merged back into it. Only "
+                     "works with the SQL store. When 0, the whole tree is "
+                     "rewritten on every change.")),
+    cfg.IntOpt('reconcile_concurrency', default=1, min=1,
+               help=("Maximum number of roots the AID reconciles, or "
+                     "catches up with the action log, at the same time, "
+                     "each of them with its own DB session. Roots are "
+                     "processed one by one when 1.")),
+    cfg.IntOpt('hashtree_hash_version', default=1, min=1, max=2,
+               help=("Version of the algorithm used to hash the nodes of "
+                     "newly created hash trees. Version 2 (BLAKE2b over a "
+                     "compact canonical encoding) is faster, but its trees "
+                     "differ entirely from the ones of version 1: switch to "
+                     "it only once every AIM service has been upgraded. "
+                     "Existing trees keep the version they were created "
+                     "with, and the AID hashes the ACI state of each root "
+                     "with the version of its AIM trees. Reset the hash "
+                     "trees (aimctl hashtree reset) to move existing roots "
+                     "to the new version. Version 2 requires Python 3.")),
 ]
 
 # TODO(ivar): move into AIM section
@@ -166,6 +198,8 @@ CONF = cfg.CONF
 
 def init(args, **kwargs):
     CONF(args=args, project='aim')
+    # Fail on startup rather than when the first hash tree is built
+    structured_tree.get_hasher(CONF.aim.hashtree_hash_version)
 
 
 def setup_logging():
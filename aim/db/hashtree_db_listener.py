@@ -29,10 +29,15 @@ from aim import config as aim_cfg
 from aim import tree_manager
 
 ACTION_LOG_THRESHOLD = 1000
+ACTION_LOG_PAGE_SIZE = 500
 MAX_EVENTS_PER_ROOT = 10000
 LOG = logging.getLogger(__name__)
 # Not really rootless, they just miss the root reference attributes
 ROOTLESS_TYPES = ['fabricTopology']
+RESOURCE_PATHS = ('resource', 'service_graph', 'infra', 'tree', 'status')
+# Resources re-read from the DB per query, keeps the number of bound
+# parameters under the backends' limits
+DB_QUERY_CHUNK_SIZE = 200
 
 
 class HashTreeDbListener(object):
@@ -43,46 +48,64 @@ class HashTreeDbListener(object):
         self.tt_mgr = tree_manager.HashTreeManager()
         self.tt_maker = tree_manager.AimHashTreeMaker()
         self.tt_builder = tree_manager.HashTreeBuilder(self.aim_manager)
+        self._log_classes = {}
 
     def on_commit(self, store, added, updated, deleted):
         # Query hash-tree for each tenant and modify the tree based on DB
         # updates
         # TODO(ivar): Use proper store context once dependency issue is fixed
         ctx = utils.FakeContext(store=store)
-        resetting_roots = set()
+        changes = []
+        for i, resources in enumerate((added + updated, deleted)):
+            for res in resources:
+                try:
+                    root = res.root
+                except AttributeError:
+                    continue
+                # TODO(ivar): root should never be None for any object!
+                # We have some conversions broken
+                if not root:
+                    continue
+                if i == 0 and getattr(res, 'sync', True):
+                    action = aim_tree.ActionLog.CREATE
+                else:
+                    action = aim_tree.ActionLog.DELETE
+                changes.append((root, action, res))
+        if not changes:
+            return
         with ctx.store.begin(subtransactions=True):
-            for i, resources in enumerate((added + updated, deleted)):
-                for res in resources:
-                    try:
-                        root = res.root
-                    except AttributeError:
-                        continue
-                    if i == 0 and getattr(res, 'sync', True):
-                        action = aim_tree.ActionLog.CREATE
-                    else:
-                        action = aim_tree.ActionLog.DELETE
-                    # TODO(ivar): root should never be None for any object!
-                    # We have some conversions broken
-                    if self._get_reset_count(ctx, root) > 0:
-                        resetting_roots.add(root)
-                    if not root or root in resetting_roots:
-                        continue
-                    if self._get_log_count(ctx, root) >= MAX_EVENTS_PER_ROOT:
-                        LOG.warn('Max events per root %s reached, '
-                                 'requesting a reset' % root)
-                        action = aim_tree.ActionLog.RESET
-                    log = aim_tree.ActionLog(
-                        root_rn=root, action=action,
-                        object_dict=utils.json_dumps(res.__dict__),
-                        object_type=type(res).__name__)
-                    self.aim_manager.create(ctx, log)
-
-    def _get_log_count(self, ctx, root):
-        return self.aim_manager.count(ctx, aim_tree.ActionLog, root_rn=root)
-
-    def _get_reset_count(self, ctx, root):
-        return self.aim_manager.count(ctx, aim_tree.ActionLog, root_rn=root,
-                                      action=aim_tree.ActionLog.RESET)
+            # Counted once per flush, and kept up to date with the logs
+            # created below
+            log_counts, resetting_roots = self._get_log_counts(
+                ctx, set(x[0] for x in changes))
+            logs = []
+            for root, action, res in changes:
+                if root in resetting_roots:
+                    continue
+                if log_counts[root] >= MAX_EVENTS_PER_ROOT:
+                    LOG.warn('Max events per root %s reached, '
+                             'requesting a reset' % root)
+                    action = aim_tree.ActionLog.RESET
+                    # Nothing else matters for this root until it's reset
+                    resetting_roots.add(root)
+                log_counts[root] += 1
+                logs.append(aim_tree.ActionLog(
+                    root_rn=root, action=action,
+                    object_dict=utils.json_dumps(res.__dict__),
+                    object_type=type(res).__name__))
+            self.aim_manager.create_all(ctx, logs)
+
+    def _get_log_counts(self, ctx, roots):
+        counts = self.aim_manager.count_by(
+            ctx, aim_tree.ActionLog, ['root_rn', 'action'],
+            in_={'root_rn': list(roots)})
+        log_counts = dict((root, 0) for root in roots)
+        resetting_roots = set()
+        for (root, action), count in counts.items():
+            log_counts[root] += count
+            if action == aim_tree.ActionLog.RESET:
+                resetting_roots.add(root)
+        return log_counts, resetting_roots
 
     def _delete_trees(self, aim_ctx, root=None):
         with aim_ctx.store.begin(subtransactions=True):
@@ -95,24 +118,28 @@ class HashTreeDbListener(object):
     def _recreate_trees(self, aim_ctx, root=None):
         with aim_ctx.store.begin(subtransactions=True):
             cache = {}
-            log_by_root = {}
+            objs = []
+            all_objs = []
             # Delete existing trees
             if root:
-                type, name = self.tt_mgr.root_key_funct(root)[0].split('|')
+                root_type, name = self.tt_mgr.root_key_funct(
+                    root)[0].split('|')
             # Retrieve objects
             for klass in self.aim_manager.aim_resources:
                 if issubclass(klass, resource.AciResourceBase):
                     filters = {}
                     if root:
                         if self._retrieve_class_root_type(
-                                klass, cache=cache) != type:
+                                klass, cache=cache) != root_type:
                             # Not the right subtree
                             continue
-                        if type not in ROOTLESS_TYPES:
+                        if root_type not in ROOTLESS_TYPES:
                             filters[klass.root_ref_attribute()] = name
                     # Get all objects of that type
                     for obj in self.aim_manager.find(aim_ctx, klass,
+                                                     include_aim_id=True,
                                                      **filters):
+                        all_objs.append(obj)
                         # We will not add this SG rule to AIM tree to
                         # prevent it from showing up in APIC because its
                         # a block-all rule.
@@ -122,23 +149,47 @@ class HashTreeDbListener(object):
                                 obj.remote_group_id and
                                 not obj.remote_ips):
                             continue
-                        # Need all the faults and statuses as well
-                        stat = self.aim_manager.get_status(
-                            aim_ctx, obj, create_if_absent=False)
                         if getattr(obj, 'sync', True):
-                            if stat:
-                                log_by_root.setdefault(obj.root, []).append(
-                                    (aim_tree.ActionLog.CREATE, stat, None))
-                                for f in stat.faults:
-                                    log_by_root.setdefault(
-                                        obj.root, []).append(
-                                        (aim_tree.ActionLog.CREATE, f, None))
-                                del stat.faults
-                            log_by_root.setdefault(obj.root, []).append(
-                                (aim_tree.ActionLog.CREATE, obj, None))
+                            objs.append(obj)
+            statuses = self.aim_manager.get_statuses_with_faults(aim_ctx,
+                                                                 all_objs)
+            self._delete_parentless_statuses(
+                aim_ctx, set(x.id for x in statuses.values()), root=root)
+            for obj in all_objs:
+                # The ID was only needed to find the statuses
+                obj.__dict__.pop('_aim_id', None)
+            log_by_root = {}
+            for obj in objs:
+                # Need all the faults and statuses as well. Statuses only
+                # affect the pending state of their objects in the trees
+                stat = statuses.get((type(obj), tuple(obj.identity)))
+                if stat:
+                    if stat.sync_status == stat.SYNC_PENDING:
+                        obj._pending = True
+                    elif stat.sync_status in (stat.SYNC_FAILED,
+                                              stat.SYNCED):
+                        obj._pending = False
+                    for f in stat.faults:
+                        log_by_root.setdefault(obj.root, []).append(
+                            (aim_tree.ActionLog.CREATE, f, None))
+                log_by_root.setdefault(obj.root, []).append(
+                    (aim_tree.ActionLog.CREATE, obj, None))
             # Reset the trees
             self._push_changes_to_trees(aim_ctx, log_by_root,
-                                        delete_logs=False, check_reset=False)
+                                        delete_logs=False, check_reset=False,
+                                        bulk=True)
+
+    def _delete_parentless_statuses(self, aim_ctx, keep, root=None):
+        # Statuses of the root that don't belong to any of its objects
+        filters = {'resource_root': root} if root else {}
+        zombies = [x.id for x in self.aim_manager.find(
+            aim_ctx, api_status.AciStatus, **filters) if x.id not in keep]
+        if zombies:
+            LOG.info("Deleting parentless status objects %s" % zombies)
+            for i in range(0, len(zombies), DB_QUERY_CHUNK_SIZE):
+                self.aim_manager.delete_all(
+                    aim_ctx, api_status.AciStatus,
+                    in_={'id': zombies[i:i + DB_QUERY_CHUNK_SIZE]})
 
     def cleanup_zombie_status_objects(self, aim_ctx, roots=None):
         with aim_ctx.store.begin(subtransactions=True):
@@ -162,10 +213,41 @@ class HashTreeDbListener(object):
     def reset(self, store, root=None):
         aim_ctx = utils.FakeContext(store=store)
         with aim_ctx.store.begin(subtransactions=True):
-            self.cleanup_zombie_status_objects(aim_ctx, roots=[root])
+            # Parentless status objects are cleaned up while recreating
             self._delete_trees(aim_ctx, root=root)
             self._recreate_trees(aim_ctx, root=root)
 
+    def reset_roots(self, store, roots=None, concurrency=1,
+                    store_factory=None):
+        """Reset the trees of several roots, one transaction per root.
+
+        :param roots: roots to reset, all the existing ones by default
+        :param concurrency: maximum number of roots reset at the same time,
+        only used when store_factory is given
+        :param store_factory: callable returning a new store, each root
+        gets its own when reset concurrently
+        """
+        if roots is None:
+            roots = self._get_all_roots(utils.FakeContext(store=store))
+        roots = sorted(roots)
+        if concurrency > 1 and store_factory and len(roots) > 1:
+            utils.run_in_parallel(
+                lambda root: self.reset(store_factory(), root), roots,
+                concurrency)
+        else:
+            for root in roots:
+                self.reset(store, root)
+
+    def _get_all_roots(self, aim_ctx):
+        # Roots that have a tree, or any object that would be in one
+        roots = set(self.tt_mgr.get_roots(aim_ctx))
+        for klass in self.aim_manager.aim_resources:
+            if (issubclass(klass, resource.AciResourceBase) and
+                    not klass._tree_parent):
+                roots |= set(x.root for x in
+                             self.aim_manager.find(aim_ctx, klass))
+        return roots
+
     def _retrieve_class_root_type(self, klass, cache=None):
         cache = cache if cache is not None else {}
         if klass in cache:
@@ -178,70 +260,155 @@ class HashTreeDbListener(object):
             cache[k] = klass._aci_mo_name
         return cache[klass]
 
-    def catch_up_with_action_log(self, store, served_tenants=None):
-        served_tenants = served_tenants or set()
+    def catch_up_with_action_log(self, store, served_tenants=None,
+                                 concurrency=1, store_factory=None):
+        """Apply the pending action logs of the served roots to their trees.
+
+        :param served_tenants: roots to catch up, all of them when empty.
+        Roots with logs that don't have a tree yet are always included.
+        :param concurrency: maximum number of roots processed at the same
+        time, only used when store_factory is given
+        :param store_factory: callable returning a new store, each root
+        gets its own when processed concurrently
+        """
         ctx = utils.FakeContext(store=store)
-        to_init = set(self.tt_mgr.retrieve_uninitialized_roots(ctx))
-        served_tenants |= to_init
-        # Nothing will happen if there's no action log
-        kwargs = {'order_by': ['root_rn', 'id']}
-        # This is to just get the for loop below going even if
-        # served_tenants has nothing.
-        # REVISIT: Maybe we should just bail out if served_tenants is empty?
-        if not served_tenants:
-            served_tenants = ['dummy_tenant']
-        for served_tenant in served_tenants:
-            if served_tenant != 'dummy_tenant':
-                kwargs['in_'] = {'root_rn': [served_tenant]}
+        # A single query tells which roots have anything to process, so that
+        # idle cycles are cheap regardless of the number of served roots
+        pending = {}
+        resetting_roots = set()
+        for (root, action), count in self.aim_manager.count_by(
+                ctx, aim_tree.ActionLog, ['root_rn', 'action']).items():
+            pending[root] = pending.get(root, 0) + count
+            if action == aim_tree.ActionLog.RESET:
+                resetting_roots.add(root)
+        if not pending:
+            return
+        served_tenants = set(served_tenants or [])
+        if not set(pending) <= served_tenants:
+            served_tenants |= set(
+                self.tt_mgr.retrieve_uninitialized_roots(ctx))
+        roots = sorted(set(pending) & served_tenants if served_tenants
+                       else pending)
+        for root in roots:
+            if pending[root] > ACTION_LOG_THRESHOLD:
+                LOG.info('Tenant %s has %s ActionLogs to be processed' %
+                         (root, pending[root]))
+
+        def catch_up(root, store=store):
+            self._catch_up_root(store, root,
+                                resetting=root in resetting_roots)
+
+        if concurrency > 1 and store_factory and len(roots) > 1:
+            utils.run_in_parallel(
+                lambda root: catch_up(root, store=store_factory()),
+                roots, concurrency)
+        else:
+            for root in roots:
+                catch_up(root)
+
+    def _catch_up_root(self, store, root, resetting=False):
+        ctx = utils.FakeContext(store=store)
+        if resetting:
+            # The reset supersedes every log of the root, no need to load
+            # them at all
             with ctx.store.begin(subtransactions=True):
-                logs = self.aim_manager.find(ctx, aim_tree.ActionLog, **kwargs)
-                if len(logs) > ACTION_LOG_THRESHOLD:
-                    LOG.info('Tenant %s has %s ActionLogs to be processed' %
-                             (served_tenant, len(logs)))
-                LOG.debug('Processing action logs: %s' % logs)
-                log_by_root, resetting_roots = self._preprocess_logs(ctx, logs)
-                self._cleanup_resetting_roots(
-                    ctx, log_by_root, resetting_roots)
-                self._push_changes_to_trees(ctx, log_by_root)
-                # REVISIT: This is temporary code for verifying solutions
-                # to concurrency issues. Remove when no longer needed.
-                if aim_cfg.CONF.aim.validate_config_trees:
-                    self._validate_config_trees(ctx, log_by_root.keys())
+                self.aim_manager.delete_all(ctx, aim_tree.ActionLog,
+                                            root_rn=root)
+                self.tt_mgr.set_needs_reset_by_root_rn(ctx, root)
+                self._push_changes_to_trees(ctx, {root: []})
+        else:
+            # Logs are consumed one page at a time, each committed in its own
+            # transaction, so that memory usage is bounded and the pages
+            # already applied aren't processed again after a failure.
+            last_id = None
+            while True:
+                filters = {}
+                if last_id is not None:
+                    filters['gt_'] = {'id': last_id}
+                with ctx.store.begin(subtransactions=True):
+                    logs = self.aim_manager.find(
+                        ctx, aim_tree.ActionLog, root_rn=root,
+                        order_by=['id'], limit=ACTION_LOG_PAGE_SIZE,
+                        **filters)
+                    if not logs:
+                        break
+                    LOG.debug('Processing action logs: %s' % logs)
+                    log_by_root, resetting_roots = self._preprocess_logs(
+                        ctx, logs)
+                    self._cleanup_resetting_roots(ctx, log_by_root,
+                                                  resetting_roots)
+                    applied = self._push_changes_to_trees(ctx, log_by_root)
+                # Logs must be applied in order, the next pages will be
+                # retried with the failed one
+                if (len(logs) < ACTION_LOG_PAGE_SIZE or
+                        (log_by_root and root not in applied)):
+                    break
+                last_id = logs[-1].id
+        # REVISIT: This is temporary code for verifying solutions
+        # to concurrency issues. Remove when no longer needed.
+        if aim_cfg.CONF.aim.validate_config_trees:
+            self._validate_config_trees(ctx, [root])
+
+    def _get_log_class(self, object_type):
+        try:
+            return self._log_classes[object_type]
+        except KeyError:
+            klass = None
+            for path in RESOURCE_PATHS:
+                try:
+                    klass = importutils.import_class(
+                        'aim.api.' + path + '.%s' % object_type)
+                except ImportError:
+                    pass
+            self._log_classes[object_type] = klass
+            return klass
+
+    def _get_db_resources(self, ctx, resources):
+        # One find() call per resource type (and chunk of resources) instead
+        # of one get() per resource. Identity attributes are filtered with
+        # in_ independently, so the actual match is done here.
+        by_class = {}
+        for res in resources:
+            by_class.setdefault(type(res), []).append(res)
+        result = {}
+        for klass, objs in by_class.items():
+            for i in range(0, len(objs), DB_QUERY_CHUNK_SIZE):
+                chunk = objs[i:i + DB_QUERY_CHUNK_SIZE]
+                in_ = dict(
+                    (attr, list(set(getattr(x, attr) for x in chunk)))
+                    for attr in klass.identity_attributes)
+                for db_res in self.aim_manager.find(ctx, klass, in_=in_):
+                    result[(klass, tuple(db_res.identity))] = db_res
+        return result
 
     def _preprocess_logs(self, ctx, logs):
         resetting_roots = set()
         log_by_root = {}
-        resource_paths = ('resource', 'service_graph', 'infra', 'tree',
-                          'status')
-        sg_rule_logs = {}
+        last_entries = {}
+        entries = []
+        parsed = []
         for log in logs:
             if log.action == aim_tree.ActionLog.RESET:
                 resetting_roots.add(log.root_rn)
-            action = log.action
-            aim_res = None
-            for path in resource_paths:
-                try:
-                    klass = importutils.import_class(
-                        'aim.api.' + path + '.%s' % log.object_type)
-                    aim_res = klass(**utils.json_loads(log.object_dict))
-                except ImportError:
-                    pass
-            if not aim_res:
+            klass = self._get_log_class(log.object_type)
+            if not klass:
                 LOG.warn('Aim resource for event %s not found' % log)
                 continue
-            # REVISIT: We currently only query the DB for
-            # SecurityGroupRule resources, but should treat all
-            # resource types uniformly, and therefore should do this
-            # for all resource types. This will also allow elimination
-            # of the epoch bumping when modifying list attributes of
-            # other resource types. But we probably will want to
-            # optimize this quering to avoid a roundtrip to the DB
-            # server for each action log item, by making one find()
-            # call for each resource type, filtering with the
-            # identities from all the action log items being
-            # processed.
+            parsed.append((log, klass(**utils.json_loads(log.object_dict))))
+        # REVISIT: We currently only query the DB for
+        # SecurityGroupRule resources, but should treat all
+        # resource types uniformly, and therefore should do this
+        # for all resource types. This will also allow elimination
+        # of the epoch bumping when modifying list attributes of
+        # other resource types.
+        db_resources = self._get_db_resources(
+            ctx, [aim_res for _, aim_res in parsed
+                  if isinstance(aim_res, resource.SecurityGroupRule)])
+        for log, aim_res in parsed:
+            action = log.action
             if isinstance(aim_res, resource.SecurityGroupRule):
-                db_aim_res = self.aim_manager.get(ctx, aim_res)
+                db_aim_res = db_resources.get(
+                    (type(aim_res), tuple(aim_res.identity)))
                 if db_aim_res:
                     if action == aim_tree.ActionLog.DELETE:
                         LOG.warn("AIM resource %s exists in DB for delete "
@@ -267,27 +434,22 @@ class HashTreeDbListener(object):
                         LOG.warn("AIM resource %s does not exist in DB "
                                  "for create/update action" % aim_res)
                         action = aim_tree.ActionLog.SKIP
+            entry = [action, aim_res, log]
+            # Building a resource into the tree replaces whatever was there
+            # for it, so only its last create or delete in the batch needs
+            # to be applied. The other logs are kept, as SKIP, in order to
+            # be deleted.
+            if action in (aim_tree.ActionLog.CREATE,
+                          aim_tree.ActionLog.DELETE):
+                key = (log.object_type, tuple(aim_res.identity))
+                previous = last_entries.get(key)
+                if previous:
+                    previous[0] = aim_tree.ActionLog.SKIP
+                last_entries[key] = entry
+            entries.append(entry)
 
-                # Queue up these SG rules first as we really just need
-                # the last one instead of sending all those duplicate
-                # rules over while building the tree.
-                if action != aim_tree.ActionLog.SKIP:
-                    log_list = sg_rule_logs.get(aim_res.name)
-                    if log_list:
-                        # Mark the last one as SKIP because we
-                        # got a new one now.
-                        log_list[-1][0] = aim_tree.ActionLog.SKIP
-                        log_list[-1] = tuple(log_list[-1])
-                    sg_rule_logs.setdefault(aim_res.name, []).append(
-                        [action, aim_res, log])
-                    continue
-            log_by_root.setdefault(log.root_rn, []).append(
-                (action, aim_res, log))
-
-        for sg_rule_name, list_of_logs in sg_rule_logs.items():
-            list_of_logs[-1] = tuple(list_of_logs[-1])
-            _, _, log = list_of_logs[-1]
-            log_by_root.setdefault(log.root_rn, []).extend(list_of_logs)
+        for entry in entries:
+            log_by_root.setdefault(entry[2].root_rn, []).append(tuple(entry))
 
         return log_by_root, resetting_roots
 
@@ -303,10 +465,12 @@ class HashTreeDbListener(object):
                                     in_={'uuid': [x[2].uuid for x in logs]})
 
     def _push_changes_to_trees(self, ctx, log_by_root, delete_logs=True,
-                               check_reset=True):
+                               check_reset=True, bulk=False):
         conf = tree_manager.CONFIG_TREE
         monitor = tree_manager.MONITORED_TREE
         oper = tree_manager.OPERATIONAL_TREE
+        # Roots whose changes were applied, as opposed to failed or reset
+        applied = set()
         for root_rn in log_by_root:
             try:
                 tree_map = {}
@@ -329,6 +493,11 @@ class HashTreeDbListener(object):
                         ttree_conf = htree.StructuredHashTree()
                         ttree_operational = htree.StructuredHashTree()
                         ttree_monitor = htree.StructuredHashTree()
+                    # Full hashes are calculated once all the logs of the
+                    # root have been applied
+                    for hash_tree in (ttree_conf, ttree_operational,
+                                      ttree_monitor):
+                        hash_tree.defer_hashing()
                     tree_map.setdefault(
                         self.tt_builder.CONFIG, {})[root_rn] = ttree_conf
                     tree_map.setdefault(
@@ -336,16 +505,13 @@ class HashTreeDbListener(object):
                     tree_map.setdefault(
                         self.tt_builder.MONITOR, {})[root_rn] = ttree_monitor
 
-                    for action, aim_res, _ in log_by_root[root_rn]:
-                        if action == aim_tree.ActionLog.SKIP:
-                            continue
-                        added = deleted = []
-                        if action == aim_tree.ActionLog.CREATE:
-                            added = [aim_res]
-                        else:
-                            deleted = [aim_res]
-                        self.tt_builder.build(added, [], deleted, tree_map,
-                                              aim_ctx=ctx)
+                    if bulk:
+                        # Only creations, built all at once
+                        self.tt_builder.build(
+                            [x[1] for x in log_by_root[root_rn]], [], [],
+                            tree_map, aim_ctx=ctx)
+                    else:
+                        self._build_logs(ctx, log_by_root[root_rn], tree_map)
                     if ttree_conf.root_key:
                         self.tt_mgr.update(ctx, ttree_conf)
                     if ttree_operational.root_key:
@@ -354,10 +520,23 @@ class HashTreeDbListener(object):
                         self.tt_mgr.update(ctx, ttree_monitor, tree=monitor)
                     if delete_logs:
                         self._delete_logs(ctx, log_by_root[root_rn])
+                applied.add(root_rn)
             except Exception as e:
                 LOG.error('Failed to update root %s '
                           'tree for: %s' % (root_rn, str(e)))
                 LOG.debug(traceback.format_exc())
+        return applied
+
+    def _build_logs(self, ctx, logs, tree_map):
+        for action, aim_res, _ in logs:
+            if action == aim_tree.ActionLog.SKIP:
+                continue
+            added = deleted = []
+            if action == aim_tree.ActionLog.CREATE:
+                added = [aim_res]
+            else:
+                deleted = [aim_res]
+            self.tt_builder.build(added, [], deleted, tree_map, aim_ctx=ctx)
 
     def _validate_config_trees(self, ctx, roots):
         LOG.info("validating config trees for roots: %s" % roots)
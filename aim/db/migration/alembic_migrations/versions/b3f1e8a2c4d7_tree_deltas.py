@@ -0,0 +1,53 @@
+# Copyright (c) 2020 Cisco Systems
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Create Tree Delta Table
+Revision ID: b3f1e8a2c4d7
+Revises: 6dbf5128c06e
+Create Date: 2020-11-09 10:21:42.118903
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'b3f1e8a2c4d7'
+down_revision = '6dbf5128c06e'
+branch_labels = None
+depends_on = None
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+
+    op.create_table(
+        'aim_tree_deltas',
+        sa.Column('id', sa.BigInteger().with_variant(sa.Integer(), 'sqlite'),
+                  autoincrement=True),
+        sa.Column('tenant_rn', sa.String(64), nullable=False),
+        sa.Column('tree_type', sa.String(64), nullable=False),
+        sa.Column('snapshot_id', sa.String(36), nullable=False),
+        sa.Column('delta', sa.LargeBinary(length=2 ** 24), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.Index('idx_aim_tree_deltas_root', 'tenant_rn', 'tree_type'),
+        sa.Index('idx_aim_tree_deltas_snapshot', 'snapshot_id'))
+
+    for table in ['aim_config_tenant_trees', 'aim_operational_tenant_trees',
+                  'aim_monitored_tenant_trees']:
+        op.add_column(table, sa.Column('snapshot_id', sa.String(36),
+                                       nullable=True))
+
+
+def downgrade():
+    pass
@@ -17,10 +17,18 @@ import six
 import sqlalchemy as sa
 from sqlalchemy.dialects import mysql
 from sqlalchemy.ext import declarative
+from sqlalchemy import orm
 
+from aim.common.hashtree import codec
 from aim.common import utils
 
 
+# Accessor tables of the model classes, by class
+_CLASS_ACCESSORS = {}
+# Model classes configured since the accessor tables were last built
+_CONFIGURED_CLASSES = set()
+
+
 def to_tuple(obj):
     return obj if isinstance(obj, tuple) else (obj,)
 
@@ -129,9 +137,11 @@ class AttributeMixin(object):
         # we need to encode to utf-8 bytes format (for Py3 compatibility).
         # Since in Py2, string are bytes-like objects, encoding won't
         # make a difference.
+        accessors = self._get_accessors()
+        setters = accessors.setters
         encoded_attr_dict = {}
         for k, v in resource_attr.items():
-            if k not in getattr(self, '_exclude_from', []):
+            if k not in accessors.exclude_from:
                 if k == 'object_dict':
                     if isinstance(v, six.text_type):
                         v = v.encode('utf-8')
@@ -139,7 +149,11 @@ class AttributeMixin(object):
                     if isinstance(v, six.text_type):
                         v = v.encode('utf-8')
                 encoded_attr_dict[k] = v
-                self.set_attr(session, k, v, **encoded_attr_dict)
+                setter = setters.get(k)
+                if setter:
+                    setter(self, session, v, **encoded_attr_dict)
+                else:
+                    setattr(self, k, v)
 
     def to_attr(self, session):
         """Get resource attribute dictionary for a model object.
@@ -156,26 +170,41 @@ class AttributeMixin(object):
         # Since in Py2, string are bytes-like objects, decoding won't
         # make a difference.
         attr_dict = {}
-        for k in dir(self):
-            if (not k.startswith('_') and
-                    k not in getattr(self, '_exclude_to', []) and
-                    not callable(getattr(self, k))):
-                if k == 'object_dict':
-                    v = self.get_attr(session, k)
-                    if isinstance(v, bytes):
-                        attr_dict[k] = v.decode('utf-8')
-                    else:
-                        attr_dict[k] = v
-                elif k == 'tree':
-                    v = self.get_attr(session, k)
-                    if isinstance(v, bytes):
-                        attr_dict[k] = v.decode('utf-8')
-                    else:
-                        attr_dict[k] = v
-                else:
-                    attr_dict[k] = self.get_attr(session, k)
+        for k, getter in self._get_attribute_getters():
+            v = getter(self, session) if getter else getattr(self, k)
+            if k == 'object_dict':
+                if isinstance(v, bytes):
+                    v = v.decode('utf-8')
+            elif k == 'tree':
+                # Binary encoded trees are returned as they are
+                if isinstance(v, bytes) and not codec.is_encoded(v):
+                    v = v.decode('utf-8')
+            attr_dict[k] = v
         return attr_dict
 
+    @classmethod
+    def _get_accessors(cls):
+        try:
+            return _CLASS_ACCESSORS[cls]
+        except KeyError:
+            # Not configured yet
+            accessors = _CLASS_ACCESSORS[cls] = _Accessors(cls)
+            return accessors
+
+    def _get_attribute_getters(self):
+        """Names and getter methods of the attributes to convert
+
+        :return: list of (name, getter) tuples, getter is None when the
+        attribute has to be read as it is.
+        """
+        accessors = self._get_accessors()
+        # Attributes set on the object itself aren't in the class table
+        extra = [(k, accessors.getters.get(k))
+                 for k, v in self.__dict__.items()
+                 if not k.startswith('_') and k not in accessors.names and
+                 k not in accessors.exclude_to and not callable(v)]
+        return accessors.to_attr + extra if extra else accessors.to_attr
+
     def set_attr(self, session, k, v, **kwargs):
         """Utility for setting DB attributes
 
@@ -186,18 +215,63 @@ class AttributeMixin(object):
         for retrieving the object identifiers.
         :return:
         """
-        if getattr(self, 'set_' + k, None):
+        setter = self._get_accessors().setters.get(k)
+        if setter:
             # setter method exists
-            getattr(self, 'set_' + k)(session, v, **kwargs)
+            setter(self, session, v, **kwargs)
         else:
             setattr(self, k, v)
 
     def get_attr(self, session, k):
-        if getattr(self, 'get_' + k, None):
+        getter = self._get_accessors().getters.get(k)
+        if getter:
             # getter method exists
-            return getattr(self, 'get_' + k)(session)
+            return getter(self, session)
         else:
             return getattr(self, k)
 
 
+class _Accessors(object):
+    """Attribute names and accessor methods of a model class.
+
+    Resolving them is expensive compared to the conversion of a single
+    object, so it is done once per class rather than once per object.
+    """
+
+    def __init__(self, cls):
+        names = []
+        methods = {}
+        for k in dir(cls):
+            if k.startswith('_'):
+                continue
+            value = getattr(cls, k)
+            if not callable(value):
+                names.append(k)
+            elif k.startswith(('get_', 'set_')):
+                methods[k] = value
+        self.names = frozenset(names)
+        self.exclude_to = frozenset(getattr(cls, '_exclude_to', []))
+        self.exclude_from = frozenset(getattr(cls, '_exclude_from', []))
+        # Unbound methods, called with the object as first argument
+        self.getters = dict((k[len('get_'):], v) for k, v in methods.items()
+                            if k.startswith('get_'))
+        self.setters = dict((k[len('set_'):], v) for k, v in methods.items()
+                            if k.startswith('set_'))
+        self.to_attr = [(k, self.getters.get(k)) for k in sorted(names)
+                        if k not in self.exclude_to]
+
+
+@sa.event.listens_for(AttributeMixin, 'mapper_configured', propagate=True)
+def _model_configured(mapper, cls):
+    _CONFIGURED_CLASSES.add(cls)
+
+
+@sa.event.listens_for(orm.Mapper, 'after_configured')
+def _build_accessors():
+    # Backrefs are only added once all the mappers are configured
+    while _CONFIGURED_CLASSES:
+        cls = _CONFIGURED_CLASSES.pop()
+        _CLASS_ACCESSORS[cls] = _Accessors(cls)
+
+
 Base = declarative.declarative_base(cls=AimBase)
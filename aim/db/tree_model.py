@@ -53,6 +53,9 @@ class TypeTreeBase(object):
     root_rn = sa.Column(sa.String(64), primary_key=True, name='tenant_rn')
     root_full_hash = sa.Column(sa.String(256), nullable=True)
     tree = sa.Column(sa.LargeBinary(length=2 ** 24), nullable=True)
+    # Changes the tree went through since it was last fully written are
+    # stored as TreeDelta rows referencing this ID
+    snapshot_id = sa.Column(sa.String(36), nullable=True)
 
 
 class ConfigTree(model_base.Base, TypeTreeBase, model_base.AttributeMixin):
@@ -88,3 +91,18 @@ class ActionLog(model_base.Base, model_base.AttributeMixin):
     object_type = sa.Column(sa.String(50), nullable=False)
     object_dict = sa.Column(sa.LargeBinary(length=2 ** 24), nullable=False)
     timestamp = sa.Column(sa.TIMESTAMP, server_default=func.now())
+
+
+class TreeDelta(model_base.Base):
+    """Incremental change of a type tree.
+
+    Deltas are applied in ID order on top of the tree snapshot they refer to.
+    """
+    __tablename__ = 'aim_tree_deltas'
+
+    id = sa.Column(sa.BigInteger().with_variant(sa.Integer(), 'sqlite'),
+                   primary_key=True)
+    root_rn = sa.Column(sa.String(64), nullable=False, name='tenant_rn')
+    tree_type = sa.Column(sa.String(64), nullable=False)
+    snapshot_id = sa.Column(sa.String(36), nullable=False)
+    delta = sa.Column(sa.LargeBinary(length=2 ** 24), nullable=False)
@@ -83,10 +83,13 @@ class AIMController(object):
         for klass in klasses:
             all_resources.extend(self.mgr.find(
                 self.ctx, klass, include_aim_id=True, **filters))
+        statuses = {}
+        if get_status:
+            statuses = self.mgr.get_statuses_with_faults(self.ctx,
+                                                         all_resources)
         for obj in all_resources:
             if get_status:
-                status = self.mgr.get_status(self.ctx, obj,
-                                             create_if_absent=False)
+                status = statuses.get((type(obj), tuple(obj.identity)))
                 if status:
                     faults = status.faults
                     del status.faults
@@ -144,7 +144,8 @@ def _k8s_post_delete(self, deleted):
 def _initialize_hooks(self):
     self.old_initialize_hooks()
     self.register_after_transaction_ends_callback('_catch_up_logs',
-                                                  self._catch_up_logs)
+                                                  self._catch_up_logs,
+                                                  resource_classes=())
 
 
 def _catch_up_logs(self, added, updated, removed):
@@ -465,6 +465,27 @@ class TestAciTenant(base.TestAimDBBase, TestAciClientMixin):
         self.manager._event_loop()
         self.manager.tenant_name = old_name
 
+    def test_state_copy(self):
+        self.manager._state.include(
+            [{'key': ('fvTenant|tenant-1', 'fvBD|bd1'), 'arpFlood': 'no'}])
+        self.manager._operational_state.include(
+            [{'key': ('fvTenant|tenant-1', 'faultInst|F0952')}])
+        state = self.manager.get_state_copy()
+        oper = self.manager.get_operational_state_copy()
+        expected = str(state)
+        self.assertEqual(self.manager._state, state)
+        self.assertTrue(state.has_populated)
+        self.assertFalse(oper.has_populated)
+        # Copies are not affected by following events
+        self.manager._state.add(('fvTenant|tenant-1', 'fvBD|bd1'),
+                                arpFlood='yes')
+        self.manager._operational_state.pop(
+            ('fvTenant|tenant-1', 'faultInst|F0952'))
+        self.assertEqual(expected, str(state))
+        self.assertNotEqual(self.manager._state, state)
+        self.assertIsNotNone(
+            oper.find(('fvTenant|tenant-1', 'faultInst|F0952')))
+
     def test_login_failed(self):
         # Mock response and login
         with mock.patch('acitoolkit.acitoolkit.Session.login',
@@ -842,6 +863,52 @@ class TestAciTenant(base.TestAimDBBase, TestAciClientMixin):
         ]
         self.assertEqual(expected, events)
 
+    def test_set_hash_version(self):
+        self.manager.scheduled_reset = time.time() + 3600
+        self.manager.set_hash_version(tree_manager.CONFIG_TREE, 1)
+        self.assertNotEqual(0, self.manager.scheduled_reset)
+        # Trees are rebuilt with the new version on the next full resync
+        self.manager.set_hash_version(tree_manager.CONFIG_TREE, 2)
+        self.assertEqual(0, self.manager.scheduled_reset)
+        self.assertEqual(
+            2, self.manager._new_tree(tree_manager.CONFIG_TREE).hash_version)
+        self.assertEqual(1, self.manager._new_tree(
+            tree_manager.OPERATIONAL_TREE).hash_version)
+
+    def test_squash_events(self):
+        bd = 'uni/tn-tenant-1/BD-bd'
+        ctx = 'uni/tn-tenant-1/ctx-ctx'
+        ap = 'uni/tn-tenant-1/ap-ap'
+        events = [
+            {'fvBD': {'attributes': {'dn': bd, 'status': 'modified',
+                                     'arpFlood': 'yes'}}},
+            {'fvCtx': {'attributes': {'dn': ctx, 'status': 'created',
+                                      'name': 'ctx'}}},
+            {'fvBD': {'attributes': {'dn': bd, 'status': 'modified',
+                                     'descr': 'foo'}}},
+            {'fvAp': {'attributes': {'dn': ap, 'status': 'deleted'}}},
+            {'fvCtx': {'attributes': {'dn': ctx, 'status': 'modified',
+                                      'descr': 'bar'}}},
+            {'fvAp': {'attributes': {'dn': ap, 'status': 'created',
+                                     'name': 'ap'}}}]
+        self.assertEqual(
+            [{'fvBD': {'attributes': {'dn': bd, 'status': 'modified',
+                                      'arpFlood': 'yes', 'descr': 'foo'}}},
+             {'fvCtx': {'attributes': {'dn': ctx, 'status': 'created',
+                                       'name': 'ctx', 'descr': 'bar'}}},
+             {'fvAp': {'attributes': {'dn': ap, 'status': 'created',
+                                      'name': 'ap'}}}],
+            self.manager.squash_events(copy.deepcopy(events)))
+        # Create and delete collapse, unless the object existed before
+        events += [
+            {'fvCtx': {'attributes': {'dn': ctx, 'status': 'deleted'}}},
+            {'fvAp': {'attributes': {'dn': ap, 'status': 'deleted'}}},
+            {'fvBD': {'attributes': {'dn': bd, 'status': 'deleted'}}}]
+        self.assertEqual(
+            [{'fvBD': {'attributes': {'dn': bd, 'status': 'deleted'}}},
+             {'fvAp': {'attributes': {'dn': ap, 'status': 'deleted'}}}],
+            self.manager.squash_events(events))
+
     def test_operational_tree(self):
         events = [
             {'fvRsCtx': {
@@ -860,6 +927,8 @@ class TestAciTenant(base.TestAimDBBase, TestAciClientMixin):
         self._set_events(events, create_parents=True)
         self.manager._event_loop()
         self.assertIsNotNone(self.manager._operational_state)
+        self.assertEqual(4, self.manager.events_received)
+        self.assertEqual(4, self.manager.events_processed)
 
     def test_filter_ownership(self):
         events = [
@@ -24,6 +24,7 @@ from aim.api import status as aim_status
 from aim.common.hashtree import structured_tree as tree
 from aim import config as aim_cfg
 from aim.db import agent_model  # noqa
+from aim.db import api
 from aim.tests import base
 from aim import tree_manager
 
@@ -79,6 +80,34 @@ class TestAimDbUniverseBase(object):
         state = self.universe.state
         self.assertEqual(data1, state['tn-tnA'])
 
+    def test_state_cache(self, tree_type=tree_manager.CONFIG_TREE):
+        data1 = tree.StructuredHashTree().include(
+            [{'key': ('fvTenant|tnA', 'keyB')},
+             {'key': ('fvTenant|tnA', 'keyC')}])
+        data2 = tree.StructuredHashTree().include(
+            [{'key': ('fvTenant|tnA1', 'keyB')}])
+        self.tree_mgr.update_bulk(self.ctx, [data1, data2], tree=tree_type)
+        self.universe.serve(self.ctx, ['tn-tnA', 'tn-tnA1'])
+        self.universe.observe(self.ctx)
+        self.assertEqual(data1, self.universe.state['tn-tnA'])
+        with mock.patch.object(self.universe.tree_manager,
+                               '_deserialize_tree') as deserialize:
+            # Nothing changed, no tree is loaded
+            state = self.universe.get_optimized_state(self.ctx, {})
+            self.assertEqual({'tn-tnA': data1, 'tn-tnA1': data2}, state)
+            self.assertFalse(deserialize.called)
+        # Metadata changes are noticed even if the hash stays the same
+        data1.add(('fvTenant|tnA', 'keyB'), _metadata={'pending': True})
+        self.tree_mgr.update_bulk(self.ctx, [data1], tree=tree_type)
+        self.universe.observe(self.ctx)
+        self.assertEqual(
+            [('fvTenant|tnA', 'keyB')],
+            self.universe.state['tn-tnA'].find_by_metadata('pending', True))
+        # Masked state is restored
+        self.universe.state['tn-tnA'] = tree.StructuredHashTree()
+        self.universe.observe(self.ctx)
+        self.assertEqual(data1, self.universe.state['tn-tnA'])
+
     # TODO(ivar): unskip once the method has been fixed with the proper
     # semantics
     @base.requires(['skip'])
@@ -553,6 +582,103 @@ class TestAimDbUniverse(TestAimDbUniverseBase, base.TestAimDBBase):
         self.assertEqual('uni/tn-t1/BD-b', purge[0][1].dn)
         self.universe.max_backoff_time = old_backoff_time
 
+    def test_reconcile_concurrency(self):
+        self.assertEqual(1, self.universe.reconcile_concurrency)
+        self.set_override('reconcile_concurrency', 3, 'aim')
+        universe = self.klass().initialize(
+            aim_cfg.ConfigManager(self.ctx, ''), [])
+        self.assertEqual(3, universe.reconcile_concurrency)
+        tenants = ['tn-t%s' % i for i in range(8)]
+        universe._state = dict((x, tree.StructuredHashTree())
+                               for x in tenants)
+        other = mock.Mock(state=dict(
+            (x, tree.StructuredHashTree()) for x in tenants + ['tn-other']))
+        results = dict((x, (False, False)) for x in tenants)
+
+        def reconcile_tenant(context, other_universe, tenant):
+            return results[tenant]
+
+        with mock.patch.object(universe, '_reconcile_tenant',
+                               side_effect=reconcile_tenant) as reconcile:
+            with mock.patch.object(universe, 'reset') as reset:
+                self.assertFalse(universe._reconcile(self.ctx, other))
+                self.assertEqual(
+                    tenants, sorted(x[0][2] for x in reconcile.call_args_list))
+                # Each worker gets its own DB session
+                contexts = [x[0][0] for x in reconcile.call_args_list]
+                self.assertNotIn(self.ctx, contexts)
+                self.assertTrue(1 <= len(set(contexts)) <= 3)
+                self.assertFalse(reset.called)
+
+                results['tn-t3'] = (True, False)
+                results['tn-t5'] = (False, True)
+                self.assertTrue(universe._reconcile(self.ctx, other))
+                reset.assert_called_once_with(self.ctx, ['tn-t5'])
+                other.reset.assert_called_once_with(self.ctx, ['tn-t5'])
+
+                # A failing DB session only affects its own tenant
+                results['tn-t3'] = (False, False)
+                reset.reset_mock()
+                reconcile.reset_mock()
+                get_store = api.get_store
+                with mock.patch.object(
+                        api, 'get_store',
+                        side_effect=[ValueError] + [get_store()] * 3):
+                    self.assertTrue(universe._reconcile(self.ctx, other))
+                self.assertEqual(len(tenants) - 1, reconcile.call_count)
+                reset.assert_called_once_with(self.ctx, ['tn-t5'])
+
+    def test_reconcile_tenant(self):
+        desired = tree.StructuredHashTree().include(
+            [{'key': ('fvTenant|t1', 'fvBD|bd1')}])
+        self.universe._state = {'tn-t1': tree.StructuredHashTree()}
+        other = mock.Mock(state={'tn-t1': desired})
+        other.get_resources.return_value = [
+            resource.BridgeDomain(tenant_name='t1', name='bd1')]
+        with mock.patch.object(self.universe, 'push_resources') as push, \
+                mock.patch.object(self.universe, 'get_resources_for_delete',
+                                  return_value=[]), \
+                mock.patch.object(self.universe, 'update_status_objects'):
+            self.assertEqual((True, False), self.universe._reconcile_tenant(
+                self.ctx, other, 'tn-t1'))
+            push.assert_called_once_with(
+                self.ctx, {'create': other.get_resources.return_value,
+                           'delete': []})
+        other.get_resources.assert_called_once_with(
+            [('fvTenant|t1', 'fvBD|bd1')])
+        # Failures are reported as differences
+        other.get_resources.side_effect = ValueError
+        self.assertEqual((True, False), self.universe._reconcile_tenant(
+            self.ctx, other, 'tn-t1'))
+
+    def test_reconcile_tenant_hash_version(self):
+        current = tree.StructuredHashTree(hash_version=1).include(
+            [{'key': ('fvTenant|t1', 'fvBD|bd1')}])
+        self.universe._state = {'tn-t1': current}
+        other = mock.Mock(state={'tn-t1': tree.StructuredHashTree(
+            hash_version=2).include([{'key': ('fvTenant|t1', 'fvBD|bd1')}])})
+        with mock.patch.object(self.universe, 'push_resources') as push, \
+                mock.patch.object(self.universe,
+                                  'align_hash_version') as align:
+            # Nothing is pushed until both sides use the same version
+            self.assertEqual((True, False), self.universe._reconcile_tenant(
+                self.ctx, other, 'tn-t1'))
+            self.assertFalse(push.called)
+            align.assert_called_once_with('tn-t1', 2)
+            other.align_hash_version.assert_called_once_with('tn-t1', 1)
+            other.state['tn-t1'] = tree.StructuredHashTree(
+                hash_version=1).include(
+                    [{'key': ('fvTenant|t1', 'fvBD|bd1')}])
+            other.get_resources.return_value = []
+            with mock.patch.object(self.universe, 'update_status_objects'), \
+                    mock.patch.object(self.universe,
+                                      'get_resources_for_delete',
+                                      return_value=[]):
+                self.assertEqual(
+                    (False, False), self.universe._reconcile_tenant(
+                        self.ctx, other, 'tn-t1'))
+            self.assertEqual(1, align.call_count)
+
 
 class TestAimDbOperationalUniverse(TestAimDbUniverseBase, base.TestAimDBBase):
 
@@ -564,6 +690,10 @@ class TestAimDbOperationalUniverse(TestAimDbUniverseBase, base.TestAimDBBase):
         super(TestAimDbOperationalUniverse, self).test_state(
             tree_type=tree_manager.OPERATIONAL_TREE)
 
+    def test_state_cache(self):
+        super(TestAimDbOperationalUniverse, self).test_state_cache(
+            tree_type=tree_manager.OPERATIONAL_TREE)
+
     def test_get_optimized_state(self):
         super(TestAimDbOperationalUniverse, self).test_get_optimized_state(
             tree_type=tree_manager.OPERATIONAL_TREE)
@@ -588,6 +718,10 @@ class TestAimDbMonitoredUniverse(TestAimDbUniverseBase, base.TestAimDBBase):
         super(TestAimDbMonitoredUniverse, self).test_state(
             tree_type=tree_manager.MONITORED_TREE)
 
+    def test_state_cache(self):
+        super(TestAimDbMonitoredUniverse, self).test_state_cache(
+            tree_type=tree_manager.MONITORED_TREE)
+
     def test_get_optimized_state(self):
         super(TestAimDbMonitoredUniverse, self).test_get_optimized_state(
             tree_type=tree_manager.MONITORED_TREE)
@@ -4850,3 +4850,29 @@ class TestAimToAciConverterSpanSpanlbl(TestAimToAciConverterBase,
                   dn=('uni/infra/vsrcgrp-testSrcGrp/spanlbl-testDestGrp1'),
                   nameAlias='', tag='yellow-green')]
     ]
+
+
+class TestConversionPlan(base.TestAimDBBase):
+
+    def test_compiled_plans(self):
+        helper = converter.resource_map['fvBD'][0]
+        plan = conv_utils.get_conversion_plan(helper, to_aim=True)
+        # Compiled once, when the resource maps were built
+        self.assertIs(plan, conv_utils.get_conversion_plan(helper,
+                                                           to_aim=True))
+        self.assertEqual(('enable_arp_flood', conv_utils.boolean),
+                         plan.exceptions['arpFlood'])
+        self.assertEqual(('limit_ip_learn_to_subnets', conv_utils.boolean),
+                         plan.exceptions['limitIpLearnToSubnets'])
+        self.assertIn('enable_arp_flood', plan.attributes)
+        # Skipped, fvRsCtx sets it
+        self.assertNotIn('vrf_name', plan.attributes)
+        reverse = converter.reverse_resource_map[resource.BridgeDomain][0]
+        plan = conv_utils.get_conversion_plan(reverse, to_aim=False)
+        self.assertEqual(('arpFlood', conv_utils.boolean),
+                         plan.exceptions['enable_arp_flood'])
+        self.assertIn('monitored', plan.skip)
+        # Helpers that aren't part of the maps get a fresh plan
+        helper = dict(helper)
+        self.assertIsNot(conv_utils.get_conversion_plan(helper, to_aim=True),
+                         conv_utils.get_conversion_plan(helper, to_aim=True))
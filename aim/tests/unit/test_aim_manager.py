@@ -30,6 +30,7 @@ import six
 from sqlalchemy.orm import exc as sql_exc
 
 from aim import aim_manager
+from aim import aim_store
 from aim.api import infra
 from aim.api import resource
 from aim.api import resource as aim_res
@@ -40,8 +41,11 @@ from aim.api import tree as api_tree
 from aim.common.hashtree import structured_tree
 from aim.common import utils
 from aim import config  # noqa
+from aim.db import agent_model
 from aim.db import api
 from aim.db import hashtree_db_listener
+from aim.db import model_base
+from aim.db import service_graph_model
 from aim.db import tree_model  # noqa
 from aim import exceptions as exc
 from aim.tests import base
@@ -179,6 +183,207 @@ class TestAimManager(base.TestAimDBBase):
         statuses = self.mgr.get_statuses(self.ctx, [])
         self.assertEqual(expected_statuses, statuses)
 
+    def test_statuses_with_faults(self):
+        resources = []
+        for tn_name in ['t1', 't2']:
+            tn = self.mgr.create(self.ctx, resource.Tenant(name=tn_name))
+            ap = self.mgr.create(self.ctx, resource.ApplicationProfile(
+                tenant_name=tn_name, name='test'))
+            epg = self.mgr.create(self.ctx, resource.EndpointGroup(
+                tenant_name=tn_name, app_profile_name='test', name='test'))
+            vrf = self.mgr.create(self.ctx, resource.VRF(
+                tenant_name=tn_name, name='test'))
+            self.mgr.set_resource_sync_synced(self.ctx, tn)
+            self.mgr.set_resource_sync_synced(self.ctx, vrf)
+            self.mgr.set_resource_sync_error(self.ctx, epg)
+            for code in ['951', '952']:
+                self.mgr.set_fault(self.ctx, epg, aim_status.AciFault(
+                    fault_code=code, severity='warning',
+                    external_identifier='uni/tn-%s/ap-test/epg-test/'
+                                        'fault-%s' % (tn_name, code)))
+            resources += [tn, ap, epg, vrf]
+        # Doesn't exist
+        resources.append(resource.BridgeDomain(tenant_name='t1', name='bd'))
+        # aim IDs already known
+        resources += self.mgr.find(self.ctx, resource.VRF,
+                                   include_aim_id=True)
+
+        def check():
+            statuses = self.mgr.get_statuses_with_faults(self.ctx, resources)
+            for res in resources:
+                expected = self.mgr.get_status(self.ctx, res,
+                                               create_if_absent=False)
+                status = copy.copy(
+                    statuses.get((type(res), tuple(res.identity))))
+                if not expected:
+                    self.assertIsNone(status)
+                    continue
+                faults = [sorted(x.__dict__.pop('faults'),
+                                 key=lambda f: f.external_identifier)
+                          for x in [expected, status]]
+                self.assertEqual(expected, status)
+                self.assertEqual(faults[0], faults[1])
+            return statuses
+
+        statuses = check()
+        self.assertEqual(6, len(statuses))
+        epg = statuses[(resource.EndpointGroup, ('t1', 'test', 'test'))]
+        self.assertEqual(aim_status.AciStatus.SYNC_FAILED, epg.sync_status)
+        self.assertEqual(2, len(epg.faults))
+        # Whole roots are queried when they have many resources
+        with mock.patch.object(aim_manager, 'DB_QUERY_CHUNK_SIZE', 2):
+            check()
+        self.assertEqual({}, self.mgr.get_statuses_with_faults(self.ctx, []))
+
+    def test_sync_status_propagation(self):
+        tn = self.mgr.create(self.ctx, resource.Tenant(name='t1'))
+        ap = self.mgr.create(self.ctx, resource.ApplicationProfile(
+            tenant_name='t1', name='ap'))
+        epgs = [self.mgr.create(self.ctx, resource.EndpointGroup(
+            tenant_name='t1', app_profile_name='ap', name=name))
+            for name in ['epg1', 'epg2', 'epg3']]
+        bd = self.mgr.create(self.ctx, resource.BridgeDomain(
+            tenant_name='t1', name='bd'))
+        self.mgr.set_resource_sync_synced(self.ctx, epgs[2])
+
+        def get_status(res):
+            status = self.mgr.get_status(self.ctx, res,
+                                         create_if_absent=False)
+            return status and (status.sync_status, status.sync_message)
+
+        with mock.patch.object(self.ctx.store, 'update_all',
+                               wraps=self.ctx.store.update_all) as upd:
+            self.mgr.set_resource_sync_error(self.ctx, ap, message='err')
+            if self.ctx.store.supports_sql:
+                # All the existing statuses of the subtree at once
+                self.assertEqual(1, upd.call_count)
+        msg = 'Parent resource %s is in error state' % str(ap)
+        self.assertEqual((aim_status.AciStatus.SYNC_FAILED, 'err'),
+                         get_status(ap))
+        for epg in epgs:
+            # Missing statuses are created
+            self.assertEqual((aim_status.AciStatus.SYNC_FAILED, msg),
+                             get_status(epg))
+        self.assertIsNone(get_status(tn))
+        self.assertIsNone(get_status(bd))
+
+        self.mgr.set_resource_sync_synced(self.ctx, epgs[2])
+        # Pending propagates to the parents in error and their subtree
+        self.mgr.set_resource_sync_pending(self.ctx, epgs[0], cascade=False)
+        for res in [ap] + epgs[:2]:
+            self.assertEqual((aim_status.AciStatus.SYNC_PENDING, ''),
+                             get_status(res))
+        self.assertEqual((aim_status.AciStatus.SYNCED, ''),
+                         get_status(epgs[2]))
+        self.assertEqual((aim_status.AciStatus.SYNC_NA, ''), get_status(tn))
+        self.assertIsNone(get_status(bd))
+
+        # Already pending, nothing to propagate
+        self.mgr.set_resource_sync_error(self.ctx, epgs[1])
+        self.mgr.set_resource_sync_pending(self.ctx, epgs[0])
+        self.assertEqual(aim_status.AciStatus.SYNC_FAILED,
+                         get_status(epgs[1])[0])
+        self.mgr.set_resource_sync_pending(self.ctx, ap)
+        self.assertEqual(aim_status.AciStatus.SYNC_FAILED,
+                         get_status(epgs[1])[0])
+        self.mgr.set_resource_sync_error(self.ctx, ap)
+        self.mgr.set_resource_sync_pending(self.ctx, ap)
+        for res in [ap] + epgs[:2]:
+            self.assertEqual(aim_status.AciStatus.SYNC_PENDING,
+                             get_status(res)[0])
+
+    def test_flush_hooks(self):
+        if not self.ctx.store.supports_sql:
+            self.skipTest('Flush hooks are only used by SQL stores')
+        postcommit = mock.Mock()
+        postcommit.__name__ = 'test-listener'
+        self.ctx.store.register_after_transaction_ends_callback(
+            'test-listener', postcommit, resource_classes=(resource.Tenant,))
+        self.addCleanup(
+            self.ctx.store.unregister_after_transaction_ends_callback,
+            'test-listener')
+        make = aim_store.SqlAlchemyStore._make_flushed_resource
+        built = []
+
+        def make_flushed_resource(store, db_obj, classes):
+            res = make(store, db_obj, classes)
+            built.append((type(db_obj).__name__, res))
+            return res
+
+        with mock.patch.object(aim_store.SqlAlchemyStore,
+                               '_make_flushed_resource',
+                               side_effect=make_flushed_resource):
+            with self.ctx.store.begin(subtransactions=True):
+                tn = self.mgr.create(self.ctx, resource.Tenant(name='t1'))
+                self.mgr.create(self.ctx, infra.HostDomainMappingV2(
+                    host_name='h1', domain_name='d1',
+                    domain_type='OpenStack'))
+        # Built once per flush, and only when some listener cares
+        self.assertEqual([tn], [x[1] for x in built if x[0] == 'Tenant'])
+        self.assertEqual([None], [x[1] for x in built
+                                  if x[0] == 'HostDomainMappingV2'])
+        self.assertIn(tn, [res for call in postcommit.call_args_list
+                           for res in call[0][0]])
+
+    def test_model_accessors(self):
+        if not self.ctx.store.supports_sql:
+            self.skipTest('Accessor tables are only used by SQL models')
+        # Tables are built when the mappers are configured
+        db_klass = service_graph_model.ServiceRedirectMonitoringPolicy
+        accessors = db_klass._get_accessors()
+        self.assertIs(accessors, model_base._CLASS_ACCESSORS[db_klass])
+        self.assertIn('frequency', accessors.getters)
+        self.assertIn('hash_trees', agent_model.Agent._get_accessors().setters)
+        self.assertNotIn('from_attr', accessors.names)
+        pol = aim_service_graph.ServiceRedirectMonitoringPolicy(
+            tenant_name='t1', name='p1', frequency='30', tcp_port='80')
+        db_obj = self.ctx.store.make_db_obj(pol)
+        self.assertEqual(pol, self.ctx.store.make_resource(
+            aim_service_graph.ServiceRedirectMonitoringPolicy, db_obj))
+        # Attributes only set on the object are converted as well
+        db_obj.extra = 'value'
+        self.assertEqual('value', db_obj.to_attr(self.ctx.db_session)['extra'])
+
+    def test_resource_hash_and_user_equal(self):
+        epg = resource.EndpointGroup(
+            tenant_name='t1', app_profile_name='a', name='e',
+            provided_contract_names=['c1', 'c2'])
+        same = resource.EndpointGroup(
+            tenant_name='t1', app_profile_name='a', name='e',
+            provided_contract_names=['c2', 'c1'])
+        # Hashes only depend on type and identity
+        self.assertEqual(hash(epg), hash(same))
+        self.assertNotEqual(
+            hash(epg), hash(resource.BridgeDomain(tenant_name='t1', name='e')))
+        self.assertTrue(epg.user_equal(same))
+        same.provided_contract_names = ['c1', 'c3']
+        self.assertFalse(epg.user_equal(same))
+        same.provided_contract_names = ['c1']
+        self.assertFalse(epg.user_equal(same))
+        same.provided_contract_names = ['c1', 'c2']
+        self.assertTrue(epg.user_equal(same))
+        self.assertEqual(1, len(set([epg, same])))
+        same.name = 'f'
+        self.assertFalse(epg.user_equal(same))
+        self.assertNotIn(same, set([epg]))
+        self.assertFalse(epg.user_equal(
+            resource.BridgeDomain(tenant_name='t1', name='e')))
+        fault = aim_status.AciFault(
+            fault_code='F1', external_identifier=epg.dn + '/fault-F1')
+        self.assertIn(aim_status.AciFault(
+            fault_code='F1', external_identifier=epg.dn + '/fault-F1',
+            severity='major'), set([fault]))
+
+    def test_get_by_ids(self):
+        for name in ['vrf1', 'vrf2', 'vrf3']:
+            self.mgr.create(self.ctx, resource.VRF(tenant_name='t1',
+                                                   name=name))
+        vrfs = self.mgr.find(self.ctx, resource.VRF, include_aim_id=True)
+        ids = [x.__dict__.pop('_aim_id') for x in vrfs]
+        result = self.mgr.get_by_ids(self.ctx, resource.VRF,
+                                     ids[:2] + ['missing'])
+        self.assertEqual(dict(zip(ids[:2], vrfs[:2])), result)
+
 
 class TestResourceOpsBase(object):
     test_dn = None
@@ -2309,6 +2514,10 @@ class TestActionLog(TestActionLogMixin, TestResourceOpsBase,
             self.assertEqual('tenant1', obj.root_rn)
             self.assertTrue(prev.id < obj.id)
             prev = obj
+        # Pages keyed by id
+        page = self.mgr.find(self.ctx, api_tree.ActionLog, root_rn='tenant1',
+                             order_by=['id'], limit=4, gt_={'id': 13})
+        self.assertEqual([14, 15, 16, 17], [x.id for x in page])
         self.mgr.delete_all(self.ctx, api_tree.ActionLog, root_rn='tenant1')
         self.assertEqual(0, self.mgr.count(self.ctx, api_tree.ActionLog,
                                            in_={'root_rn': ['tenant1']}))
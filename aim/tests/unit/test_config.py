@@ -15,6 +15,8 @@
 
 import mock
 
+from aim.common.hashtree import exceptions as hashtree_exc
+from aim.common.hashtree import structured_tree
 from aim import config
 from aim.db import config_model
 from aim import exceptions as exc
@@ -279,3 +281,15 @@ class TestAimConfig(base.TestAimDBBase):
         cfg_mgr2 = config.ConfigManager(self.ctx, 'h2')
         self.assertTrue(cfg_mgr1 is not cfg_mgr2)
         self.assertTrue(cfg_mgr1.subs_mgr is cfg_mgr2.subs_mgr)
+
+    def test_init_hash_version(self):
+        with mock.patch.object(config, 'CONF') as conf:
+            conf.aim.hashtree_hash_version = 2
+            config.init([])
+            # BLAKE2b is not available on older Pythons
+            with mock.patch.object(structured_tree, 'hashlib',
+                                   spec=['sha256']):
+                self.assertRaises(hashtree_exc.UnsupportedHashVersion,
+                                  config.init, [])
+                conf.aim.hashtree_hash_version = 1
+                config.init([])
@@ -22,6 +22,7 @@ from aim.api import resource as aim_res
 from aim.api import status as aim_status
 from aim.api import tree as aim_tree
 from aim.common.hashtree import structured_tree as tree
+from aim.common import utils
 from aim.db import agent_model  # noqa
 from aim.db import hashtree_db_listener as ht_db_l
 from aim.tests import base
@@ -400,6 +401,63 @@ class TestHashTreeDbListener(base.TestAimDBBase):
         # status doesn't exist anymore
         self.assertIsNone(self.mgr.get(self.ctx, status))
 
+    def _populate_tenant(self, tn_name):
+        tn = self.mgr.create(self.ctx, aim_res.Tenant(name=tn_name))
+        ap = self.mgr.create(self.ctx, aim_res.ApplicationProfile(
+            tenant_name=tn_name, name='a1', monitored=True))
+        epg = self.mgr.create(self.ctx, self._get_example_aim_epg(
+            tenant_name=tn_name))
+        bd = self.mgr.create(self.ctx, self._get_example_aim_bd(
+            tenant_name=tn_name, name='net1'))
+        vrf = self.mgr.create(self.ctx, self._get_example_aim_vrf(
+            tenant_name=tn_name))
+        self.mgr.set_resource_sync_synced(self.ctx, tn)
+        self.mgr.set_resource_sync_synced(self.ctx, vrf)
+        self.mgr.set_resource_sync_pending(self.ctx, bd)
+        self.mgr.set_resource_sync_error(self.ctx, epg)
+        self.mgr.set_fault(self.ctx, epg, self._get_example_aim_fault(
+            external_identifier='uni/tn-%s/ap-a1/epg-test/fault-951' %
+            tn_name))
+        self.mgr.set_fault(self.ctx, epg, self._get_example_aim_fault(
+            fault_code='952',
+            external_identifier='uni/tn-%s/ap-a1/epg-test/fault-952' %
+            tn_name))
+        return tn, ap, epg, bd, vrf
+
+    def _get_trees(self, root):
+        return [self.tt_mgr.get(self.ctx, root, tree=x) for x in
+                (tree_manager.CONFIG_TREE, tree_manager.OPERATIONAL_TREE,
+                 tree_manager.MONITORED_TREE)]
+
+    def test_reset(self):
+        for tn_name in ['t1', 't2']:
+            self._populate_tenant(tn_name)
+        # Parentless status
+        zombie = self.mgr.create(self.ctx, aim_status.AciStatus(
+            resource_type='BridgeDomain', resource_id='none',
+            resource_root='tn-t1', resource_dn='uni/tn-t1/BD-none'))
+        before = dict((x, self._get_trees(x)) for x in ['tn-t1', 'tn-t2'])
+        with mock.patch.object(self.db_l.aim_manager, 'get_status') as get:
+            with mock.patch.object(self.db_l.aim_manager,
+                                   'get_by_id') as get_by_id:
+                self.db_l.reset(self.ctx.store, 'tn-t1')
+                # Statuses are loaded in bulk
+                self.assertFalse(get.called)
+                self.assertFalse(get_by_id.called)
+        self.assertEqual(before['tn-t1'], self._get_trees('tn-t1'))
+        self.assertIsNone(self.mgr.get(self.ctx, zombie))
+        self.assertTrue(self._get_trees('tn-t1')[1].root.get_children())
+
+        self.db_l.tt_mgr.clean_all(self.ctx)
+        with mock.patch.object(utils, 'run_in_parallel',
+                               side_effect=lambda f, items, n: [
+                                   f(x) for x in items]) as parallel:
+            self.db_l.reset_roots(self.ctx.store, concurrency=2,
+                                  store_factory=lambda: self.ctx.store)
+            parallel.assert_called_once_with(mock.ANY, ['tn-t1', 'tn-t2'], 2)
+        for root in ['tn-t1', 'tn-t2']:
+            self.assertEqual(before[root], self._get_trees(root))
+
 
 class TestHashTreeDbListenerNoMockStore(base.TestAimDBBase):
 
@@ -450,6 +508,39 @@ class TestHashTreeDbListenerNoMockStore(base.TestAimDBBase):
             logs = self.mgr.find(self.ctx, aim_tree.ActionLog)
             self.assertEqual(logs, [])
 
+    def test_batched_sg_rule_db_read(self):
+        rules = []
+        for i in range(5):
+            rules.append(self.mgr.create(
+                self.ctx, self._get_example_aim_security_group_rule(
+                    security_group_name='sg%s' % (i % 2), name='rule%s' % i,
+                    remote_ips=['10.0.%s.0/24' % i])))
+        self.mgr.delete(self.ctx, rules[4])
+        logs = self.mgr.find(self.ctx, aim_tree.ActionLog, order_by='id')
+        with mock.patch.object(self.db_l.aim_manager, 'get') as get:
+            with mock.patch.object(
+                    self.db_l.aim_manager, 'find',
+                    wraps=self.db_l.aim_manager.find) as find:
+                with mock.patch.object(ht_db_l, 'DB_QUERY_CHUNK_SIZE', 3):
+                    log_by_root, _ = self.db_l._preprocess_logs(
+                        self.ctx, logs)
+                self.assertFalse(get.called)
+                # One query per chunk
+                self.assertEqual(2, find.call_count)
+        actions = sorted((x[1].name, x[0]) for x in log_by_root['tn-t1'])
+        self.assertEqual(
+            [('rule0', 'create'), ('rule1', 'create'), ('rule2', 'create'),
+             ('rule3', 'create'), ('rule4', 'delete'), ('rule4', 'skip')],
+            actions)
+        # Existing rules come from the DB
+        self.assertEqual(
+            rules[:4], sorted([x[1] for x in log_by_root['tn-t1']
+                               if x[0] == 'create'], key=lambda x: x.name))
+        # Object types are resolved once
+        with mock.patch.object(ht_db_l.importutils, 'import_class') as imp:
+            self.db_l._preprocess_logs(self.ctx, logs)
+            self.assertFalse(imp.called)
+
     @base.requires(['hooks'])
     def test_tree_hooks_transactions(self):
         with mock.patch('aim.agent.aid.event_services.'
@@ -493,3 +584,143 @@ class TestHashTreeDbListenerNoMockStore(base.TestAimDBBase):
                 mock.call(mock.ANY, 'serve', None),
                 mock.call(mock.ANY, 'serve', None)]
             self._check_call_list(exp_calls, cast)
+
+    def test_on_commit_bulk_logs(self):
+        bds = [self._get_example_aim_bd(tenant_name=tn, name='bd%s' % i)
+               for tn in ['t1', 't2'] for i in range(3)]
+        with mock.patch.object(self.db_l.aim_manager, 'count_by',
+                               wraps=self.db_l.aim_manager.count_by) as cnt:
+            with mock.patch.object(
+                    self.db_l.aim_manager, 'create_all',
+                    wraps=self.db_l.aim_manager.create_all) as create:
+                self.db_l.on_commit(self.ctx.store, bds[:4], bds[4:5],
+                                    bds[5:])
+                # Counted and inserted once per flush
+                self.assertEqual(1, cnt.call_count)
+                self.assertEqual(1, create.call_count)
+        logs = self.mgr.find(self.ctx, aim_tree.ActionLog, order_by='id')
+        self.assertEqual(
+            [('tn-t1', 'create', 'bd0'), ('tn-t1', 'create', 'bd1'),
+             ('tn-t1', 'create', 'bd2'), ('tn-t2', 'create', 'bd0'),
+             ('tn-t2', 'create', 'bd1'), ('tn-t2', 'delete', 'bd2')],
+            [(x.root_rn, x.action, utils.json_loads(x.object_dict)['name'])
+             for x in logs])
+
+        # Roots over the limit get a single reset
+        with mock.patch.object(ht_db_l, 'MAX_EVENTS_PER_ROOT', 4):
+            self.db_l.on_commit(self.ctx.store, bds, [], [])
+        self.assertEqual(
+            {('tn-t1', 'reset'): 1, ('tn-t1', 'create'): 4,
+             ('tn-t2', 'reset'): 1, ('tn-t2', 'create'): 3,
+             ('tn-t2', 'delete'): 1},
+            self.mgr.count_by(self.ctx, aim_tree.ActionLog,
+                              ['root_rn', 'action']))
+        # Nothing is logged for resetting roots
+        self.db_l.on_commit(self.ctx.store, bds, [], [])
+        self.assertEqual(10, self.mgr.count(self.ctx, aim_tree.ActionLog))
+
+    def test_catch_up_pending_roots(self):
+        with mock.patch.object(self.db_l.tt_mgr,
+                               'retrieve_uninitialized_roots') as uninit:
+            with mock.patch.object(self.db_l, '_catch_up_root') as root:
+                # Nothing to do, a single query is made
+                self.db_l.catch_up_with_action_log(
+                    self.ctx.store, set(['tn-t1', 'tn-t2']))
+                self.assertFalse(uninit.called)
+                self.assertFalse(root.called)
+
+        bds = [self._get_example_aim_bd(tenant_name=tn, name='bd')
+               for tn in ['t1', 't2', 't3']]
+        self.db_l.on_commit(self.ctx.store, bds, [], [])
+        # Uninitialized roots are always caught up
+        self.db_l.catch_up_with_action_log(self.ctx.store, set(['tn-t1']))
+        self.assertEqual([], self.mgr.find(self.ctx, aim_tree.ActionLog))
+        self.assertEqual(set(['tn-t1', 'tn-t2', 'tn-t3']),
+                         set(self.tt_mgr.get_roots(self.ctx)))
+
+        self.db_l.on_commit(self.ctx.store, [], bds, [])
+        self.db_l.catch_up_with_action_log(self.ctx.store, set(['tn-t1']))
+        self.assertEqual(
+            set(['tn-t2', 'tn-t3']),
+            set(x.root_rn for x in self.mgr.find(self.ctx,
+                                                 aim_tree.ActionLog)))
+
+        with mock.patch.object(utils, 'run_in_parallel',
+                               side_effect=lambda f, items, n: [
+                                   f(x) for x in items]) as parallel:
+            self.db_l.catch_up_with_action_log(
+                self.ctx.store, set(['tn-t1', 'tn-t2', 'tn-t3']),
+                concurrency=4, store_factory=lambda: self.ctx.store)
+            parallel.assert_called_once_with(mock.ANY, ['tn-t2', 'tn-t3'], 4)
+        self.assertEqual([], self.mgr.find(self.ctx, aim_tree.ActionLog))
+
+    def test_catch_up_pages(self):
+        bds = [self._get_example_aim_bd(tenant_name='t1', name='bd%s' % i)
+               for i in range(7)]
+        self.db_l.on_commit(self.ctx.store, bds, [], [])
+        build = self.db_l.tt_builder.build
+        calls = []
+
+        def fail_page_two(*args, **kwargs):
+            calls.append(args)
+            if len(calls) == 4:
+                raise Exception('failed')
+            return build(*args, **kwargs)
+
+        with mock.patch.object(ht_db_l, 'ACTION_LOG_PAGE_SIZE', 3):
+            with mock.patch.object(self.db_l.tt_builder, 'build',
+                                   side_effect=fail_page_two):
+                # The transaction of the second page is rolled back
+                self.assertRaises(Exception,
+                                  self.db_l.catch_up_with_action_log,
+                                  self.ctx.store)
+            # First page was applied, processing stopped at the second one
+            self.assertEqual(4, len(calls))
+            logs = self.mgr.find(self.ctx, aim_tree.ActionLog, order_by='id')
+            self.assertEqual(['bd%s' % i for i in range(3, 7)],
+                             [utils.json_loads(x.object_dict)['name']
+                              for x in logs])
+            with mock.patch.object(self.db_l.aim_manager, 'find',
+                                   wraps=self.db_l.aim_manager.find) as find:
+                self.db_l.catch_up_with_action_log(self.ctx.store)
+                # Two pages, the last one isn't full
+                self.assertEqual(2, len([x for x in find.call_args_list
+                                         if x[0][1] == aim_tree.ActionLog]))
+        self.assertEqual([], self.mgr.find(self.ctx, aim_tree.ActionLog))
+        exp_tree = tree.StructuredHashTree()
+        self.db_l.tt_maker.update(exp_tree, bds)
+        self.assertEqual(exp_tree, self.tt_mgr.get(self.ctx, 'tn-t1'))
+
+        # Logs of resetting roots are not even loaded
+        with mock.patch.object(ht_db_l, 'MAX_EVENTS_PER_ROOT', 3):
+            self.db_l.on_commit(self.ctx.store, bds, [], [])
+        with mock.patch.object(self.db_l.aim_manager, 'find',
+                               wraps=self.db_l.aim_manager.find) as find:
+            self.db_l.catch_up_with_action_log(self.ctx.store)
+            self.assertFalse([x for x in find.call_args_list
+                              if x[0][1] == aim_tree.ActionLog])
+        self.assertEqual([], self.mgr.find(self.ctx, aim_tree.ActionLog))
+        self.assertFalse(self.tt_mgr.get_base_tree(
+            self.ctx, 'tn-t1').needs_reset)
+
+    def test_coalesce_logs(self):
+        bd1 = self._get_example_aim_bd(tenant_name='t1', name='bd1')
+        bd2 = self._get_example_aim_bd(tenant_name='t1', name='bd2')
+        vrf = aim_res.VRF(tenant_name='t1', name='bd1')
+        self.db_l.on_commit(self.ctx.store, [bd1, bd2, vrf], [], [])
+        for i in range(3):
+            bd1.display_name = bd2.display_name = 'name%s' % i
+            self.db_l.on_commit(self.ctx.store, [], [bd1, bd2], [])
+        self.db_l.on_commit(self.ctx.store, [], [], [bd1])
+        with mock.patch.object(self.db_l.tt_builder, 'build') as build:
+            self.db_l.catch_up_with_action_log(self.ctx.store)
+            # Only the last state of every resource is built
+            self.assertEqual(
+                [mock.call([vrf], [], [], mock.ANY, aim_ctx=mock.ANY),
+                 mock.call([bd2], [], [], mock.ANY, aim_ctx=mock.ANY),
+                 mock.call([], [], [bd1], mock.ANY, aim_ctx=mock.ANY)],
+                build.call_args_list)
+            self.assertEqual('name2',
+                             build.call_args_list[1][0][0][0].display_name)
+        # Skipped logs are consumed as well
+        self.assertEqual([], self.mgr.find(self.ctx, aim_tree.ActionLog))
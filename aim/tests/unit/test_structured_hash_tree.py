@@ -16,11 +16,15 @@
 import copy
 
 import mock
+from oslo_config import cfg
 
 from aim import aim_manager
 from aim.api import resource
+from aim.common.hashtree import codec
 from aim.common.hashtree import exceptions as exc
 from aim.common.hashtree import structured_tree as tree
+from aim.common import utils
+from aim.db import tree_model
 from aim.tests import base
 from aim import tree_manager
 
@@ -36,7 +40,7 @@ class TestStructuredNode(base.BaseTestCase):
         self.assertEqual(('key',), node.key)
         self.assertEqual('partial_hash', node.partial_hash)
         self.assertEqual('partial_hash', node.full_hash)
-        self.assertTrue(isinstance(node._children, tree.ChildrenList))
+        self.assertTrue(isinstance(node._children, tree.ChildrenMap))
         self.assertTrue(isinstance(node.get_children(), tuple))
         self.assertEqual({'foo': True}, node.metadata)
 
@@ -186,6 +190,62 @@ class TestChildrenList(base.BaseTestCase):
         self.assertNotEqual(children1, children2)
 
 
+class TestChildrenMap(base.BaseTestCase):
+
+    def test_sorted_add(self):
+        children = tree.ChildrenMap()
+        for key in ['keyB', 'keyC', 'keyZ', 'keyD', 'key']:
+            children.add(tree.StructuredTreeNode(('keyA', key)))
+        self.assertEqual([('keyA', 'key'), ('keyA', 'keyB'), ('keyA', 'keyC'),
+                          ('keyA', 'keyD'), ('keyA', 'keyZ')],
+                         [x.key for x in children])
+        # Replace and remove
+        node = tree.StructuredTreeNode(('keyA', 'keyC'), 'hash')
+        children.add(node)
+        children.remove(('keyA', 'keyB'))
+        children.remove(('keyA', 'keyB'))
+        self.assertEqual([('keyA', 'key'), ('keyA', 'keyC'), ('keyA', 'keyD'),
+                          ('keyA', 'keyZ')], [x.key for x in children])
+        self.assertIs(node, children[('keyA', 'keyC')])
+        self.assertEqual(4, len(children))
+
+    def test_include(self):
+        children = tree.ChildrenMap().include(
+            tree.StructuredTreeNode(('keyA', x)) for x in ['keyC', 'keyB'])
+        children.add(tree.StructuredTreeNode(('keyA', 'keyA')))
+        children.remove(('keyA', 'keyC'))
+        self.assertEqual([('keyA', 'keyA'), ('keyA', 'keyB')],
+                         [x.key for x in children])
+
+    def test_get(self):
+        children = tree.ChildrenMap()
+        children.add(tree.StructuredTreeNode(('keyA', 'keyB')))
+        self.assertRaises(KeyError, children.__getitem__, ('keyA', 'keyD'))
+        self.assertIsNone(children.get(('keyA', 'keyD')))
+        self.assertEqual(tree.StructuredTreeNode(('keyA', 'keyB')),
+                         children[('keyA', 'keyB')])
+        # Keys containing lists
+        children = tree.ChildrenMap()
+        children.add(tree.StructuredTreeNode(('keyA', ['keyC', 'keyD'])))
+        children.add(tree.StructuredTreeNode(('keyA', ['keyB'])))
+        self.assertEqual(('keyA', ['keyC', 'keyD']),
+                         children[('keyA', ['keyC', 'keyD'])].key)
+        children.remove(('keyA', ['keyC', 'keyD']))
+        self.assertEqual([('keyA', ['keyB'])], [x.key for x in children])
+
+    def test_compare(self):
+        children1 = tree.ChildrenMap()
+        children1.add(tree.StructuredTreeNode(('keyA', 'keyB')))
+        children1.add(tree.StructuredTreeNode(('keyA', 'keyC')))
+        children2 = tree.ChildrenMap()
+        children2.add(tree.StructuredTreeNode(('keyA', 'keyC')))
+        children2.add(tree.StructuredTreeNode(('keyA', 'keyB')))
+        self.assertEqual(children1, children2)
+        self.assertEqual(str(children1), str(children2))
+        children2.add(tree.StructuredTreeNode(('keyA', 'keyD')))
+        self.assertNotEqual(children1, children2)
+
+
 class TestStructuredHashTree(base.BaseTestCase):
 
     def setUp(self):
@@ -378,6 +438,139 @@ class TestStructuredHashTree(base.BaseTestCase):
         self.assertEqual(data, data_copy)
         self.assertEqual(data_copy.has_populated, True)
 
+    def test_include_equivalence(self):
+        nodes = [{'key': ('keyA', 'keyB', 'key%s' % (i % 7), 'key%s' % i),
+                  'attr': i, '_error': i % 5 == 0,
+                  '_metadata': {'pending': i % 2 == 0}} for i in range(30)]
+        nodes += [{'key': ('keyA', 'keyB')}, {'key': ('keyA',)},
+                  {'key': ('keyA', 'keyB', 'key3'), '_metadata': None},
+                  {'key': ('keyA', 'keyB', 'key3', 'key3'), 'attr': 'other'}]
+        for initial in [[], [{'key': ('keyA', 'keyC')},
+                             {'key': ('keyA', 'keyB', 'key2'), 'a': 1}]]:
+            added = tree.StructuredHashTree().include(copy.deepcopy(initial))
+            included = copy.deepcopy(added)
+            for node in copy.deepcopy(nodes):
+                added.add(node.pop('key'), **node)
+            included.include(copy.deepcopy(nodes))
+            self.assertEqual(str(added), str(included))
+            self.assertEqual(added.root_full_hash, included.root_full_hash)
+            self.assertEqual({"add": [], "remove": []},
+                             added.diff(included))
+
+    def test_hash_version(self):
+        nodes = [{'key': ('keyA', 'keyB', 'key%s' % i), 'attr': [i],
+                  'other': {'b': i, 'a': None}} for i in range(5)]
+        nodes.append({'key': ('keyA', 'keyC', 'keyD')})
+        legacy = tree.StructuredHashTree().include(copy.deepcopy(nodes))
+        self.assertEqual(1, legacy.hash_version)
+        data = tree.StructuredHashTree(hash_version=2).include(
+            copy.deepcopy(nodes))
+        data2 = tree.StructuredHashTree(hash_version=2)
+        for node in reversed(copy.deepcopy(nodes)):
+            data2.add(node.pop('key'), **node)
+        self.assertEqual(data, data2)
+        self.assertNotEqual(legacy.root_full_hash, data.root_full_hash)
+        self.assertEqual(64, len(data.root_full_hash))
+        self.assertEqual(2, data.pop(('keyA', 'keyC')).hash_version)
+        data2.remove(('keyA', 'keyC', 'keyD'))
+        self.assertEqual(data, data2)
+
+        # Versions are persisted, legacy trees are serialized as before
+        self.assertNotIn('hash_version', str(legacy))
+        for version, serialized in [(1, str(legacy)), (2, str(data))]:
+            loaded = tree.StructuredHashTree.from_string(serialized)
+            self.assertEqual(version, loaded.hash_version)
+            self.assertEqual(serialized, str(loaded))
+
+        # Trees of different versions are compared node by node
+        self.assertNotEqual(legacy, data)
+        self.assertEqual(
+            {'add': [('keyA', 'keyB', 'key%s' % i) for i in range(5)],
+             'remove': [('keyA', 'keyC', 'keyD')]}, data.diff(legacy))
+
+        # New trees use the configured version
+        cfg.CONF.set_override('hashtree_hash_version', 2, 'aim')
+        self.assertEqual(2, tree.StructuredHashTree().hash_version)
+        self.assertRaises(exc.UnsupportedHashVersion,
+                          tree.StructuredHashTree, hash_version=3)
+
+    def test_snapshot(self):
+        data = tree.StructuredHashTree().include(
+            [{'key': ('keyA', 'keyB', 'key%s' % i), 'attr': i,
+              '_metadata': {'meta': i}} for i in range(5)] +
+            [{'key': ('keyA', 'keyC', 'keyD')}])
+        data.start_journal()
+        expected = str(data)
+        snapshot = data.snapshot()
+        # Nodes are shared
+        self.assertIs(data.root, snapshot.root)
+        self.assertFalse(snapshot.journaled)
+
+        data.add(('keyA', 'keyB', 'key1'), attr='changed',
+                 _metadata={'meta': 'changed'})
+        data.pop(('keyA', 'keyB', 'key2'))
+        data.clear(('keyA', 'keyC', 'keyD'))
+        self.assertEqual(expected, str(snapshot))
+        # Untouched branches are still shared
+        self.assertIs(data.find(('keyA', 'keyB', 'key3')),
+                      snapshot.find(('keyA', 'keyB', 'key3')))
+        self.assertIsNot(data.find(('keyA', 'keyB', 'key1')),
+                         snapshot.find(('keyA', 'keyB', 'key1')))
+        self.assertEqual([('keyA', 'keyB', 'key1')],
+                         snapshot.find_by_metadata('meta', 1))
+        self.assertEqual([], data.find_by_metadata('meta', 1))
+        self.assertEqual(
+            {'add': [('keyA', 'keyB', 'key1'), ('keyA', 'keyB', 'key2'),
+                     ('keyA', 'keyC', 'keyD')], 'remove': []},
+            snapshot.diff(data))
+
+        # Same goes the other way around
+        current = str(data)
+        snapshot.remove(('keyA', 'keyB', 'key3'))
+        snapshot.add(('keyA', 'keyE'))
+        self.assertEqual(current, str(data))
+        # The journal is still complete
+        self.assertEqual(
+            data, tree.StructuredHashTree.from_string(expected).apply_delta(
+                data.get_delta()))
+
+    def test_defer_hashing(self):
+        initial = [{'key': ('keyA', 'keyB', 'key%s' % i), 'attr': i}
+                   for i in range(10)]
+        expected = tree.StructuredHashTree().include(copy.deepcopy(initial))
+        deferred = copy.deepcopy(expected).defer_hashing()
+
+        def apply(data):
+            for i in range(20):
+                data.add(('keyA', 'keyB', 'key%s' % i, 'keyC'), attr=i)
+            data.add(('keyA', 'keyB', 'key3'), attr='changed')
+            data.clear(('keyA', 'keyB', 'key4'))
+            data.pop(('keyA', 'keyB', 'key5', 'keyC'))
+            data.include([{'key': ('keyA', 'keyD')}])
+            return data.pop(('keyA', 'keyB', 'key6'))
+
+        expected_subtree = apply(expected)
+        hash_node = tree.StructuredHashTree._hash_node
+        with mock.patch.object(tree.StructuredHashTree, '_hash_node',
+                               autospec=True,
+                               side_effect=hash_node) as hash_node:
+            subtree = apply(deferred)
+            # Nothing is hashed until needed
+            self.assertEqual(0, hash_node.call_count)
+            self.assertEqual(expected.root_full_hash, deferred.root_full_hash)
+            # Every node is hashed at most once
+            self.assertEqual(
+                len(set(id(x[0][1]) for x in hash_node.call_args_list)),
+                hash_node.call_count)
+        self.assertEqual(expected_subtree, subtree)
+        self.assertEqual(str(expected), str(deferred))
+        # Still deferred
+        deferred.add(('keyA', 'keyB', 'key7'), attr='changed')
+        self.assertNotEqual(expected, deferred)
+        expected.add(('keyA', 'keyB', 'key7'), attr='changed')
+        self.assertEqual(expected, deferred)
+        self.assertEqual({"add": [], "remove": []}, deferred.diff(expected))
+
     def test_pop(self):
         data = tree.StructuredHashTree()
         self.assertIsNone(data.pop(('keyA',)))
@@ -629,6 +822,159 @@ class TestStructuredHashTree(base.BaseTestCase):
         self.assertEqual({"add": [], "remove": []}, data2.diff(data))
         self.assertEqual({"add": [], "remove": []}, data.diff(data2))
 
+    def test_metadata_index(self):
+        data = tree.StructuredHashTree().include(
+            [{'key': ('keyA', 'keyB'), '_metadata': {'pending': True}},
+             {'key': ('keyA', 'keyC'), '_metadata': {'pending': False}},
+             {'key': ('keyA', 'keyC', 'keyD'),
+              '_metadata': {'attributes': {'foo': 'bar'}}}])
+        self.assertEqual([('keyA', 'keyB')],
+                         data.find_by_metadata('pending', True))
+        self.assertEqual([('keyA', 'keyC', 'keyD')],
+                         data.find_no_metadata('pending'))
+        # Unhashable values can be looked up as well
+        self.assertEqual([('keyA', 'keyC', 'keyD')],
+                         data.find_by_metadata('attributes', {'foo': 'bar'}))
+        # The index follows the changes of the tree
+        data.add(('keyA', 'keyC', 'keyD'), _metadata={'pending': True})
+        data.add(('keyA', 'keyE'))
+        data.clear(('keyA', 'keyB'))
+        self.assertEqual([('keyA', 'keyC', 'keyD')],
+                         data.find_by_metadata('pending', True))
+        self.assertEqual([('keyA', 'keyE')], data.find_no_metadata('pending'))
+        data.pop(('keyA', 'keyC'))
+        self.assertEqual([], data.find_by_metadata('pending', True))
+        self.assertEqual([], data.find_by_metadata('pending', False))
+        data.add(('keyA', 'keyE'), _metadata=None)
+        data.add(('keyA', 'keyB'), _metadata={'pending': False})
+        self.assertEqual([('keyA', 'keyB')],
+                         data.find_by_metadata('pending', False))
+        self.assertEqual([('keyA', 'keyE')], data.find_no_metadata('pending'))
+        data.pop(('keyA',))
+        self.assertEqual([], data.find_no_metadata('pending'))
+        # Nodes lacking a key are tracked on their own after the first lookup
+        data = tree.StructuredHashTree().include(
+            [{'key': ('keyA', 'key%s' % i), '_metadata': {'pending': True}}
+             for i in range(10)] + [{'key': ('keyA', 'keyZ')}])
+        self.assertEqual([('keyA', 'keyZ')], data.find_no_metadata('pending'))
+        self.assertEqual(1, len(data._missing_index['pending']))
+        data.add(('keyA', 'key0'), _metadata=None)
+        data.add(('keyA', 'key0'), _metadata={'other': True})
+        data.add(('keyA', 'key1'), _metadata=None)
+        data.pop(('keyA', 'keyZ'))
+        self.assertEqual([('keyA', 'key0'), ('keyA', 'key1')],
+                         data.find_no_metadata('pending'))
+        self.assertEqual(2, len(data._missing_index['pending']))
+
+    def test_delta(self):
+        data = tree.StructuredHashTree().include(
+            [{'key': ('keyA', 'keyB'), '_metadata': {'a': 1}},
+             {'key': ('keyA', 'keyC'), 'foo': 'bar'},
+             {'key': ('keyA', 'keyC', 'keyD')},
+             {'key': ('keyA', 'keyE', 'keyF')}])
+        base_tree = tree.StructuredHashTree.from_string(str(data))
+        self.assertFalse(data.journaled)
+        data.start_journal()
+        self.assertEqual([], data.get_delta())
+        data.add(('keyA', 'keyB'), _metadata={'b': 2}, _error=True)
+        data.add(('keyA', 'keyG', 'keyH'), foo='bar')
+        data.clear(('keyA', 'keyE', 'keyF'))
+        data.pop(('keyA', 'keyC'))
+        delta = data.get_delta()
+        self.assertEqual(('keyA',), delta[0]['key'])
+        self.assertEqual([{'key': ('keyA', 'keyC', 'keyD')}], delta[-1:])
+        # Deltas survive serialization
+        delta = utils.json_loads(utils.json_dumps(delta))
+        self.assertEqual(data, base_tree.apply_delta(delta))
+        self.assertEqual(str(data), str(base_tree))
+        # Applied deltas can be tracked as well
+        base_tree.start_journal()
+        base_tree.apply_delta([{'key': ['keyA']}])
+        self.assertIsNone(base_tree.root)
+        self.assertEqual([{'key': ('keyA',)}], base_tree.get_delta())
+        # Nodes can't be placed in a different root
+        self.assertRaises(
+            exc.MultipleRootTreeError, base_tree.apply_delta,
+            delta + [{'key': ['keyB'], 'partial_hash': 'a', 'dummy': False,
+                      'error': False, 'metadata': {}}])
+
+
+class TestHashTreeCodec(base.BaseTestCase):
+
+    def _get_tree(self):
+        return tree.StructuredHashTree().include(
+            [{'key': ('keyA', 'keyB'), '_metadata': {'a': 20}},
+             {'key': ('keyA', 'keyC'), '_metadata': {'b': False},
+              '_error': True},
+             {'key': ('keyA', 'keyC', 'keyD'), 'foo': 'bar'}])
+
+    def test_round_trip(self):
+        data = self._get_tree()
+        for compression in [codec.COMPRESSION_NONE, codec.COMPRESSION_ZLIB]:
+            encoded = codec.dumps(data, compression=compression)
+            self.assertTrue(codec.is_encoded(encoded))
+            data2 = codec.loads(encoded)
+            self.assertEqual(data, data2)
+            # All the node attributes are preserved
+            self.assertEqual(str(data), str(data2))
+
+    def test_list_keys(self):
+        data = tree.StructuredHashTree().include(
+            [{'key': (['keyA', ], ['keyB', 'keykeyB'])},
+             {'key': (['keyA', ], ['keyC', 'keykeyC'])},
+             {'key': (['keyA', ], ['keyC', 'keykeyC'], ['keyD', ])}])
+        data2 = codec.loads(codec.dumps(data))
+        self.assertEqual(data, data2)
+        self.assertEqual(str(data), str(data2))
+
+    def test_empty_tree(self):
+        data = codec.loads(codec.dumps(tree.StructuredHashTree()),
+                           root_key=('keyA',))
+        self.assertIsNone(data.root)
+        self.assertEqual(('keyA',), data.root_key)
+
+    def test_tree_klass(self):
+        class TreeSubclass(tree.StructuredHashTree):
+            pass
+
+        data = codec.loads(codec.dumps(self._get_tree()),
+                           tree_klass=TreeSubclass)
+        self.assertIsInstance(data, TreeSubclass)
+        self.assertEqual(self._get_tree(), data)
+        data = codec.loads(codec.dumps(tree.StructuredHashTree()),
+                           root_key=('keyA',), tree_klass=TreeSubclass)
+        self.assertIsInstance(data, TreeSubclass)
+
+    def test_compact(self):
+        data = self._get_tree()
+        for i in range(100):
+            data.add(('keyA', 'keyB', 'key%s' % i), attr='value')
+        self.assertTrue(len(codec.dumps(data)) < len(str(data)) / 2)
+        self.assertTrue(
+            len(codec.dumps(data, compression=codec.COMPRESSION_ZLIB)) <
+            len(codec.dumps(data)))
+
+    def test_hash_version(self):
+        data = tree.StructuredHashTree(hash_version=2).include(
+            [{'key': ('keyA', 'keyB'), 'attr': 'value'},
+             {'key': ('keyA', 'keyC', 'keyD')}])
+        for compression in [codec.COMPRESSION_NONE, codec.COMPRESSION_ZLIB]:
+            data2 = codec.loads(codec.dumps(data, compression=compression))
+            self.assertEqual(2, data2.hash_version)
+            self.assertEqual(str(data), str(data2))
+        data2 = codec.loads(codec.dumps(tree.StructuredHashTree().include(
+            [{'key': ('keyA', 'keyB')}])))
+        self.assertEqual(1, data2.hash_version)
+
+    def test_legacy_format(self):
+        self.assertFalse(codec.is_encoded(str(self._get_tree()).encode()))
+        self.assertFalse(codec.is_encoded(b'{}'))
+        self.assertRaises(exc.UnsupportedTreeEncoding, codec.loads, b'{}')
+        encoded = bytearray(codec.dumps(self._get_tree()))
+        encoded[len(codec.MAGIC)] = codec.VERSION + 1
+        self.assertRaises(exc.UnsupportedTreeEncoding, codec.loads,
+                          bytes(encoded))
+
 
 class TestHashTreeExceptions(base.BaseTestCase):
 
@@ -704,6 +1050,96 @@ class TestHashTreeManager(base.TestAimDBBase):
         self.assertEqual(data2, found['keyA1'])
         self.assertEqual(data2, found2['keyA1'])
 
+    def test_update_binary_format(self):
+        data = tree.StructuredHashTree().include(
+            [{'key': ('keyA', 'keyB')}, {'key': ('keyA', 'keyC')},
+             {'key': ('keyA', 'keyC', 'keyD')}])
+        # Stored in the legacy format
+        self.mgr.update(self.ctx, data)
+        self.set_override('hashtree_db_format', 'binary', 'aim')
+        self.set_override('hashtree_db_compression', 'zlib', 'aim')
+        self.assertEqual(data, self.mgr.get(self.ctx, 'keyA'))
+        # Stored in the binary format
+        data.add(('keyA', 'keyF'), test='test')
+        self.mgr.update(self.ctx, data)
+        if self.ctx.store.supports_sql:
+            db_obj = self.mgr._find_query(self.ctx, tree_manager.CONFIG_TREE,
+                                          root_rn='keyA')[0]
+            self.assertTrue(codec.is_encoded(db_obj.tree))
+        self.assertEqual(data, self.mgr.get(self.ctx, 'keyA'))
+        self.assertEqual(data, self.mgr.find(self.ctx, root_rn=['keyA'])[0])
+
+        # The manager's tree class is honored regardless of the format
+        class TreeSubclass(tree.StructuredHashTree):
+            pass
+
+        mgr = tree_manager.TreeManager(TreeSubclass)
+        self.assertIsInstance(mgr.get(self.ctx, 'keyA'), TreeSubclass)
+        # Back to the legacy format
+        self.set_override('hashtree_db_format', 'json', 'aim')
+        self.assertEqual(data, self.mgr.get(self.ctx, 'keyA'))
+
+    def test_update_incremental(self):
+        self.set_override('hashtree_max_deltas', 2, 'aim')
+        data = tree.StructuredHashTree().include(
+            [{'key': ('keyA', 'keyB')}, {'key': ('keyA', 'keyC')}])
+        self.mgr.update(self.ctx, data)
+        cache = {}
+        self.assertEqual(
+            {'keyA': data}, self.mgr.find_changed(self.ctx, {'keyA': None},
+                                                  cache=cache))
+        for i in range(4):
+            data = self.mgr.get(self.ctx, 'keyA')
+            self.assertTrue(data.journaled)
+            data.add(('keyA', 'keyC', 'key%s' % i), attr=i)
+            data.clear(('keyA', 'keyB'))
+            self.mgr.update(self.ctx, data)
+            self.assertEqual(data, self.mgr.get(self.ctx, 'keyA'))
+            self.assertEqual(data, self.mgr.find(self.ctx,
+                                                 root_rn=['keyA'])[0])
+            self.assertEqual(
+                {'keyA': data}, self.mgr.find_changed(
+                    self.ctx, {'keyA': None}, cache=cache))
+        if self.ctx.store.supports_sql:
+            db_session = self.ctx.store.db_session
+            # Deltas got merged into the tree after reaching the limit
+            self.assertEqual(
+                1, db_session.query(tree_model.TreeDelta).count())
+            # Deltas are gone with their tree
+            self.mgr.delete_by_root_rn(self.ctx, 'keyA')
+            self.assertEqual(
+                0, db_session.query(tree_model.TreeDelta).count())
+
+    def test_find_changed_no_snapshot(self):
+        if not self.ctx.store.supports_sql:
+            self.skipTest('Snapshots are only used by SQL stores')
+        data = tree.StructuredHashTree().include(
+            [{'key': ('keyA', 'keyB')}, {'key': ('keyA', 'keyC')}])
+        self.mgr.update(self.ctx, data)
+        # Trees stored before the upgrade have no snapshot
+        db_type = self.ctx.store.resource_to_db_type(
+            tree_manager.CONFIG_TREE)
+        with self.ctx.store.begin(subtransactions=True):
+            self.ctx.store.db_session.query(db_type).update(
+                {'snapshot_id': None}, synchronize_session=False)
+        cache = {}
+        root_map = {'keyA': data.root_full_hash}
+        self.assertEqual({'keyA': data}, self.mgr.find_changed(
+            self.ctx, {'keyA': None}, cache=cache))
+        # Unchanged trees aren't loaded again
+        with mock.patch.object(self.mgr, '_load_trees') as load:
+            self.assertEqual({}, self.mgr.find_changed(self.ctx, root_map,
+                                                       cache=cache))
+            self.assertFalse(load.called)
+        # Changed ones are reloaded from scratch
+        data.add(('keyA', 'keyD'))
+        self.mgr.update(self.ctx, data)
+        with self.ctx.store.begin(subtransactions=True):
+            self.ctx.store.db_session.query(db_type).update(
+                {'snapshot_id': None}, synchronize_session=False)
+        self.assertEqual({'keyA': data}, self.mgr.find_changed(
+            self.ctx, root_map, cache=cache))
+
     def test_deleted(self):
         data = tree.StructuredHashTree().include(
             [{'key': ('keyA', 'keyB')}, {'key': ('keyA', 'keyC')},
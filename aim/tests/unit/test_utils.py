@@ -20,8 +20,13 @@ test_utils
 Tests for `utils` module.
 """
 
+import threading
+import time
+
+from apicapi import apic_client
 import mock
 
+from aim.api import resource
 from aim.common import utils as internal_utils
 from aim.tests import base
 from aim import utils
@@ -106,6 +111,66 @@ class TestUtils(base.TestAimDBBase):
              ('vzInTerm', 'intmnl'), ('vzRsFiltAtt', 'p')],
             internal_utils.decompose_dn(type, dn))
 
+    def test_lru_cache(self):
+        cache = internal_utils.LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(1, cache.get('a'))
+        # b is the least recently used now
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(1, cache.get('a'))
+        self.assertEqual(3, cache.get('c'))
+        self.assertEqual({'size': 2, 'hits': 3, 'misses': 1}, cache.stats())
+        cache.clear()
+        self.assertEqual({'size': 0, 'hits': 0, 'misses': 0}, cache.stats())
+
+    def test_dn_caches(self):
+        dn = 'uni/tn-common/brc-p/subj-p/intmnl/rsfiltAtt-p'
+        type = 'vzRsFiltAtt'
+        key = ('fvTenant|common', 'vzBrCP|p', 'vzSubj|p', 'vzInTerm|intmnl',
+               'vzRsFiltAtt|p')
+        hits = internal_utils.get_dn_cache_stats()['keys']['hits']
+        self.assertEqual(key, internal_utils.dn_to_key(type, dn))
+        self.assertEqual(key, internal_utils.dn_to_key(type, dn))
+        self.assertEqual(hits + 1,
+                         internal_utils.get_dn_cache_stats()['keys']['hits'])
+        mo, rns = internal_utils.aci_decompose_dn_guess(dn, type)
+        # Callers get their own copy of the cached decomposition
+        rns.pop()
+        self.assertEqual(
+            [('fvTenant', 'common'), ('vzBrCP', 'p'), ('vzSubj', 'p'),
+             ('vzInTerm', 'intmnl'), ('vzRsFiltAtt', 'p')],
+            internal_utils.aci_decompose_dn_guess(dn, type)[1])
+        self.assertEqual(dn, internal_utils.build_dn(
+            [x.split('|') for x in key]))
+        self.assertEqual(dn, internal_utils.build_dn(
+            [x.split('|') for x in key]))
+        # Failures aren't cached
+        self.assertIsNone(internal_utils.dn_to_key(type, 'uni/tn-common'))
+        self.assertRaises(apic_client.DNManager.InvalidNameFormat,
+                          internal_utils.aci_decompose_dn_guess,
+                          'uni/tn-common', type)
+
+    def test_mo_dn_cache(self):
+        self.assertIs(internal_utils.get_mo_class('fvAEPg'),
+                      internal_utils.get_mo_class('fvAEPg'))
+        hits = internal_utils.get_dn_cache_stats()['mo_dns']['hits']
+        self.assertEqual('uni/tn-t/ap-a/epg-e',
+                         internal_utils.mo_dn('fvAEPg', 't', 'a', 'e'))
+        self.assertEqual('uni/tn-t/ap-a/epg-e',
+                         internal_utils.mo_dn('fvAEPg', 't', 'a', 'e'))
+        self.assertEqual(hits + 1,
+                         internal_utils.get_dn_cache_stats()['mo_dns']['hits'])
+        # The cache is keyed by identity, changing it yields a new DN
+        epg = resource.EndpointGroup(tenant_name='t', app_profile_name='a',
+                                     name='e')
+        self.assertEqual('uni/tn-t/ap-a/epg-e', epg.dn)
+        epg.name = 'f'
+        self.assertEqual('uni/tn-t/ap-a/epg-f', epg.dn)
+        self.assertEqual('epg-f', epg.rn)
+        self.assertEqual('tn-t', epg.root)
+
     @internal_utils.rlock('test')
     def locked_func(self):
         with internal_utils.get_rlock('test2'):
@@ -118,3 +183,28 @@ class TestUtils(base.TestAimDBBase):
         self.assertTrue('test' in internal_utils.all_locks)
         self.assertTrue('test2' in internal_utils.all_locks)
         self.assertEqual(2, len(internal_utils.all_locks))
+
+    def test_run_in_parallel(self):
+        threads = set()
+
+        def square(x):
+            threads.add(threading.current_thread())
+            time.sleep(0.01)
+            return x * x
+
+        self.assertEqual([x * x for x in range(10)],
+                         internal_utils.run_in_parallel(square, range(10), 3))
+        self.assertEqual(3, len(threads))
+        self.assertEqual([], internal_utils.run_in_parallel(square, [], 3))
+
+        def fail(x):
+            threads.add(x)
+            if x in [3, 5]:
+                raise ValueError(x)
+
+        threads = set()
+        error = self.assertRaises(ValueError, internal_utils.run_in_parallel,
+                                  fail, range(10), 3)
+        self.assertEqual((3,), error.args)
+        # All the items are processed anyway
+        self.assertEqual(set(range(10)), threads)
@@ -0,0 +1,86 @@
+# Copyright (c) 2020 Cisco Systems
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""AIM/ACI model conversion micro benchmarks.
+
+Usage: python -m aim.tools.benchmarks.converter [number of EPGs]
+"""
+
+import copy
+import sys
+import time
+
+from aim.agent.aid.universes.aci import converter
+from aim.api import resource
+
+
+def _timed(funct, *args):
+    start = time.time()
+    funct(*args)
+    return time.time() - start
+
+
+def _get_resources(count):
+    result = []
+    for i in range(count):
+        contract = 'c-%s' % i
+        l3out = 'l3out-%s' % i
+        result.extend([
+            resource.BridgeDomain(
+                tenant_name='t', name='bd-%s' % i, vrf_name='vrf',
+                l3out_names=[l3out], display_name='bd %s' % i),
+            resource.EndpointGroup(
+                tenant_name='t', app_profile_name='ap', name='epg-%s' % i,
+                bd_name='bd-%s' % i, provided_contract_names=[contract],
+                consumed_contract_names=[contract],
+                vmm_domains=[{'type': 'OpenStack', 'name': 'ostack'}],
+                physical_domains=[{'name': 'phys'}],
+                static_paths=[{'path': 'topology/pod-1/paths-101/'
+                                       'pathep-[eth1/%s]' % (i % 48),
+                               'encap': 'vlan-%s' % (i % 4000 + 1)}]),
+            resource.Contract(tenant_name='t', name=contract,
+                              scope='tenant'),
+            resource.ContractSubject(tenant_name='t', contract_name=contract,
+                                     name='s', bi_filters=['f-%s' % i]),
+            resource.L3Outside(tenant_name='t', name=l3out, vrf_name='vrf',
+                               l3_domain_dn='uni/l3dom-ext'),
+            resource.ExternalNetwork(
+                tenant_name='t', l3out_name=l3out, name='net',
+                provided_contract_names=[contract]),
+            resource.L3OutNodeProfile(tenant_name='t', l3out_name=l3out,
+                                      name='np')])
+    return result
+
+
+def convert_benchmark(count):
+    aim_objects = _get_resources(count)
+    aci_objects = []
+    to_aci = _timed(lambda: aci_objects.extend(
+        converter.AimToAciModelConverter().convert(aim_objects)))
+    aci_copy = copy.deepcopy(aci_objects)
+    to_aim = _timed(converter.AciToAimModelConverter().convert, aci_copy)
+    return len(aim_objects), to_aci, len(aci_objects), to_aim
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    aim_count, to_aci, aci_count, to_aim = convert_benchmark(count)
+    print("EPG/BD/Contract/L3Out, %s EPGs" % count)
+    print("  %-12s AIM to ACI: %8.0f ops/s  ACI to AIM: %8.0f ops/s" % (
+        '', aim_count / to_aci, aci_count / to_aim))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+# Copyright (c) 2020 Cisco Systems
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""AIM DB micro benchmarks, run against an in-memory SQLite DB.
+
+Usage: python -m aim.tools.benchmarks.db [number of objects]
+"""
+
+import sys
+import time
+
+import sqlalchemy as sa
+from sqlalchemy import orm
+
+from aim import aim_manager
+from aim.api import resource
+from aim import aim_store
+from aim import context
+from aim.db import model_base
+from aim.db import models
+
+
+def _timed(funct, *args):
+    start = time.time()
+    funct(*args)
+    return time.time() - start
+
+
+def _get_context():
+    engine = sa.create_engine('sqlite://')
+    model_base.Base.metadata.create_all(engine)
+    session = orm.sessionmaker(bind=engine, autocommit=True)()
+    return context.AimContext(store=aim_store.SqlAlchemyStore(session))
+
+
+def _populate(ctx, count):
+    # Bypass the ORM, only reading the objects back is measured
+    rows = [{'tenant_name': 'common', 'name': 'bd-%s' % i,
+             'vrf_name': 'default', 'enable_arp_flood': True,
+             'enable_routing': True, 'limit_ip_learn_to_subnets': False,
+             'ip_learning': True, 'l2_unknown_unicast_mode': 'proxy',
+             'ep_move_detect_mode': 'garp', 'display_name': '',
+             'monitored': False} for i in range(count)]
+    with ctx.store.begin(subtransactions=True):
+        ctx.store.db_session.execute(
+            models.BridgeDomain.__table__.insert(), rows)
+
+
+def _to_attr(session, db_objs):
+    for db_obj in db_objs:
+        db_obj.to_attr(session)
+
+
+def find_benchmark(count):
+    ctx = _get_context()
+    _populate(ctx, count)
+    mgr = aim_manager.AimManager()
+    found = []
+    find = _timed(
+        lambda: found.append(mgr.find(ctx, resource.BridgeDomain)))
+    assert len(found[0]) == count
+    session = ctx.store.db_session
+    db_objs = session.query(models.BridgeDomain).all()
+    to_attr = _timed(_to_attr, session, db_objs)
+    return find, to_attr
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    find, to_attr = find_benchmark(count)
+    print("BridgeDomain, %s objects" % count)
+    print("  %-12s find: %8.0f ops/s  to_attr: %8.0f ops/s" % (
+        '', count / find, count / to_attr))
+
+
+if __name__ == '__main__':
+    main()
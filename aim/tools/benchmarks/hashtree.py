@@ -0,0 +1,149 @@
+# Copyright (c) 2020 Cisco Systems
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Hash tree micro benchmarks.
+
+Usage: python -m aim.tools.benchmarks.hashtree [fan-out]
+"""
+
+import random
+import sys
+import time
+
+from aim import aim_manager
+from aim.api import resource
+from aim.common.hashtree import structured_tree
+from aim import tree_manager
+
+
+def _timed(funct, *args):
+    start = time.time()
+    funct(*args)
+    return time.time() - start
+
+
+def _children_add(klass, nodes):
+    children = klass()
+    for node in nodes:
+        children.add(node)
+    # Iterate once, as hashing would
+    list(children)
+    return children
+
+
+def _children_find(children, keys):
+    for key in keys:
+        children.get(key)
+
+
+def _tree_add(keys, deferred=False):
+    tree = structured_tree.StructuredHashTree()
+    if deferred:
+        tree.defer_hashing()
+    for key in keys:
+        tree.add(key, attr='value')
+    return tree
+
+
+def _tree_include(keys, hash_version=None):
+    return structured_tree.StructuredHashTree(
+        hash_version=hash_version).include(
+        {'key': x, 'attr': 'value'} for x in keys)
+
+
+def _tree_copy(tree, times):
+    for _ in range(times):
+        structured_tree.StructuredHashTree.from_string(str(tree))
+
+
+def _tree_snapshot(tree, keys):
+    # Copy, then modify the source as the event loop would
+    for key in keys:
+        tree.snapshot()
+        tree.add(key, attr='other')
+
+
+def _tree_find(tree, keys):
+    for key in keys:
+        tree.find(key)
+
+
+def children_benchmark(fan_out):
+    keys = [('fvTenant|t', 'fvAp|ap', 'fvAEPg|epg-%s' % i)
+            for i in range(fan_out)]
+    random.shuffle(keys)
+    nodes = [structured_tree.StructuredTreeNode(x) for x in keys]
+    result = []
+    for klass in [structured_tree.ChildrenList, structured_tree.ChildrenMap]:
+        children = []
+        add = _timed(lambda: children.append(_children_add(klass, nodes)))
+        find = _timed(_children_find, children[0], keys)
+        result.append((klass.__name__, add, find))
+    return result
+
+
+def tree_benchmark(fan_out):
+    keys = [('fvTenant|t', 'fvAp|ap', 'fvAEPg|epg-%s' % i)
+            for i in range(fan_out)]
+    random.shuffle(keys)
+    trees = []
+    add = _timed(lambda: trees.append(_tree_add(keys)))
+    include = _timed(_tree_include, keys)
+    include_v2 = _timed(_tree_include, keys,
+                        structured_tree.Blake2bHasher.version)
+    deferred = _timed(lambda: _tree_add(keys, deferred=True).root_full_hash)
+    find = _timed(_tree_find, trees[0], keys)
+    copies = max(fan_out // 1000, 1)
+    copy = _timed(_tree_copy, trees[0], copies) / copies
+    snapshot = _timed(_tree_snapshot, trees[0], keys) / len(keys)
+    return add, include, include_v2, deferred, find, copy, snapshot
+
+
+def builder_benchmark(fan_out):
+    resources = [resource.EndpointGroup(
+        tenant_name='t', app_profile_name='ap', name='epg-%s' % i,
+        bd_name='bd', provided_contract_names=['c'],
+        consumed_contract_names=['c']) for i in range(fan_out)]
+    builder = tree_manager.HashTreeBuilder(aim_manager.AimManager())
+    tree_map = dict(
+        (x, {'tn-t': structured_tree.StructuredHashTree()})
+        for x in [builder.CONFIG, builder.OPER, builder.MONITOR])
+    return _timed(builder.build, resources, [], [], tree_map)
+
+
+def main():
+    fan_out = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    print("Children of a single node, fan-out %s" % fan_out)
+    for name, add, find in children_benchmark(fan_out):
+        print("  %-12s add: %8.0f ops/s  find: %8.0f ops/s" % (
+            name, fan_out / add, fan_out / find))
+    (add, include, include_v2, deferred, find, copy,
+     snapshot) = tree_benchmark(fan_out)
+    print("StructuredHashTree, fan-out %s" % fan_out)
+    print("  %-12s add: %8.0f ops/s  find: %8.0f ops/s" % (
+        '', fan_out / add, fan_out / find))
+    print("  %-12s include: %8.0f ops/s  deferred add: %8.0f ops/s" % (
+        '', fan_out / include, fan_out / deferred))
+    print("  %-12s include, hash version 2: %8.0f ops/s" % (
+        '', fan_out / include_v2))
+    print("  %-12s copy: %8.0f ops/s  snapshot and add: %8.0f ops/s" % (
+        '', 1 / copy, 1 / snapshot))
+    build = builder_benchmark(fan_out)
+    print("HashTreeBuilder, %s EPGs" % fan_out)
+    print("  %-12s build: %8.0f ops/s" % ('', fan_out / build))
+
+
+if __name__ == '__main__':
+    main()
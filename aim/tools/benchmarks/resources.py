@@ -0,0 +1,92 @@
+# Copyright (c) 2020 Cisco Systems
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""AIM resource hashing and comparison micro benchmarks.
+
+Usage: python -m aim.tools.benchmarks.resources [number of resources]
+"""
+
+import sys
+import time
+
+from aim.api import resource
+
+
+def _timed(funct, *args):
+    start = time.time()
+    funct(*args)
+    return time.time() - start
+
+
+def _get_resources(count, name='epg-%s'):
+    contracts = ['c-%s' % x for x in range(5)]
+    return [
+        resource.EndpointGroup(
+            tenant_name='t', app_profile_name='ap', name=name % i,
+            bd_name='bd', provided_contract_names=list(contracts),
+            consumed_contract_names=list(contracts),
+            static_paths=[{'path': 'topology/pod-1/paths-101/pathep-[eth1/1]',
+                           'encap': 'vlan-%s' % (i % 4000 + 1)}])
+        for i in range(count)]
+
+
+def _digest(resources):
+    for res in resources:
+        res.hash
+
+
+def _user_equal(resources, others):
+    for res, other in zip(resources, others):
+        res.user_equal(other)
+
+
+def set_benchmark(count):
+    resources = _get_resources(count)
+    others = _get_resources(count)
+    seen = set()
+    add = _timed(lambda: [seen.add(x) for x in resources])
+    lookup = _timed(lambda: [x in seen for x in others])
+    digest = _timed(_digest, resources)
+    return add, lookup, digest
+
+
+def user_equal_benchmark(count):
+    resources = _get_resources(count)
+    equal = _timed(_user_equal, resources, _get_resources(count))
+    # Same lists, shuffled
+    others = _get_resources(count)
+    for other in others:
+        other.provided_contract_names.reverse()
+    shuffled = _timed(_user_equal, resources, others)
+    different = _timed(_user_equal, resources,
+                       _get_resources(count, name='other-%s'))
+    return equal, shuffled, different
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    add, lookup, digest = set_benchmark(count)
+    print("EndpointGroup, %s resources" % count)
+    print("  %-12s set add: %8.0f ops/s  set lookup: %8.0f ops/s" % (
+        '', count / add, count / lookup))
+    print("  %-12s content digest: %8.0f ops/s" % ('', count / digest))
+    equal, shuffled, different = user_equal_benchmark(count)
+    print("  %-12s user_equal, equal: %8.0f ops/s  shuffled: %8.0f ops/s  "
+          "different: %8.0f ops/s" % ('', count / equal, count / shuffled,
+                                      count / different))
+
+
+if __name__ == '__main__':
+    main()
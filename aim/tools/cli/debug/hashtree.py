@@ -67,13 +67,21 @@ def dump(ctx, tenant, flavor):
 
 @hashtree.command(name='reset')
 @click.option('--tenant', '-t')
+@click.option('--concurrency', '-c', type=int, default=1,
+              help='Number of roots reset in parallel when no tenant is '
+                   'specified')
 @click.pass_context
-def reset(ctx, tenant):
-    _reset(ctx, tenant)
+def reset(ctx, tenant, concurrency):
+    _reset(ctx, tenant, concurrency=concurrency)
 
 
-def _reset(ctx, tenant):
+def _reset(ctx, tenant, concurrency=1):
     mgr = ctx.obj['manager']
     aim_ctx = ctx.obj['aim_ctx']
     listener = hashtree_db_listener.HashTreeDbListener(mgr)
-    listener.reset(aim_ctx.store, tenant)
+    if tenant or concurrency <= 1:
+        listener.reset(aim_ctx.store, tenant)
+    else:
+        listener.reset_roots(
+            aim_ctx.store, concurrency=concurrency,
+            store_factory=lambda: api.get_store(expire_on_commit=True))
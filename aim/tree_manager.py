@@ -13,6 +13,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
 import copy
 
 from oslo_log import log as logging
@@ -20,9 +21,11 @@ from oslo_log import log as logging
 from aim.agent.aid.universes.aci import converter
 from aim.api import status as aim_status
 from aim.api import tree as tree_res
+from aim.common.hashtree import codec
 from aim.common.hashtree import exceptions as exc
 from aim.common.hashtree import structured_tree
 from aim.common import utils
+from aim import config as aim_cfg
 from aim.db import tree_model
 
 from apicapi import apic_client
@@ -35,6 +38,15 @@ CONFIG_TREE = tree_res.ConfigTree
 OPERATIONAL_TREE = tree_res.OperationalTree
 MONITORED_TREE = tree_res.MonitoredTree
 SUPPORTED_TREES = [CONFIG_TREE, OPERATIONAL_TREE, MONITORED_TREE]
+TREE_FORMAT_JSON = 'json'
+TREE_FORMAT_BINARY = 'binary'
+# Changes touching more nodes than this are merged right away into the tree
+MAX_DELTA_NODES = 1000
+
+# Tree kept in memory by readers, along with the version it was loaded from
+CachedTree = collections.namedtuple(
+    'CachedTree', ['snapshot_id', 'delta_id', 'epoch', 'root_full_hash',
+                   'tree'])
 
 
 class TreeManager(object):
@@ -54,7 +66,8 @@ class TreeManager(object):
             for obj in db_objs:
                 hash_tree = trees.pop(obj.root_rn)
                 obj.root_full_hash = hash_tree.root_full_hash
-                obj.tree = str(hash_tree).encode('utf-8')
+                if not self._add_delta(context, tree, obj, hash_tree):
+                    self._set_snapshot(context, tree, obj, hash_tree)
                 context.store.add(obj)
 
             for hash_tree in trees.values():
@@ -68,14 +81,18 @@ class TreeManager(object):
                         # Then put the updated tree in it
                         self._create_if_not_exist(
                             context, tree_klass, root_rn,
-                            tree=str(hash_tree).encode('utf-8'),
-                            root_full_hash=hash_tree.root_full_hash or 'none')
+                            tree=self._serialize_tree(context, hash_tree),
+                            root_full_hash=hash_tree.root_full_hash or 'none',
+                            snapshot_id=utils.generate_uuid())
+                        if hash_tree.journaled:
+                            hash_tree.start_journal()
                     else:
                         # Attempt to create an empty tree:
                         self._create_if_not_exist(
                             context, tree_klass, root_rn,
-                            tree=str(empty_tree).encode('utf-8'),
-                            root_full_hash=empty_tree.root_full_hash or 'none')
+                            tree=self._serialize_tree(context, empty_tree),
+                            root_full_hash=empty_tree.root_full_hash or 'none',
+                            snapshot_id=utils.generate_uuid())
 
     def get_base_tree(self, context, root_rn, lock_update=False):
         db_objs = self._find_query(context, ROOT_TREE, lock_update=lock_update,
@@ -91,6 +108,7 @@ class TreeManager(object):
                                            in_={'root_rn': root_rns})
                 for db_obj in db_objs:
                     context.store.delete(db_obj)
+            self._delete_deltas(context, root_rns=root_rns)
 
     @utils.log
     def delete_all(self, context):
@@ -99,6 +117,7 @@ class TreeManager(object):
                 db_objs = self._find_query(context, type, lock_update=True)
                 for db_obj in db_objs:
                     context.store.delete(db_obj)
+            self._delete_deltas(context)
 
     def update(self, context, hash_tree, tree=CONFIG_TREE):
         return self.update_bulk(context, [hash_tree], tree=tree)
@@ -126,7 +145,7 @@ class TreeManager(object):
                 obj = self._find_query(context, tree_type, root_rn=root_rn,
                                        lock_update=True)
                 if obj:
-                    obj[0].tree = str(empty_tree).encode('utf-8')
+                    self._set_snapshot(context, tree_type, obj[0], empty_tree)
                     context.store.add(obj[0])
             obj = self._find_query(context, ROOT_TREE, root_rn=root_rn,
                                    lock_update=True)
@@ -142,7 +161,7 @@ class TreeManager(object):
                 db_objs = self._find_query(context, tree_type,
                                            lock_update=True)
                 for db_obj in db_objs:
-                    db_obj.tree = str(empty_tree).encode('utf-8')
+                    self._set_snapshot(context, tree_type, db_obj, empty_tree)
                     context.store.add(db_obj)
             db_objs = self._find_query(context, ROOT_TREE, lock_update=True)
             for db_obj in db_objs:
@@ -152,31 +171,98 @@ class TreeManager(object):
     @utils.log
     def find(self, context, tree=CONFIG_TREE, **kwargs):
         result = self._find_query(context, tree, in_=kwargs)
-        return [self.tree_klass.from_string(
-            str(x.tree.decode('utf-8')),
-            self.root_key_funct(x.root_rn)) for x in result]
+        return list(self._load_trees(context, tree, result).values())
 
     @utils.log
     def get(self, context, root_rn, lock_update=False, tree=CONFIG_TREE):
-        try:
-            return self.tree_klass.from_string(str(
-                self._find_query(context, tree, lock_update=lock_update,
-                                 root_rn=root_rn)[0].tree.decode('utf-8')),
-                self.root_key_funct(root_rn))
-        except IndexError:
+        """Get the tree of a specific root.
+
+        The returned tree keeps track of its changes, so that they can be
+        stored incrementally when the tree is updated.
+        """
+        db_objs = self._find_query(context, tree, lock_update=lock_update,
+                                   root_rn=root_rn)
+        if not db_objs:
             raise exc.HashTreeNotFound(root_rn=root_rn)
+        hash_tree = self._load_trees(context, tree, db_objs)[root_rn]
+        hash_tree.start_journal()
+        return hash_tree
 
     @utils.log
-    def find_changed(self, context, root_map, tree=CONFIG_TREE):
+    def find_changed(self, context, root_map, tree=CONFIG_TREE, cache=None):
+        """Find the trees whose hash differs from the given one.
+
+        :param root_map: dictionary of root_rn -> root_full_hash
+        :param tree: type of the tree
+        :param cache: optional dictionary owned by the caller, and initially
+        empty, of root_rn -> CachedTree. It's filled with the trees found,
+        which are brought up to date by applying the changes they went
+        through rather than being loaded from scratch. Cached trees are
+        modified in place. When a cache is used, trees whose metadata changed
+        are considered changed as well, and entries for roots that don't
+        exist anymore are removed.
+        :return: dictionary of root_rn -> tree
+        """
         if not root_map:
             return {}
-        return dict((
-            x.root_rn,
-            self.tree_klass.from_string(
-                str(x.tree.decode('utf-8')), self.root_key_funct(x.root_rn)))
-            for x in self._find_query(
+        if cache is None:
+            return self._load_trees(context, tree, self._find_query(
                 context, tree, in_={'root_rn': list(root_map.keys())},
                 notin_={'root_full_hash': list(root_map.values())}))
+        if not context.store.supports_sql:
+            # Metadata changes can't be detected, reload everything
+            for root_rn in root_map:
+                cache.pop(root_rn, None)
+            return self._load_trees(context, tree, self._find_query(
+                context, tree, in_={'root_rn': list(root_map.keys())}),
+                cache=cache)
+        db_type = context.store.resource_to_db_type(tree)
+        # Only fetch the tree itself when needed
+        rows = context.store.db_session.query(
+            db_type.root_rn, db_type.root_full_hash, db_type.snapshot_id,
+            db_type.epoch).filter(
+            db_type.root_rn.in_(list(root_map.keys()))).all()
+        for root_rn in set(root_map) - set(x.root_rn for x in rows):
+            cache.pop(root_rn, None)
+        to_load = []
+        to_refresh = {}
+        for row in rows:
+            cached = cache.get(row.root_rn)
+            if not cached:
+                to_load.append(row.root_rn)
+            elif (root_map[row.root_rn] == row.root_full_hash ==
+                    cached.root_full_hash and cached.epoch == row.epoch):
+                # Neither the tree nor its metadata changed. Trees stored
+                # before snapshots were introduced have none until they are
+                # written again.
+                continue
+            elif row.snapshot_id and cached.snapshot_id == row.snapshot_id:
+                to_refresh[row.root_rn] = row
+            else:
+                to_load.append(row.root_rn)
+        result = {}
+        deltas = self._get_deltas(
+            context, tree, dict((x, (cache[x].snapshot_id, cache[x].delta_id))
+                                for x in to_refresh))
+        for root_rn, row in to_refresh.items():
+            cached = cache[root_rn]
+            hash_tree = cached.tree
+            delta_id = cached.delta_id
+            for delta_id, delta in deltas.get(root_rn, []):
+                hash_tree.apply_delta(delta)
+            if hash_tree.root_full_hash != row.root_full_hash:
+                LOG.warning("Cached tree %s is inconsistent, reloading it",
+                            root_rn)
+                to_load.append(root_rn)
+                continue
+            cache[root_rn] = CachedTree(row.snapshot_id, delta_id, row.epoch,
+                                        row.root_full_hash, hash_tree)
+            result[root_rn] = hash_tree
+        if to_load:
+            result.update(self._load_trees(
+                context, tree, self._find_query(
+                    context, tree, in_={'root_rn': to_load}), cache=cache))
+        return result
 
     @utils.log
     def get_roots(self, context):
@@ -208,13 +294,14 @@ class TreeManager(object):
                                    lock_update=True)
             if obj:
                 if if_empty:
-                    tree = self.tree_klass.from_string(
-                        str(obj[0].tree.decode('utf-8')),
-                        self.root_key_funct(root_rn))
+                    tree = self._load_trees(context, tree_type, obj)[root_rn]
                     if tree.root:
                         # Raise a error to rollback any ongoing transaction
                         raise exc.HashTreeNotEmpty(root_rn=root_rn)
                 context.store.delete(obj[0])
+                if tree_type in SUPPORTED_TREES:
+                    self._delete_deltas(context, tree_type=tree_type,
+                                        root_rns=[root_rn])
 
     def _create_if_not_exist(self, context, tree_type, root_rn, **kwargs):
         with context.store.begin(subtransactions=True):
@@ -224,6 +311,114 @@ class TreeManager(object):
                 db_obj = context.store.make_db_obj(resource)
                 context.store.add(db_obj)
 
+    def _load_trees(self, context, tree_type, db_objs, cache=None):
+        # Rebuild the trees from their snapshot and subsequent deltas
+        result = {}
+        snapshots = {}
+        epochs = {}
+        hashes = {}
+        for db_obj in db_objs:
+            result[db_obj.root_rn] = self._deserialize_tree(db_obj.tree,
+                                                            db_obj.root_rn)
+            snapshots[db_obj.root_rn] = (db_obj.snapshot_id, 0)
+            epochs[db_obj.root_rn] = getattr(db_obj, 'epoch', None)
+            hashes[db_obj.root_rn] = db_obj.root_full_hash
+        deltas = self._get_deltas(context, tree_type, snapshots)
+        for root_rn, hash_tree in result.items():
+            last_delta_id = 0
+            for delta_id, delta in deltas.get(root_rn, []):
+                hash_tree.apply_delta(delta)
+                last_delta_id = delta_id
+            if cache is not None:
+                cache[root_rn] = CachedTree(
+                    snapshots[root_rn][0], last_delta_id, epochs[root_rn],
+                    hashes[root_rn], hash_tree)
+        return result
+
+    def _get_deltas(self, context, tree_type, snapshots):
+        """Get the deltas to apply on top of a set of tree snapshots.
+
+        :param snapshots: dictionary of root_rn -> (snapshot_id, delta_id),
+        only deltas following delta_id are returned
+        :return: dictionary of root_rn -> list of (delta_id, delta)
+        """
+        by_snapshot = dict((v[0], (k, v[1])) for k, v in snapshots.items()
+                           if v[0])
+        if not by_snapshot or not context.store.supports_sql:
+            return {}
+        result = {}
+        query = context.store.db_session.query(tree_model.TreeDelta).filter(
+            tree_model.TreeDelta.tree_type == tree_type.__name__,
+            tree_model.TreeDelta.snapshot_id.in_(list(by_snapshot.keys())))
+        for db_obj in query.order_by(tree_model.TreeDelta.id):
+            root_rn, after = by_snapshot[db_obj.snapshot_id]
+            if db_obj.id > after:
+                result.setdefault(root_rn, []).append(
+                    (db_obj.id, utils.json_loads(db_obj.delta)))
+        return result
+
+    def _add_delta(self, context, tree_type, db_obj, hash_tree):
+        # Store the changes of a journaled tree incrementally, returns False
+        # when the whole tree should be written instead
+        max_deltas = aim_cfg.CONF.aim.hashtree_max_deltas
+        if (max_deltas <= 0 or not hash_tree.journaled or
+                not db_obj.snapshot_id or not context.store.supports_sql):
+            return False
+        delta = hash_tree.get_delta()
+        if len(delta) > MAX_DELTA_NODES:
+            return False
+        if delta:
+            db_session = context.store.db_session
+            count = db_session.query(tree_model.TreeDelta).filter(
+                tree_model.TreeDelta.snapshot_id == db_obj.snapshot_id).count()
+            if count >= max_deltas:
+                # Time to merge all the deltas into the tree
+                return False
+            db_session.add(tree_model.TreeDelta(
+                root_rn=db_obj.root_rn, tree_type=tree_type.__name__,
+                snapshot_id=db_obj.snapshot_id,
+                delta=utils.json_dumps(delta)))
+        hash_tree.start_journal()
+        return True
+
+    def _set_snapshot(self, context, tree_type, db_obj, hash_tree):
+        db_obj.tree = self._serialize_tree(context, hash_tree)
+        # A new snapshot ID invalidates the deltas and every cached copy
+        db_obj.snapshot_id = utils.generate_uuid()
+        self._delete_deltas(context, tree_type=tree_type,
+                            root_rns=[db_obj.root_rn])
+        if hash_tree.journaled:
+            hash_tree.start_journal()
+
+    def _delete_deltas(self, context, tree_type=None, root_rns=None):
+        if not context.store.supports_sql:
+            return
+        query = context.store.db_session.query(tree_model.TreeDelta)
+        if tree_type:
+            query = query.filter(
+                tree_model.TreeDelta.tree_type == tree_type.__name__)
+        if root_rns is not None:
+            query = query.filter(tree_model.TreeDelta.root_rn.in_(root_rns))
+        query.delete(synchronize_session=False)
+
+    def _serialize_tree(self, context, hash_tree):
+        # Binary data can only be persisted in the SQL store
+        if (aim_cfg.CONF.aim.hashtree_db_format == TREE_FORMAT_BINARY and
+                context.store.supports_sql):
+            return codec.dumps(
+                hash_tree,
+                compression=aim_cfg.CONF.aim.hashtree_db_compression)
+        return str(hash_tree).encode('utf-8')
+
+    def _deserialize_tree(self, data, root_rn):
+        # Trees are read back in whatever format they were stored, so that
+        # the format can be changed on a live system
+        if codec.is_encoded(data):
+            return codec.loads(data, root_key=self.root_key_funct(root_rn),
+                               tree_klass=self.tree_klass)
+        return self.tree_klass.from_string(str(data.decode('utf-8')),
+                                           self.root_key_funct(root_rn))
+
     def _find_query(self, context, tree_type, in_=None, notin_=None,
                     lock_update=False, **kwargs):
         db_type = context.store.resource_to_db_type(tree_type)
@@ -278,14 +473,12 @@ class AimHashTreeMaker(object):
 
     @staticmethod
     def _dn_to_key(mo_type, dn):
-        type_and_dn = utils.decompose_dn(mo_type, dn)
-        return tuple([str('|'.join(x))
-                      for x in type_and_dn]) if type_and_dn else None
+        return utils.dn_to_key(mo_type, dn)
 
     @staticmethod
     def _extract_root_rn(root_key):
         root_split = root_key[0].split('|')
-        return apic_client.DNManager().build([root_split]).split('/')[-1]
+        return utils.build_dn([root_split]).split('/')[-1]
 
     @staticmethod
     def _extract_root_from_dn(dn):
@@ -345,8 +538,8 @@ class AimHashTreeMaker(object):
         to_update = {}
         for aim_res in updates:
             to_update.update(self._prepare_aim_resource(tree, aim_res))
-        for k, v in to_update.items():
-            tree.add(k, **v)
+        # Hashes are calculated once for the whole batch
+        tree.include(dict(v, key=k) for k, v in to_update.items())
         return tree
 
     def delete(self, tree, deletes):
@@ -408,7 +601,7 @@ class AimHashTreeMaker(object):
         """
         splits = key.split('-', 1)
         mo = apic_client.ManagedObjectClass.prefix_to_mos[splits[0]]
-        dn = apic_client.DNManager().build([[mo, splits[-1]]])
+        dn = utils.build_dn([[mo, splits[-1]]])
         return AimHashTreeMaker._build_hash_tree_key_from_dn(dn, mo)
 
 
@@ -438,21 +631,26 @@ class HashTreeBuilder(object):
         eg: {'config': {'tn1': <root hashtree>}}
         :return: tree updates
         """
-        LOG.debug('Builder called with %s %s %s' % (added, updated, deleted))
+        LOG.debug('Builder called with %s %s %s', added, updated, deleted)
         # Segregate updates by root
         updates_by_root = {}
         all_updates = [added, updated, deleted]
         conf = CONFIG_TREE
         monitor = MONITORED_TREE
         oper = OPERATIONAL_TREE
+        parents = {}
+        if aim_ctx:
+            parents = self._get_status_parents(
+                aim_ctx, [x for x in added + updated + deleted
+                          if isinstance(x, aim_status.AciStatus)])
         for idx in range(len(all_updates)):
             # tree_index == 0 -> ADD
             # tree_inder == 1 -> DELETE
             tree_index = 0 if idx < 2 else 1
             for res in all_updates[idx]:
                 if isinstance(res, aim_status.AciStatus) and aim_ctx:
-                    parent = self.aim_manager.get_by_id(
-                        aim_ctx, res.parent_class, res.resource_id)
+                    parent = parents.get(res.parent_class, {}).get(
+                        res.resource_id)
                     # Remove main object from config tree if in sync error
                     # during an update
                     if parent and parent.root == res.resource_root:
@@ -547,3 +745,12 @@ class HashTreeBuilder(object):
             if ttree_monitor.root_key:
                 udp_mon_trees.append(ttree_monitor)
         return upd_trees, udp_op_trees, udp_mon_trees
+
+    def _get_status_parents(self, aim_ctx, statuses):
+        # One query per parent type rather than one per status
+        ids_by_class = {}
+        for status in statuses:
+            ids_by_class.setdefault(status.parent_class, []).append(
+                status.resource_id)
+        return dict((klass, self.aim_manager.get_by_ids(aim_ctx, klass, ids))
+                    for klass, ids in ids_by_class.items())